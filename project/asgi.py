@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once django is set up
+from wavepool.live import with_events  # noqa: E402
+
+# the front page's event stream is served alongside django rather than through it
+application = with_events(django_application)
@@ -10,8 +10,16 @@ from wavepool import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.front_page, name='home'),
+    path('archive/', views.archive, name='archive'),
+    path('tags/<slug:slug>/', views.tag_archive, name='tag_archive'),
+    path('search/', views.search_newsposts, name='search'),
+    path('feeds/<str:feed_format>/', views.feed, name='feed'),
+    path('feeds/<slug:divesite>/<str:feed_format>/', views.feed, name='divesite_feed'),
     path('instructions/', views.instructions, name='instructions'),
-    path('news/', views.newspost_detail, name='newspost_detail')
+    path('news/<int:newspost_id>/', views.newspost_detail, name='newspost_detail'),
+    path('page-cache/stats/', views.page_cache_stats, name='page_cache_stats'),
+    path('metrics/', views.request_metrics, name='request_metrics'),
 ]
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -26,11 +26,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'wavepool'
+    'wavepool.apps.WavepoolConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'wavepool.middleware.RequestMetricsMiddleware',
+    'wavepool.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -41,9 +43,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'project.urls'
 
+# reads only go to replicas once WAVEPOOL_REPLICAS lists some, as settings.replicas does
+DATABASE_ROUTERS = ['wavepool.routers.ReplicaRouter']
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # django's backend, timing renders for wavepool.metrics
+        'BACKEND': 'wavepool.backends.templates.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -65,12 +71,26 @@ WSGI_APPLICATION = 'project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'wavepool.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # the teaser fragments {% cache %} keeps; only cached in production, so that template edits show up straight away
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -110,6 +130,17 @@ USE_TZ = True
 STATIC_ROOT = 'static/'
 STATIC_URL = '/static/'
 
+# uploaded advertisement logos
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = '/media/'
+
+# static images shown at a fixed width, by CSS pixels; collectstatic with the production storage writes copies resized
+# to each pixel density, see wavepool.staticfiles
+WAVEPOOL_RESPONSIVE_IMAGES = {
+    'image/dive-logo.png': 30,
+    'image/fastbanana.png': 200,
+}
+
 FIXTURE_DIRS = [os.path.join(BASE_DIR, 'fixtures'), ]
 
 SENIOR_USER = False
@@ -0,0 +1,82 @@
+""" Settings for serving wavepool from its SQLite database file
+
+Run with DJANGO_SETTINGS_MODULE=settings.production. The secret key and allowed hosts are read from the environment.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from settings import *  # NOQA
+from settings import BASE_DIR, CACHES, DATABASES, MIDDLEWARE, TEMPLATES
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('WAVEPOOL_ALLOWED_HOSTS', 'localhost').split(',')
+# the development key is in the repository, so sessions signed with it could be forged by anyone
+try:
+    SECRET_KEY = os.environ['WAVEPOOL_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Set WAVEPOOL_SECRET_KEY in the environment to run with settings.production')
+
+DATABASES = {
+    'default': {
+        **DATABASES['default'],
+        # each server thread keeps its connection between requests instead of opening one per request
+        'CONN_MAX_AGE': 600,
+    },
+}
+
+MIDDLEWARE = [
+    MIDDLEWARE[0],
+    # static files are answered before the session, CSRF and auth middleware would run for them
+    'wavepool.staticfiles.StaticFilesMiddleware',
+    *MIDDLEWARE[1:],
+]
+
+TEMPLATES = [{
+    **TEMPLATES[0],
+    # an explicit list of loaders replaces APP_DIRS
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        # each template is read and compiled once per process
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+CACHES = {
+    **CACHES,
+    # a teaser fragment is keyed on its newspost's modified_at, so an edited newspost gets a new fragment and the
+    # old one is culled once the cache is full, least recently used first
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# `python manage.py collectstatic` writes hashed, compressed and resized static files to STATIC_ROOT, which
+# StaticFilesMiddleware serves
+STATIC_ROOT = BASE_DIR / 'static'
+STATICFILES_STORAGE = 'wavepool.staticfiles.CompressedManifestStaticFilesStorage'
+
+# applied to every new connection, in this order
+WAVEPOOL_SQLITE_PRAGMAS = {
+    # wait up to 5s for another connection to release the write lock before failing
+    'busy_timeout': 5000,
+    # readers read a snapshot and are not blocked by a writer, nor a writer by readers
+    'journal_mode': 'WAL',
+    # in WAL mode only checkpoints wait on fsync; a power cut can lose the last commits but not corrupt the file
+    'synchronous': 'NORMAL',
+    # page cache of 64MB per connection; negative sizes are in KiB
+    'cache_size': -64000,
+    # read up to 256MB of the file through a memory map instead of read() calls
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'MEMORY',
+}
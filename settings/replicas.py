@@ -0,0 +1,20 @@
+""" Settings for running locally with a read replica
+
+The replica is a second SQLite file, db.replica.sqlite3, kept up to date by `python manage.py replicate_sqlite`.
+Run it once after migrating, and again, or with --interval, to bring the replica up to date after writes.
+The tests run with the default settings and set up replicas of their own.
+"""
+from settings import *  # NOQA
+from settings import BASE_DIR, DATABASES
+
+DATABASES = {
+    'default': DATABASES['default'],
+    'replica': {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
+}
+
+WAVEPOOL_REPLICAS = ['replica']
+# how long a client that has written keeps reading from the default database
+WAVEPOOL_PIN_SECONDS = 10
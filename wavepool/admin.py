@@ -1,15 +1,159 @@
+import datetime
+
 from django import forms
+from django.conf import settings
 from django.contrib import admin
-from wavepool.models import NewsPost
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from wavepool import pagination
+from wavepool.models import Advertisement, NewsPost, Tag
+from wavepool.transactions import write_transaction
 
 
 class NewsPostForm(forms.ModelForm):
-    model = NewsPost
-    fields = '__all__'
+
+    class Meta:
+        model = NewsPost
+        fields = '__all__'
+
+
+class CappedCountPaginator(Paginator):
+    """ Paginator that stops counting at `max_count` objects, so a page of a large table does not cost a count of
+        the whole table
+    """
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.max_count].count()
+
+    @property
+    def count_is_capped(self):
+        return self.count >= self.max_count
+
+
+# periods the date hierarchy seeks for, rather than leaving them to django's own queries
+PERIOD_KINDS = ('year', 'month', 'day')
+
+
+class IndexSeekQuerySet(models.QuerySet):
+    """ Queryset answering the date hierarchy's queries with seeks into the recency index rather than scans of it
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite reads a lone MIN or MAX off the end of an index, but scans the whole index for the two together
+        if args or len(kwargs) < 2 or not all(isinstance(value, (models.Min, models.Max)) for value in kwargs.values()):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for alias, aggregate in kwargs.items():
+            result.update(super().aggregate(**{alias: aggregate}))
+        return result
+
+    def dates(self, field_name, kind, order='ASC'):
+        """ Return the first day of each year, month or day that has a `field_name` date, as a list
+            Each period is found by seeking to the earliest date after the previous one, so the cost depends on the
+            number of periods rather than the number of rows.
+        """
+        if kind not in PERIOD_KINDS or isinstance(self.model._meta.get_field(field_name), models.DateTimeField):
+            return super().dates(field_name, kind, order)
+        return self._periods(field_name, kind, order, lambda date: date, lambda date: date)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=None):
+        """ Return the start of each year, month or day that has a `field_name` time in `tzinfo`, by default the
+            current time zone, as a list
+            The periods are found with seeks, as dates() finds them.
+        """
+        if kind not in PERIOD_KINDS:
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        if settings.USE_TZ and tzinfo is None:
+            tzinfo = timezone.get_current_timezone()
+
+        def to_date(value):
+            return value.date() if tzinfo is None else timezone.localtime(value, tzinfo).date()
+
+        def midnight(date):
+            value = datetime.datetime.combine(date, datetime.time())
+            return value if tzinfo is None else timezone.make_aware(value, tzinfo, is_dst)
+
+        return self._periods(field_name, kind, order, to_date, midnight)
+
+    def _periods(self, field_name, kind, order, to_date, from_date):
+        # to_date turns a `field_name` value into its date, and from_date turns the start of a period back into one
+        periods = []
+        value = self._first_date(field_name)
+        while value is not None:
+            date = to_date(value)
+            if kind == 'year':
+                period, next_period = date.replace(month=1, day=1), date.replace(year=date.year + 1, month=1, day=1)
+            elif kind == 'month':
+                period = date.replace(day=1)
+                next_period = (period + datetime.timedelta(days=31)).replace(day=1)
+            else:
+                period, next_period = date, date + datetime.timedelta(days=1)
+            periods.append(from_date(period))
+            value = self._first_date(field_name, from_date(next_period))
+        return periods if order == 'ASC' else periods[::-1]
+
+    def _first_date(self, field_name, start=None):
+        queryset = self
+        if start is not None:
+            # SQLite seeks on the first lower bound in the WHERE clause, which would otherwise be a wider one the
+            # changelist's own filters put there
+            queryset = self.model._default_manager.filter(**{'{}__gte'.format(field_name): start}) & self
+        return queryset.order_by(field_name).values_list(field_name, flat=True).first()
+
+
+class NewsPostChangeList(ChangeList):
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).only(*NewsPostAdmin.changelist_fields)
+        return IndexSeekQuerySet(queryset.model, queryset.query, queryset.db)
 
 
 class NewsPostAdmin(admin.ModelAdmin):
     form = NewsPostForm
+    filter_horizontal = ('tags', )
+    list_display = ('title', 'divesite', 'is_cover_story', 'publish_date')
+    # sorting on any other column would sort the whole table for every page
+    sortable_by = ('publish_date', )
+    ordering = pagination.RECENCY_ORDER
+    date_hierarchy = 'publish_date'
+    list_per_page = 50
+    show_full_result_count = False
+    paginator = CappedCountPaginator
+
+    # the changelist only loads the columns it shows, leaving the bodies in the database
+    changelist_fields = ('id', 'title', 'divesite', 'is_cover_story', 'publish_date')
+
+    def get_changelist(self, request, **kwargs):
+        return NewsPostChangeList
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if request.method != 'POST':
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        # the form reads the newspost before saving it, so the write lock is taken first for the save to go through
+        # when another editor commits in between
+        with write_transaction():
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name', )}
+    search_fields = ('name', )
+
+
+class AdvertisementAdmin(admin.ModelAdmin):
+    list_display = ('text', 'url', 'impressions')
+    readonly_fields = ('impressions', )
+    # newsposts are picked by id, since a select listing them all would load the whole table
+    raw_id_fields = ('newsposts', )
 
 
 admin.site.register(NewsPost, NewsPostAdmin)
+admin.site.register(Tag, TagAdmin)
+admin.site.register(Advertisement, AdvertisementAdmin)
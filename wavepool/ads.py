@@ -0,0 +1,142 @@
+""" Advertisements shown on newspost pages
+
+Which advertisement a newspost page shows is looked up in an index of newspost id to advertisement, built from the
+placements in one query and kept in memory until an advertisement or its placements change, so rendering a newspost
+page makes no query for its sponsorship. A newspost with several advertisements placed on it shows the most recently
+created one, and a newspost with none shows the house ad.
+
+Advertisements changed by another process are noticed at most every layout.CHANGE_CHECK_SECONDS, by comparing the
+latest modified_at and the number of advertisements with those the index was built from. Placing an advertisement or
+taking it off a newspost marks it as modified, and advertisements are few, so counting them, which is what moves when
+one is deleted, is cheap.
+
+Impressions are counted in a BufferedCounter and added to the advertisements' totals in batches, once FLUSH_THRESHOLD
+of them are pending or the oldest has waited FLUSH_SECONDS, and when the process exits.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.db import models
+
+from wavepool import layout
+from wavepool.counters import BufferedCounter
+from wavepool.models import Advertisement
+from wavepool.routers import primary_reads
+
+FLUSH_THRESHOLD = 1000
+FLUSH_SECONDS = 10
+
+# `advertisements` maps newspost id to advertisement, `last_change` is what last_change() returned as of the build and
+# `checked_at` the time.monotonic() it was last compared with the database
+PlacementIndex = namedtuple('PlacementIndex', ['advertisements', 'last_change', 'checked_at'])
+
+_lock = threading.Lock()
+_index = None
+
+
+def build_index():
+    """ Return a dict of newspost id to the advertisement its page shows
+    """
+    placements = Advertisement.newsposts.through.objects.select_related('advertisement').order_by('advertisement_id')
+    advertisements = {}
+    index = {}
+    # later advertisements replace earlier ones placed on the same newspost
+    for placement in placements:
+        advertisement = advertisements.setdefault(placement.advertisement_id, placement.advertisement)
+        index[placement.newspost_id] = advertisement
+    return index
+
+
+def last_change():
+    """ Return when an advertisement or its placements last changed, with the number of advertisements
+    """
+    change = Advertisement.objects.aggregate(last_modified=models.Max('modified_at'), count=models.Count('id'))
+    return change['last_modified'], change['count']
+
+
+def get_index():
+    """ Return the current placement index, building it if an advertisement has changed since it was last built
+    """
+    global _index
+    index = _index
+    if index is not None and _check_due(index):
+        index = _check_for_changes(index)
+    if index is None:
+        with _lock:
+            index = _index
+            if index is None:
+                # kept until the next change, so built from the default database which changes reach first. The
+                # change is read first, so one made in between is noticed by the next check rather than missed.
+                with primary_reads():
+                    change = last_change()
+                    index = _index = PlacementIndex(build_index(), change, time.monotonic())
+    return index.advertisements
+
+
+async def aget_index():
+    """ get_index for async views, which only leaves the event loop when the index has to be built or checked
+    """
+    index = _index
+    if index is None or _check_due(index):
+        return await sync_to_async(get_index)()
+    return index.advertisements
+
+
+def _check_due(index):
+    return time.monotonic() - index.checked_at >= layout.CHANGE_CHECK_SECONDS
+
+
+def _check_for_changes(index):
+    """ Return `index` if no advertisement has changed since it was built, otherwise drop it and return None
+    """
+    global _index
+    with _lock:
+        if _index is not index:
+            return _index
+        with primary_reads():
+            changed = last_change() != index.last_change
+        _index = None if changed else index._replace(checked_at=time.monotonic())
+    return _index
+
+
+def invalidate():
+    """ Drop the placement index so the next newspost page rebuilds it
+    """
+    global _index
+    with _lock:
+        _index = None
+
+
+def advertisement_for(newspost_id):
+    """ Return the advertisement shown on the page of newspost `newspost_id`, or None for the house ad
+    """
+    return get_index().get(newspost_id)
+
+
+def add_impressions(counts):
+    """ Add `counts` of impressions per advertisement id to the advertisements' totals, with one update per distinct
+        number of impressions
+    """
+    advertisements_by_count = defaultdict(list)
+    for advertisement_id, count in counts.items():
+        advertisements_by_count[count].append(advertisement_id)
+    for count, advertisement_ids in advertisements_by_count.items():
+        Advertisement.objects.filter(pk__in=advertisement_ids).update(impressions=models.F('impressions') + count)
+
+
+impressions = BufferedCounter(add_impressions, FLUSH_THRESHOLD, FLUSH_SECONDS)
+
+
+def record_impression(newspost_id, index):
+    """ Count an impression of the advertisement that `index` shows on the page of newspost `newspost_id`, if any
+    """
+    advertisement = index.get(newspost_id)
+    if advertisement is not None:
+        impressions.record(advertisement.pk)
+
+
+# impressions still pending when the process exits are written rather than lost
+atexit.register(impressions.flush)
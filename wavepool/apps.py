@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WavepoolConfig(AppConfig):
     name = 'wavepool'
+
+    def ready(self):
+        from wavepool import signals  # NOQA
@@ -0,0 +1,16 @@
+""" SQLite backend that can begin a transaction holding the write lock
+
+SQLite starts a plain BEGIN as a read transaction and only asks for the write lock at the first write. In WAL mode,
+a read transaction that another connection has written past since it began cannot be upgraded. SQLite then fails
+the write straight away with "database is locked" rather than waiting on the busy timeout. Transactions that are
+going to write are begun with BEGIN IMMEDIATE instead, through wavepool.transactions.write_transaction.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # set by write_transaction for the outermost atomic block it opens
+    begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,27 @@
+""" Django template backend that times renders
+
+Each render of a template loaded through this backend adds to the template render time of the request it is part of,
+see wavepool.metrics. Templates included by another are rendered as part of it and not counted twice.
+"""
+from django.template.backends import django
+
+from wavepool import metrics
+
+
+class Template(django.Template):
+
+    def render(self, context=None, request=None):
+        with metrics.timing_render():
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except django.TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
@@ -0,0 +1,843 @@
+""" Benchmarks run through `python manage.py benchmark <name>`
+
+Each benchmark runs against a throwaway database created the same way the test runner creates one, fills it with
+synthetic newsposts and returns a list of result rows for the command to print.
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from wavepool import cache, generating, importing, layout, live, pagination, search
+from wavepool.generating import TOPICS, make_newsposts
+from wavepool.models import NewsPost
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """ Create an empty, fully migrated database for the duration of the block and destroy it afterwards
+    """
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+@contextmanager
+def sqlite_file_database(directory, alias=DEFAULT_DB_ALIAS, **overrides):
+    """ Point connections to `alias` opened inside the block at a new SQLite file in `directory`, with `overrides`
+        applied to the database settings
+        An alias that is not configured is added for the block, with the default database's settings. Connections
+        belong to threads and the calling thread keeps the ones it has, so work on the file has to be done in new
+        threads, with run_threads.
+    """
+    # connections are created from these dicts, which the test database setup has already pointed elsewhere
+    added = alias not in connections.databases
+    if added:
+        connections.databases[alias] = dict(connections.databases[DEFAULT_DB_ALIAS])
+    settings_dict = connections.databases[alias]
+    saved = {key: settings_dict[key] for key in ['NAME', *overrides]}
+    settings_dict.update(overrides, NAME=os.path.join(directory, '{}.sqlite3'.format(alias)))
+    try:
+        yield
+    finally:
+        if added:
+            del connections.databases[alias]
+        else:
+            settings_dict.update(saved)
+
+
+def production_settings():
+    """ Return the settings.production module, whose settings the benchmarks set up for themselves
+        Nothing is signed while benchmarking, so the module is imported with a placeholder secret key if none is set.
+    """
+    if 'WAVEPOOL_SECRET_KEY' in os.environ:
+        from settings import production
+        return production
+    os.environ['WAVEPOOL_SECRET_KEY'] = 'benchmark'
+    try:
+        from settings import production
+    finally:
+        del os.environ['WAVEPOOL_SECRET_KEY']
+    return production
+
+
+def run_threads(targets):
+    """ Call each of `targets` in a thread of its own and wait for them all, re-raising the first error raised
+    """
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=[target]) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def populate(count, batch_size=5000):
+    """ Top the newspost table up to `count` rows of synthetic newsposts
+    """
+    existing = NewsPost.objects.count()
+    if existing < count:
+        for _ in generating.generate(count - existing, batch_size=batch_size):
+            pass
+
+
+def percentile(timings, fraction):
+    """ Return the value below which `fraction` of the sorted `timings` fall
+    """
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def time_calls(func, repeat):
+    """ Call `func` `repeat` times and return (median ms, p95 ms, queries per call)
+    """
+    timings = []
+    # the query log holds at most 9000 queries and counting stops working once it is full
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), percentile(timings, 0.95), len(queries) / repeat
+
+
+def _legacy_front_page_queries():
+    # the three ORDER BY RANDOM() queries the front page view used to run on every request
+    NewsPost.objects.all().order_by('?').first()
+    list(NewsPost.objects.all().order_by('?')[:3])
+    list(NewsPost.objects.all().order_by('?'))
+
+
+@benchmark('frontpage')
+def bench_front_page(sizes, repeat):
+    """ Per-request query count and latency of the front page at each table size
+    """
+    from wavepool import views
+
+    front_page = async_to_sync(views.front_page)
+    request = RequestFactory().get('/')
+    rows = []
+    for size in sizes:
+        populate(size)
+        legacy_median, _, legacy_queries = time_calls(_legacy_front_page_queries, max(1, repeat // 10))
+
+        layout.invalidate()
+        rebuild_median, _, rebuild_queries = time_calls(layout.get_layout, 1)
+        warm_median, warm_p95, warm_queries = time_calls(lambda: front_page(request), repeat)
+        rows.append({
+            'posts': size,
+            'legacy_queries': legacy_queries,
+            'legacy_query_ms': round(legacy_median, 2),
+            'rebuild_queries': rebuild_queries,
+            'rebuild_ms': round(rebuild_median, 2),
+            'request_queries': warm_queries,
+            'request_ms': round(warm_median, 2),
+            'request_p95_ms': round(warm_p95, 2),
+        })
+    return rows
+
+
+@benchmark('templates')
+def bench_templates(sizes, repeat):
+    """ Latency of a front page request whose layout is already built, with templates loaded as in development, with
+        the cached loader, and with the cached loader and teaser fragments as settings.production sets them up, and
+        of the first request after one top story is edited
+    """
+    from django.conf import settings
+
+    from wavepool import views
+
+    production = production_settings()
+    front_page = async_to_sync(views.front_page)
+    request = RequestFactory().get('/')
+    development_templates = [{
+        **settings.TEMPLATES[0], 'OPTIONS': {**settings.TEMPLATES[0]['OPTIONS'], 'debug': True},
+    }]
+    profiles = {
+        'development': (development_templates, settings.CACHES),
+        'cached_loader': (production.TEMPLATES, settings.CACHES),
+        'production': (production.TEMPLATES, production.CACHES),
+    }
+    rows = []
+    for size in sizes:
+        populate(size)
+        for profile, (templates, caches) in profiles.items():
+            with override_settings(TEMPLATES=templates, CACHES=caches, DEBUG=False):
+                layout.invalidate()
+                front_page(request)
+                median, p95, _ = time_calls(lambda: front_page(request), repeat)
+
+                top_story = layout.get_layout().top_stories[0]
+                top_story.save()
+                layout.get_layout()
+                edited_ms, _, _ = time_calls(lambda: front_page(request), 1)
+            rows.append({
+                'posts': size,
+                'profile': profile,
+                'request_ms': round(median, 2),
+                'request_p95_ms': round(p95, 2),
+                'after_edit_ms': round(edited_ms, 2),
+            })
+    return rows
+
+
+@benchmark('archive')
+def bench_archive(sizes, repeat):
+    """ Latency of the first archive page against one at the very end of the archive, compared with OFFSET paging
+    """
+    from wavepool.views import archive
+
+    rows = []
+    for size in sizes:
+        populate(size)
+        layout.invalidate()
+        first_cursor = layout.get_layout().archive_cursor
+        deep_offset = max(size - layout.ARCHIVE_PAGE_SIZE * 2, 0)
+        deep_newspost = NewsPost.objects.order_by(*pagination.RECENCY_ORDER)[deep_offset]
+        first_request = RequestFactory().get('/archive/', {'after': first_cursor})
+        deep_request = RequestFactory().get('/archive/', {'after': pagination.encode_cursor(deep_newspost)})
+
+        def offset_page():
+            newsposts = NewsPost.objects.order_by(*pagination.RECENCY_ORDER)
+            list(newsposts[deep_offset:deep_offset + layout.ARCHIVE_PAGE_SIZE])
+
+        first_median, _, _ = time_calls(lambda: archive(first_request), repeat)
+        deep_median, deep_p95, deep_queries = time_calls(lambda: archive(deep_request), repeat)
+        offset_median, _, _ = time_calls(offset_page, repeat)
+        rows.append({
+            'posts': size,
+            'first_page_ms': round(first_median, 2),
+            'deep_page_ms': round(deep_median, 2),
+            'deep_page_p95_ms': round(deep_p95, 2),
+            'queries_per_page': deep_queries,
+            'offset_deep_page_ms': round(offset_median, 2),
+        })
+    return rows
+
+
+@benchmark('detail')
+def bench_detail(sizes, repeat):
+    """ Latency of a newspost page rendered from scratch against one served from the page cache
+    """
+    from wavepool import views
+
+    newspost_detail = async_to_sync(views.newspost_detail)
+    rows = []
+    for size in sizes:
+        populate(size)
+        newspost_ids = list(NewsPost.objects.order_by('?').values_list('pk', flat=True)[:repeat])
+        requests = []
+        for newspost_id in newspost_ids:
+            request = RequestFactory().get('/news/{}/'.format(newspost_id))
+            request.user = AnonymousUser()
+            requests.append((request, newspost_id))
+
+        page_cache = cache.get_page_cache()
+        page_cache.clear()
+        pending = iter(requests)
+        cold_median, cold_p95, cold_queries = time_calls(lambda: newspost_detail(*next(pending)), len(requests))
+        pending = iter(requests)
+        warm_median, warm_p95, warm_queries = time_calls(lambda: newspost_detail(*next(pending)), len(requests))
+        rows.append({
+            'posts': size,
+            'cold_ms': round(cold_median, 3),
+            'cold_p95_ms': round(cold_p95, 3),
+            'cold_queries': cold_queries,
+            'warm_ms': round(warm_median, 3),
+            'warm_p95_ms': round(warm_p95, 3),
+            'warm_queries': warm_queries,
+        })
+    return rows
+
+
+@benchmark('search')
+def bench_search(sizes, repeat):
+    """ Latency of full text search against an icontains (LIKE) scan of titles and bodies, for a common, a rare and a
+        missing word
+    """
+    rows = []
+    for size in sizes:
+        populate(size)
+        search.rebuild()
+        for word in (TOPICS[0], TOPICS[-1], 'zeppelin'):
+            def like_search():
+                newsposts = NewsPost.objects.filter(Q(title__icontains=word) | Q(body__icontains=word))
+                list(newsposts.order_by(*pagination.RECENCY_ORDER)[:20])
+
+            fts_median, fts_p95, _ = time_calls(lambda: search.search(word), repeat)
+            like_median, like_p95, _ = time_calls(like_search, repeat)
+            rows.append({
+                'posts': size,
+                'word': word,
+                'matches': NewsPost.objects.filter(title__icontains=word).count(),
+                'fts_ms': round(fts_median, 2),
+                'fts_p95_ms': round(fts_p95, 2),
+                'like_ms': round(like_median, 2),
+                'like_p95_ms': round(like_p95, 2),
+            })
+    return rows
+
+
+@benchmark('import')
+def bench_import(sizes, repeat):
+    """ Throughput of importing a JSON Lines file of new newsposts and of importing it again as updates, and the
+        peak memory the Python side of the update pass allocates
+    """
+    rows = []
+    for size in sizes:
+        NewsPost.objects.all().delete()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'newsposts.jsonl')
+            with open(path, 'w', encoding='utf-8') as stream:
+                for newspost in make_newsposts(size):
+                    stream.write(json.dumps({
+                        'title': newspost.title, 'body': newspost.body, 'source': newspost.source,
+                        'publish_date': newspost.publish_date.isoformat(),
+                    }) + '\n')
+
+            def import_file():
+                with open(path, encoding='utf-8') as stream:
+                    for _ in importing.import_rows(importing.read_rows(stream)):
+                        pass
+
+            create_ms, _, _ = time_calls(import_file, 1)
+            update_ms, _, _ = time_calls(import_file, 1)
+            # traced separately since tracing slows the import down several times over
+            tracemalloc.start()
+            import_file()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        rows.append({
+            'posts': size,
+            'create_rows_per_s': round(size / create_ms * 1000),
+            'update_rows_per_s': round(size / update_ms * 1000),
+            'peak_traced_mb': round(peak / 2 ** 20, 1),
+        })
+    return rows
+
+
+@benchmark('admin')
+def bench_admin(sizes, repeat):
+    """ Latency of the newspost changelist, and of a year in its date hierarchy, against a default ModelAdmin
+    """
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+
+    user = User.objects.create_superuser('benchmark', 'benchmark@industrydive.com', 'benchmark')
+    default_admin = admin.ModelAdmin(NewsPost, admin.site)
+    newspost_admin = admin.site._registry[NewsPost]
+
+    def changelist(model_admin, params=None):
+        request = RequestFactory().get('/admin/wavepool/newspost/', params)
+        request.user = user
+        model_admin.changelist_view(request).render()
+
+    rows = []
+    for size in sizes:
+        populate(size)
+        year = NewsPost.objects.order_by(*pagination.RECENCY_ORDER).values_list('publish_date', flat=True)[0].year
+        default_median, _, default_queries = time_calls(lambda: changelist(default_admin), max(1, repeat // 4))
+        median, p95, queries = time_calls(lambda: changelist(newspost_admin), repeat)
+        year_median, _, _ = time_calls(lambda: changelist(newspost_admin, {'publish_date__year': year}), repeat)
+        rows.append({
+            'posts': size,
+            'default_ms': round(default_median, 2),
+            'default_queries': default_queries,
+            'changelist_ms': round(median, 2),
+            'changelist_p95_ms': round(p95, 2),
+            'changelist_queries': queries,
+            'year_ms': round(year_median, 2),
+        })
+    return rows
+
+
+@benchmark('sqlite')
+def bench_sqlite(sizes, repeat):
+    """ Reads and admin writes made at the same time from several threads, against an SQLite file set up with
+        django's defaults and with the settings.production profile
+        Each reader makes `repeat` rounds of a front page, archive page and newspost page request while one editor
+        saves newsposts through the admin until the readers are done.
+    """
+    production = production_settings()
+
+    profiles = {
+        'default': ({}, 0),
+        'production': (production.WAVEPOOL_SQLITE_PRAGMAS, production.DATABASES['default']['CONN_MAX_AGE']),
+    }
+    readers = 4
+    rows = []
+    for size in sizes:
+        for profile, (pragmas, conn_max_age) in profiles.items():
+            with tempfile.TemporaryDirectory() as directory, \
+                    sqlite_file_database(directory, CONN_MAX_AGE=conn_max_age), \
+                    override_settings(WAVEPOOL_SQLITE_PRAGMAS=pragmas, DEBUG=False, ALLOWED_HOSTS=['testserver']):
+                keys = []
+
+                def prepare():
+                    call_command('migrate', verbosity=0)
+                    populate(size)
+                    User.objects.create_superuser('benchmark', 'benchmark@industrydive.com', 'benchmark')
+                    keys.extend(NewsPost.objects.values_list('pk', 'publish_date'))
+
+                run_threads([prepare])
+                layout.invalidate()
+                cache.get_page_cache().clear()
+                reads, writes = [], []
+                reading = threading.Event()
+                reading.set()
+
+                def reader(seed):
+                    rng = random.Random(seed)
+                    client = Client()
+                    for _ in range(repeat):
+                        newspost_id, publish_date = rng.choice(keys)
+                        for path, params in [
+                            ('/', None),
+                            ('/archive/', {'after': pagination.format_cursor(publish_date, newspost_id)}),
+                            ('/news/{}/'.format(rng.choice(keys)[0]), None),
+                        ]:
+                            started = time.perf_counter()
+                            response = client.get(path, params)
+                            reads.append((time.perf_counter() - started) * 1000)
+                            assert response.status_code == 200, response.status_code
+
+                def editor():
+                    rng = random.Random(size)
+                    client = Client()
+                    client.force_login(User.objects.get(username='benchmark'))
+                    while reading.is_set():
+                        newspost = NewsPost.objects.get(pk=rng.choice(keys)[0])
+                        started = time.perf_counter()
+                        response = client.post('/admin/wavepool/newspost/{}/change/'.format(newspost.pk), {
+                            'title': newspost.title + '.', 'body': newspost.body, 'source': newspost.source,
+                            'publish_date_0': newspost.publish_date.date(),
+                            'publish_date_1': newspost.publish_date.time(),
+                        })
+                        writes.append((time.perf_counter() - started) * 1000)
+                        assert response.status_code == 302, response.status_code
+
+                def read():
+                    try:
+                        run_threads([lambda seed=seed: reader(seed) for seed in range(readers)])
+                    finally:
+                        reading.clear()
+
+                started = time.perf_counter()
+                run_threads([read, editor])
+                elapsed = time.perf_counter() - started
+            reads.sort()
+            writes.sort()
+            rows.append({
+                'posts': size,
+                'profile': profile,
+                'reads_per_s': round(len(reads) / elapsed),
+                'read_ms': round(statistics.median(reads), 2),
+                'read_p95_ms': round(reads[int(len(reads) * 0.95)], 2),
+                'writes_per_s': round(len(writes) / elapsed, 1),
+                'write_ms': round(statistics.median(writes), 2),
+                'write_p95_ms': round(writes[int(len(writes) * 0.95)], 2),
+            })
+    return rows
+
+
+def wsgi_get(handler, path, headers=()):
+    """ Request `path` from a WSGI `handler` the way a WSGI server would, with the (name, value) pairs `headers`, and
+        return the response status code
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    for name, value in headers:
+        environ['HTTP_{}'.format(name.upper().replace('-', '_'))] = value
+    statuses = []
+    response = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(handler, path, headers=()):
+    """ Request `path` from an ASGI `handler` the way an ASGI server would, with the (name, value) pairs `headers`,
+        and return the response status code
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver'), *((name.lower().encode(), value.encode()) for name, value in headers)],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status']
+
+
+@benchmark('asgi')
+def bench_asgi(sizes, repeat):
+    """ Requests per second and latency of the public site with 500 clients requesting pages at the same time, served
+        by django's WSGI handler from a thread per client and by its ASGI handler from one event loop
+        Each client makes `repeat` requests, cycling through the front page, the instructions and a newspost page.
+        The handlers are called directly rather than through a server, so the figures leave out the network and
+        the server's own overhead.
+    """
+    clients = 500
+    rows = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory, sqlite_file_database(directory), \
+                override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            newspost_ids = []
+
+            def prepare():
+                call_command('migrate', verbosity=0)
+                populate(size)
+                newspost_ids.extend(NewsPost.objects.order_by('?').values_list('pk', flat=True)[:clients])
+
+            run_threads([prepare])
+
+            def paths(client):
+                cycle = ['/', '/instructions/', '/news/{}/'.format(newspost_ids[client % len(newspost_ids)])]
+                return [cycle[number % len(cycle)] for number in range(repeat)]
+
+            def serve_wsgi():
+                handler = WSGIHandler()
+                timings = []
+
+                def client(number):
+                    for path in paths(number):
+                        started = time.perf_counter()
+                        status = wsgi_get(handler, path)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        assert status == 200, status
+
+                run_threads([lambda number=number: client(number) for number in range(clients)])
+                return timings
+
+            def serve_asgi():
+                handler = ASGIHandler()
+                timings = []
+
+                async def client(number):
+                    for path in paths(number):
+                        started = time.perf_counter()
+                        status = await asgi_get(handler, path)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        assert status == 200, status
+
+                async def serve():
+                    try:
+                        await asyncio.gather(*(client(number) for number in range(clients)))
+                    finally:
+                        # the ORM ran in asgiref's thread for thread sensitive code, which keeps its connections
+                        await sync_to_async(connections.close_all)()
+
+                asyncio.run(serve())
+                return timings
+
+            for server, serve in [('wsgi', serve_wsgi), ('asgi', serve_asgi)]:
+                layout.invalidate()
+                cache.get_page_cache().clear()
+                results = []
+                started = time.perf_counter()
+                # the event loop runs in a thread of its own too, leaving the calling thread's test database alone
+                run_threads([lambda: results.extend(serve())])
+                elapsed = time.perf_counter() - started
+                results.sort()
+                rows.append({
+                    'posts': size,
+                    'server': server,
+                    'clients': clients,
+                    'requests_per_s': round(len(results) / elapsed),
+                    'median_ms': round(statistics.median(results), 2),
+                    'p99_ms': round(percentile(results, 0.99), 2),
+                })
+    return rows
+
+
+class EventStreamClient:
+    """ Client end of a streamed ASGI response, which keeps the body chunks it is sent along with when they arrived
+    """
+    __slots__ = ('headers', 'status', 'chunks', '_requested', '_waiter', '_disconnect')
+
+    def __init__(self, headers=()):
+        self.headers = [(b'host', b'testserver')] + [(name.encode(), value.encode()) for name, value in headers]
+        self.status = None
+        self.chunks = deque()
+        self._requested = False
+        self._waiter = None
+        self._disconnect = None
+
+    async def get(self, application, path):
+        """ Request `path` from `application` and return once the response is over
+        """
+        self._disconnect = asyncio.get_running_loop().create_future()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'headers': self.headers,
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        await application(scope, self._receive, self._send)
+
+    async def next_chunk(self):
+        """ Return the next (arrival time, body) chunk, waiting for it if need be
+        """
+        while not self.chunks:
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+        return self.chunks.popleft()
+
+    def disconnect(self):
+        if not self._disconnect.done():
+            self._disconnect.set_result(None)
+
+    async def _receive(self):
+        if not self._requested:
+            self._requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self._disconnect
+        return {'type': 'http.disconnect'}
+
+    async def _send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            return
+        self.chunks.append((time.perf_counter(), message.get('body', b'')))
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+@benchmark('live')
+def bench_live(sizes, repeat):
+    """ Memory held per idle connection to the front page's event stream, and how long a new cover story takes to
+        reach every connection once the newspost is saved
+        `repeat` cover story changes are timed at each number of connections. Memory is what tracemalloc sees
+        allocated while the connections open, so it covers the stream's coroutine and subscription but not the
+        socket and buffers a server would add.
+    """
+    rows = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory, sqlite_file_database(directory), \
+                override_settings(DEBUG=False):
+            newspost_ids = []
+
+            def prepare():
+                call_command('migrate', verbosity=0)
+                populate(size)
+                newspost_ids.extend(NewsPost.objects.order_by('?').values_list('pk', flat=True)[:repeat])
+
+            run_threads([prepare])
+
+            def promote(newspost_id):
+                try:
+                    newspost = NewsPost.objects.get(pk=newspost_id)
+                    newspost.is_cover_story = True
+                    newspost.save()
+                finally:
+                    connections.close_all()
+
+            for count in (1000, 10000):
+                layout.invalidate()
+                results = {}
+
+                async def stream():
+                    loop = asyncio.get_running_loop()
+                    clients = [EventStreamClient() for _ in range(count)]
+                    tracemalloc.start()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                    tasks = [
+                        asyncio.ensure_future(client.get(live.front_page_events, live.EVENTS_PATH))
+                        for client in clients
+                    ]
+                    await asyncio.gather(*(client.next_chunk() for client in clients))
+                    results['bytes_per_connection'] = (tracemalloc.get_traced_memory()[0] - baseline) / count
+                    tracemalloc.stop()
+
+                    latencies, spreads = [], []
+                    for newspost_id in newspost_ids:
+                        started = time.perf_counter()
+                        await loop.run_in_executor(None, promote, newspost_id)
+                        arrivals = []
+                        for client in clients:
+                            # the change arrives as a cover story event, possibly followed by top story and archive ones
+                            arrived, body = await client.next_chunk()
+                            assert b'event: cover_story' in body, body
+                            arrivals.append(arrived)
+                            client.chunks.clear()
+                        arrivals.sort()
+                        latencies.extend((arrived - started) * 1000 for arrived in arrivals)
+                        spreads.append((arrivals[-1] - started) * 1000)
+
+                    for client in clients:
+                        client.disconnect()
+                    await asyncio.gather(*tasks)
+                    # the state was recorded in asgiref's thread for thread sensitive code
+                    await sync_to_async(connections.close_all)()
+                    latencies.sort()
+                    results.update(latencies=latencies, spreads=spreads)
+
+                run_threads([lambda: asyncio.run(stream())])
+                rows.append({
+                    'posts': size,
+                    'connections': count,
+                    'kb_per_connection': round(results['bytes_per_connection'] / 1024, 2),
+                    'delivery_median_ms': round(statistics.median(results['latencies']), 2),
+                    'delivery_p99_ms': round(percentile(results['latencies'], 0.99), 2),
+                    'all_delivered_ms': round(statistics.median(results['spreads']), 2),
+                })
+    return rows
+
+
+def static_assets(content):
+    """ Return the URLs of the stylesheets, scripts, icons and images a page's HTML `content` loads
+        An img is counted by its src, which is what a screen of pixel density 1 loads.
+    """
+    from bs4 import BeautifulSoup
+
+    page_html = BeautifulSoup(content, 'html.parser')
+    urls = [link['href'] for link in page_html.find_all('link', href=True)]
+    urls.extend(tag['src'] for tag in page_html.find_all(['script', 'img'], src=True))
+    return [url for url in urls if url.startswith('/static/')]
+
+
+@benchmark('static')
+def bench_static(sizes, repeat):
+    """ Bytes of static files a first visit to the front page and a newspost page downloads, with files served as in
+        development and as collected and served by settings.production, and requests a repeat visit makes for them
+        In development every file is sent uncompressed and revalidated on each visit. Collected files are sent
+        compressed when the client accepts gzip or brotli, with images resized, and hashed
+        files are not requested again. The table size makes no difference, so only the smallest one is used.
+    """
+    from django.conf import settings
+    from django.contrib.staticfiles import finders
+
+    production = production_settings()
+
+    populate(min(sizes))
+    layout.invalidate()
+    pages = {'front_page': '/', 'newspost': NewsPost.objects.order_by('pk').first().url}
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+        client = Client(HTTP_ACCEPT_ENCODING='br, gzip')
+        development = {}
+        for page, path in pages.items():
+            assets = static_assets(client.get(path).content)
+            development[page] = sum(os.path.getsize(finders.find(url[len(settings.STATIC_URL):])) for url in assets)
+
+        with override_settings(
+            STATIC_ROOT=directory, STATICFILES_STORAGE=production.STATICFILES_STORAGE,
+            MIDDLEWARE=production.MIDDLEWARE,
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            # pages cached in development link to the files' original names
+            cache.get_page_cache().clear()
+            client = Client(HTTP_ACCEPT_ENCODING='br, gzip')
+            for page, path in pages.items():
+                assets = static_assets(client.get(path).content)
+                responses = [client.get(url) for url in assets]
+                assert all(response.status_code == 200 for response in responses), assets
+                served = sum(int(response['Content-Length']) for response in responses)
+                rows.append({
+                    'page': page,
+                    'files': len(assets),
+                    'development_kb': round(development[page] / 1024, 1),
+                    'production_kb': round(served / 1024, 1),
+                    'saved_kb': round((development[page] - served) / 1024, 1),
+                    'saved_percent': round(100 * (development[page] - served) / development[page], 1),
+                    'repeat_visit_requests_development': len(assets),
+                    'repeat_visit_requests_production': sum(
+                        'immutable' not in response['Cache-Control'] for response in responses
+                    ),
+                })
+    return rows
+
+
+@benchmark('metrics')
+def bench_metrics(sizes, repeat):
+    """ Latency of front page and newspost page requests through django's WSGI handler with and without the request
+        metrics of wavepool.metrics
+        Both pages are served from memory after the first request, so the difference is mostly the cost of measuring
+        a request rather than its queries.
+    """
+    from django.conf import settings
+
+    measured_middleware = settings.MIDDLEWARE
+    unmeasured_middleware = [
+        name for name in measured_middleware if name != 'wavepool.middleware.RequestMetricsMiddleware'
+    ]
+    unmeasured_templates = [{**settings.TEMPLATES[0], 'BACKEND': 'django.template.backends.django.DjangoTemplates'}]
+    profiles = {
+        'unmeasured': {'MIDDLEWARE': unmeasured_middleware, 'TEMPLATES': unmeasured_templates},
+        'measured': {'MIDDLEWARE': measured_middleware, 'TEMPLATES': settings.TEMPLATES},
+    }
+    rows = []
+    for size in sizes:
+        populate(size)
+        pages = {'front_page': '/', 'newspost': NewsPost.objects.order_by('pk').first().url}
+        for profile, overrides in profiles.items():
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'], **overrides):
+                handler = WSGIHandler()
+                layout.invalidate()
+                cache.get_page_cache().clear()
+                for page, path in pages.items():
+                    assert wsgi_get(handler, path) == 200
+                    median, p95, _ = time_calls(lambda: wsgi_get(handler, path), repeat)
+                    rows.append({
+                        'posts': size,
+                        'page': page,
+                        'profile': profile,
+                        'request_ms': round(median, 3),
+                        'request_p95_ms': round(p95, 3),
+                    })
+    return rows
@@ -0,0 +1,186 @@
+""" Cache for rendered pages
+
+The backend is chosen with the WAVEPOOL_PAGE_CACHE setting, in the same shape as a CACHES entry:
+
+    WAVEPOOL_PAGE_CACHE = {
+        'BACKEND': 'wavepool.cache.LRUPageCache',
+        'OPTIONS': {'max_entries': 1000},
+    }
+
+LRUPageCache keeps pages in the memory of each process. SharedPageCache stores them in one of the django CACHES
+so that every process serves the same copy.
+
+Async views use aget() and aset(). LRUPageCache answers them on the event loop since it never waits on anything but
+its own short critical sections; other backends run the call in a worker thread.
+"""
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_PAGE_CACHE = {
+    'BACKEND': 'wavepool.cache.LRUPageCache',
+    'OPTIONS': {'max_entries': 1000},
+}
+
+AUTH_STATES = ('public', 'staff')
+
+
+class BasePageCache:
+    """ Hit, miss and eviction counting shared by the page cache backends
+    """
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    async def aget(self, key):
+        # cache servers are waited on in a thread of the default executor rather than the one thread that
+        # thread sensitive code such as the ORM is queued on
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aset(self, key, value):
+        await sync_to_async(self.set, thread_sensitive=False)(key, value)
+
+
+class LRUPageCache(BasePageCache):
+    """ In-process cache holding at most `max_entries` pages, evicting the least recently used page first
+    """
+
+    def __init__(self, max_entries=1000):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                value = None
+            else:
+                self._entries.move_to_end(key)
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        for _ in range(evicted):
+            self._count('evictions')
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(entries=len(self._entries), max_entries=self.max_entries)
+        return stats
+
+
+class SharedPageCache(BasePageCache):
+    """ Page cache stored in the django cache named `alias`
+        The alias should be dedicated to pages since clear() empties it. Evictions are up to the cache server, so
+        they are not counted here.
+    """
+
+    def __init__(self, alias='default', timeout=None, key_prefix='wavepool-page'):
+        super().__init__()
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return '{}:{}'.format(self.key_prefix, key)
+
+    def get(self, key):
+        value = self.cache.get(self._key(key))
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.timeout)
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self._key(key) for key in keys])
+
+    def clear(self):
+        self.cache.clear()
+
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """ Return the page cache configured by WAVEPOOL_PAGE_CACHE, creating it on first use
+    """
+    global _page_cache
+    if _page_cache is None:
+        with _page_cache_lock:
+            if _page_cache is None:
+                config = getattr(settings, 'WAVEPOOL_PAGE_CACHE', DEFAULT_PAGE_CACHE)
+                backend = import_string(config['BACKEND'])
+                _page_cache = backend(**config.get('OPTIONS', {}))
+    return _page_cache
+
+
+@receiver(setting_changed)
+def reset_page_cache(setting, **kwargs):
+    global _page_cache
+    if setting == 'WAVEPOOL_PAGE_CACHE':
+        _page_cache = None
+
+
+def newspost_page_key(newspost_id, auth_state):
+    return 'newspost:{}:{}'.format(newspost_id, auth_state)
+
+
+def invalidate_newspost(newspost_id):
+    """ Drop every cached variant of the detail page for `newspost_id`
+    """
+    get_page_cache().delete_many([newspost_page_key(newspost_id, auth_state) for auth_state in AUTH_STATES])
@@ -0,0 +1,34 @@
+""" HTTP validators for conditional GET
+
+Pages are validated by when their content last changed rather than by hashing the rendered response, so a request
+carrying a matching If-None-Match or If-Modified-Since can be answered with 304 before anything is rendered.
+"""
+import calendar
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def validators(key, last_modified):
+    """ Return a strong ETag and a Last-Modified timestamp for the content identified by `key`
+        `last_modified` is when that content last changed.
+    """
+    etag = quote_etag('{}-{}'.format(key, int(last_modified.timestamp() * 1000000)))
+    return etag, calendar.timegm(last_modified.utctimetuple())
+
+
+def not_modified(request, etag, last_modified):
+    """ Return a 304 response if the request's validators match, otherwise None
+        `last_modified` is None for content with nothing to date it by, which is only validated by its ETag.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,93 @@
+""" Counts kept in memory and written to the database in batches
+
+A BufferedCounter adds up occurrences per key, such as page views per newspost, and hands them to its `write`
+function a batch at a time, so requests do not each queue behind SQLite's single writer to add one to a row. A batch
+is written from a thread of its own once `threshold` occurrences are pending or the oldest of them has waited
+`seconds`, which a timer sees to when no further occurrence comes in to notice it. Each process counts on its own.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+
+from wavepool.transactions import write_transaction
+
+
+class BufferedCounter:
+    """ Occurrences per key not yet written to the database, thread safe
+        `write` is called with a Counter of the pending occurrences, inside a write transaction.
+    """
+
+    def __init__(self, write, threshold, seconds):
+        self.write = write
+        self.threshold = threshold
+        self.seconds = seconds
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._count = 0
+        # when the oldest pending occurrence was recorded
+        self._since = None
+
+    def record(self, key):
+        """ Count an occurrence of `key`, starting a flush once enough occurrences are pending or the oldest of them
+            has waited long enough
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._pending[key] += 1
+            self._count += 1
+            first = self._since is None
+            if first:
+                self._since = now
+            due = self._count >= self.threshold or now - self._since >= self.seconds
+            if due:
+                # the occurrences that made the flush due start no other flush while it runs
+                self._count = 0
+                self._since = None
+        if due:
+            threading.Thread(target=self._flush_in_thread, daemon=True).start()
+        elif first:
+            # flushes the occurrences once they have waited long enough, should no other occurrence come in
+            timer = threading.Timer(self.seconds, self._flush_overdue, args=[now])
+            # pending occurrences do not keep the process from exiting
+            timer.daemon = True
+            timer.start()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self):
+        """ Drop the pending occurrences without writing them
+        """
+        self._take()
+
+    def flush(self):
+        """ Write the pending occurrences
+        """
+        pending = self._take()
+        if pending:
+            with write_transaction():
+                self.write(pending)
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._count = 0
+            self._since = None
+        return pending
+
+    def _flush_overdue(self, since):
+        with self._lock:
+            # occurrences flushed or discarded since the timer started leave nothing for it to do
+            overdue = self._since == since
+        if overdue:
+            self._flush_in_thread()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            # the thread is outside django's request handling, which would otherwise close its connections
+            connections.close_all()
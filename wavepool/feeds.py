@@ -0,0 +1,191 @@
+""" Atom and JSON feeds of the most recent newsposts, of the whole site and of each dive site
+
+A feed lists the FEED_ITEM_COUNT most recent live newsposts, read with a seek down the recency index, or the dive
+site's recency index for a dive site's feed. It is kept in memory as the bytes sent to clients, along with gzip and
+brotli compressed copies, so serving a feed makes no query and compresses nothing. A feed is only built again after
+a newspost it lists or that belongs to it is saved or deleted, a scheduled newspost goes live, or newsposts are found
+to have been changed by another process, which feed requests check for as front page requests do.
+
+Feeds are validated by a hash of their content and by when the newsposts in them last changed, so a feed built again
+unchanged, or built by another process, keeps its validators. A deleted newspost leaves no modified_at behind, so
+the latest deletion from each feed is read from NewsPostDeletion.
+"""
+import calendar
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import quote_etag
+
+from wavepool import layout, pagination, staticfiles
+from wavepool.models import NewsPost, NewsPostDeletion, DIVESITE_SOURCE_NAMES
+from wavepool.routers import primary_reads
+
+FEED_ITEM_COUNT = 50
+FEED_CONTENT_TYPES = {
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+FEED_CACHE_CONTROL = 'public, max-age=60'
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+FEED_TITLE = 'Wavepool | Industry Dive'
+
+# `bodies` maps each content coding, or None for none, to the bytes sent, and `last_modified` is a timestamp or None
+# for an empty feed
+Feed = namedtuple('Feed', ['newspost_ids', 'bodies', 'etag', 'last_modified'])
+
+_lock = threading.Lock()
+# feeds by (site URL, dive site or None, format)
+_feeds = {}
+
+
+def feed_newsposts(divesite, published_at):
+    """ Return the FEED_ITEM_COUNT most recent newsposts live at `published_at`, of dive site `divesite` if not None
+    """
+    newsposts = NewsPost.objects.only('title', 'teaser', 'divesite', 'publish_date', 'modified_at').filter(
+        publish_date__lte=published_at,
+    )
+    if divesite is not None:
+        newsposts = newsposts.filter(divesite=divesite)
+    return list(newsposts.order_by(*pagination.RECENCY_ORDER)[:FEED_ITEM_COUNT])
+
+
+def last_deletion(divesite):
+    """ Return when a newspost of dive site `divesite`, or any newspost if None, was last deleted, or None if none was
+    """
+    deletions = NewsPostDeletion.objects.all() if divesite is None else NewsPostDeletion.objects.filter(
+        divesite=divesite,
+    )
+    return deletions.aggregate(last_deleted=Max('deleted_at'))['last_deleted']
+
+
+def feed_title(divesite):
+    if divesite is None:
+        return FEED_TITLE
+    return '{} | {}'.format(DIVESITE_SOURCE_NAMES[divesite], FEED_TITLE)
+
+
+def render_atom(title, site_url, feed_url, newsposts):
+    feed = Atom1Feed(
+        title=title, link=site_url, description='', feed_url=feed_url, language=settings.LANGUAGE_CODE,
+    )
+    for newspost in newsposts:
+        link = site_url + newspost.url.lstrip('/')
+        feed.add_item(
+            title=newspost.title, link=link, description=newspost.teaser, unique_id=link,
+            author_name=newspost.source_divesite_name, pubdate=newspost.publish_date,
+        )
+    return feed.writeString('utf-8').encode()
+
+
+def render_json(title, site_url, feed_url, newsposts):
+    items = []
+    for newspost in newsposts:
+        link = site_url + newspost.url.lstrip('/')
+        items.append({
+            'id': link,
+            'url': link,
+            'title': newspost.title,
+            'content_text': newspost.teaser,
+            'date_published': newspost.publish_date.isoformat(),
+            'authors': [{'name': newspost.source_divesite_name}],
+        })
+    feed = {
+        'version': JSON_FEED_VERSION,
+        'title': title,
+        'home_page_url': site_url,
+        'feed_url': feed_url,
+        'language': settings.LANGUAGE_CODE,
+        'items': items,
+    }
+    return json.dumps(feed, ensure_ascii=False).encode()
+
+
+RENDERERS = {'atom': render_atom, 'json': render_json}
+
+
+def build_feed(site_url, feed_url, divesite, feed_format):
+    """ Build the feed in `feed_format` of dive site `divesite`, or of every newspost if None, linking to pages under
+        `site_url`
+    """
+    # the layout's publication time, whose timer also drops the feeds when the next scheduled newspost goes live
+    newsposts = feed_newsposts(divesite, layout.get_layout().published_at)
+    content = RENDERERS[feed_format](feed_title(divesite), site_url, feed_url, newsposts)
+    bodies = {None: content}
+    for encoding, compress in staticfiles.compressors():
+        compressed = compress(content)
+        if len(compressed) < len(content) * staticfiles.MIN_COMPRESSION_RATIO:
+            bodies[encoding] = compressed
+    changes = [change for newspost in newsposts for change in (newspost.publish_date, newspost.modified_at)]
+    last_deleted = last_deletion(divesite)
+    if last_deleted is not None:
+        changes.append(last_deleted)
+    return Feed(
+        newspost_ids=frozenset(newspost.pk for newspost in newsposts),
+        bodies=bodies,
+        etag=hashlib.sha256(content).hexdigest()[:32],
+        last_modified=calendar.timegm(max(changes).utctimetuple()) if changes else None,
+    )
+
+
+def get_feed(site_url, feed_url, divesite, feed_format):
+    """ Return the current feed in `feed_format` of dive site `divesite`, or of every newspost if None, building it
+        if a newspost in it has changed since it was last built
+    """
+    key = (site_url, divesite, feed_format)
+    # newsposts changed by another process drop every feed
+    layout.check_for_changes()
+    feed = _feeds.get(key)
+    if feed is None:
+        with _lock:
+            feed = _feeds.get(key)
+            if feed is None:
+                # kept until the next change, so built from the default database which changes reach first
+                with primary_reads():
+                    feed = _feeds[key] = build_feed(site_url, feed_url, divesite, feed_format)
+    return feed
+
+
+async def aget_feed(site_url, feed_url, divesite, feed_format):
+    """ get_feed for async views, which only leaves the event loop when the feed has to be built or checked
+    """
+    feed = _feeds.get((site_url, divesite, feed_format))
+    if feed is None or layout.change_check_due():
+        feed = await sync_to_async(get_feed)(site_url, feed_url, divesite, feed_format)
+    return feed
+
+
+def choose_encoding(feed, request):
+    """ Return the content coding of `feed` that `request` accepts, or None for none, and its entity tag
+    """
+    encoding = next(
+        (encoding for encoding in staticfiles.accepted_encodings(request) if encoding in feed.bodies), None,
+    )
+    # each encoding is a representation of its own, and needs its own entity tag
+    etag = quote_etag(feed.etag if encoding is None else '{}-{}'.format(feed.etag, encoding))
+    return encoding, etag
+
+
+def invalidate_newspost(newspost_id, divesite, deleted=False):
+    """ Drop the feeds that list newspost `newspost_id`, and those it belongs to given its dive site `divesite`,
+        which is '' for a newspost from no dive site
+        `deleted` is passed when the change is a deletion, which only changes the feeds that list the newspost.
+    """
+    with _lock:
+        for key, feed in list(_feeds.items()):
+            _, feed_divesite, _ = key
+            belongs = not deleted and feed_divesite in (None, divesite)
+            if belongs or newspost_id in feed.newspost_ids:
+                del _feeds[key]
+
+
+def invalidate():
+    """ Drop every feed
+    """
+    with _lock:
+        _feeds.clear()
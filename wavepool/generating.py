@@ -0,0 +1,186 @@
+""" Synthetic newsposts for filling a database to production volumes
+This is run with `python manage.py generate_newsposts`, and fills the throwaway databases of the benchmarks.
+
+Bodies are a few paragraphs with the occasional heading, list, quote and link, drawn from a pool that is sanitized
+and rendered once, so a newspost costs no more than building its row. Newsposts are spread unevenly across the dive
+sites, and grow sparser going back in time the way a live site's archive does. Title words are drawn with a skew as
+well, so that searches for them match very different numbers of newsposts.
+
+Rows are written with one prepared INSERT per batch and ids picked up front from where the database would number the
+next newspost, past those of deleted newsposts, so that no id is ever used twice. This skips NewsPost.save and its
+signals, so tag counts are rebuilt once all the batches are written and the search index is left to
+`python manage.py rebuild_search_index`.
+"""
+import datetime
+import itertools
+import math
+import random
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from wavepool.models import NewsPost, Tag, TagCount, DIVESITE_SOURCE_NAMES
+
+# title words, drawn with a skew so that searches for them match very different numbers of newsposts
+TOPICS = [
+    'inventory', 'tariffs', 'pharmacy', 'automation', 'payroll', 'franchise', 'recall', 'warehouse', 'tuition',
+    'cybersecurity', 'delivery', 'biosimilar', 'unionization', 'grocery', 'menu', 'cloud', 'logistics', 'vaccine',
+]
+
+PARAGRAPH = (
+    'Retailers are rethinking store formats as shoppers split their spending between online orders and quick '
+    'trips to the aisle, and analysts expect the shift to continue through the next holiday season.'
+)
+SENTENCES = [
+    PARAGRAPH,
+    'The company said the change would take effect at the start of the next fiscal year.',
+    'Executives told investors on a call that margins had held up better than expected.',
+    'Regulators have signaled they will look closely at similar deals in the months ahead.',
+    'Smaller competitors say they cannot match the pricing without cutting staff.',
+    'A spokesperson declined to say how many locations would be affected.',
+    'The survey of more than 500 managers found most expect budgets to stay flat.',
+    'Industry groups have asked lawmakers to delay the rule by at least a year.',
+    'Analysts noted that the figures exclude one-time costs tied to the restructuring.',
+    'Several large employers have already announced plans to follow suit.',
+]
+TITLES = [
+    '{company} expands {topic} push as demand grows',
+    '{topic} rules draw pushback from industry groups',
+    'How {company} is rethinking {topic}',
+    '{company} cuts {topic} costs after a slow quarter',
+    '5 takeaways on {topic} from this week',
+    '{company} names new head of {topic}',
+]
+COMPANIES = ['Acme', 'Northwind', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne', 'Tyrell', 'Soylent']
+TAG_NAMES = ['Earnings', 'Regulation', 'Mergers', 'Labor', 'Technology', 'Sustainability', 'Supply chain', 'Policy']
+
+# relative number of newsposts each dive site publishes
+DIVESITE_WEIGHTS = {
+    'retaildive': 8, 'ciodive': 6, 'educationdive': 5, 'supplychaindive': 5, 'restaurantdive': 4, 'grocerydive': 3,
+    'biopharmadive': 2, 'hrdive': 2,
+}
+# publish dates are spread over the MAX_AGE_DAYS days before today, half of them within the last MEDIAN_AGE_DAYS
+MEDIAN_AGE_DAYS = 180
+MAX_AGE_DAYS = 10 * 365
+BODY_VARIANTS = 64
+MAX_TAGS = 3
+
+
+def make_bodies(rng, count=BODY_VARIANTS):
+    """ Return `count` newsposts carrying nothing but a body and the fields rendered from it
+    """
+    max_length = NewsPost._meta.get_field('body').max_length
+    bodies = []
+    for _ in range(count):
+        parts = []
+        for number in range(rng.randint(2, 7)):
+            if number and rng.random() < 0.2:
+                parts.append('<h2>{}</h2>'.format(rng.choice(TITLES).format(
+                    company=rng.choice(COMPANIES), topic=rng.choice(TOPICS),
+                )))
+            sentences = rng.sample(SENTENCES, rng.randint(2, 4))
+            if rng.random() < 0.3:
+                site_name = rng.choice(list(DIVESITE_SOURCE_NAMES))
+                sentences[-1] = '<a href="https://www.{}.com/news/">{}</a>'.format(site_name, sentences[-1])
+            parts.append('<p>{}</p>'.format(' '.join(sentences)))
+        if rng.random() < 0.25:
+            parts.insert(rng.randint(1, len(parts)), '<ul>{}</ul>'.format(''.join(
+                '<li>{}</li>'.format(sentence) for sentence in rng.sample(SENTENCES, 3)
+            )))
+        if rng.random() < 0.15:
+            parts.append('<blockquote>{}</blockquote>'.format(rng.choice(SENTENCES)))
+        # the CMS would refuse to save a longer body
+        while len(''.join(parts)) > max_length:
+            parts.pop()
+        body = NewsPost(body=''.join(parts))
+        body.render_body()
+        bodies.append(body)
+    return bodies
+
+
+def make_newsposts(count, start=0, seed=0):
+    """ Yield `count` unsaved newsposts numbered from `start`
+        The same `seed` and numbers give the same newsposts, apart from their modification times.
+    """
+    rng = random.Random(seed + start)
+    bodies = make_bodies(random.Random(seed))
+    site_names, site_weights = zip(*DIVESITE_WEIGHTS.items())
+    # newsposts are published at any time of day before today, so none of them is scheduled
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for number in range(start, start + count):
+        site_name = rng.choices(site_names, site_weights)[0]
+        body = rng.choice(bodies)
+        topic = TOPICS[min(int(rng.expovariate(0.5)), len(TOPICS) - 1)]
+        age = min(rng.expovariate(math.log(2) / MEDIAN_AGE_DAYS), MAX_AGE_DAYS)
+        yield NewsPost(
+            title=rng.choice(TITLES).format(company=rng.choice(COMPANIES), topic=topic),
+            body=body.body,
+            body_html=body.body_html,
+            teaser=body.teaser,
+            source='https://www.{}.com/news/synthetic-newspost-{}/'.format(site_name, number),
+            divesite=site_name,
+            publish_date=today - datetime.timedelta(days=age),
+        )
+
+
+def generate(count, seed=0, batch_size=10000):
+    """ Write `count` synthetic newsposts after the existing ones, tagged with up to MAX_TAGS of TAG_NAMES,
+        `batch_size` per transaction
+        Yields the number written so far after each batch.
+    """
+    start = next_id()
+    tag_ids = [Tag.objects.get_or_create(name=name)[0].pk for name in TAG_NAMES]
+    rng = random.Random(seed + start)
+    Link = NewsPost.tags.through
+    newsposts = make_newsposts(count, start=start, seed=seed)
+    written = 0
+    while written < count:
+        batch = list(itertools.islice(newsposts, batch_size))
+        links = []
+        for number, newspost in enumerate(batch, start + written):
+            newspost.pk = number
+            links.extend(
+                Link(newspost_id=number, tag_id=tag_id) for tag_id in rng.sample(tag_ids, rng.randint(0, MAX_TAGS))
+            )
+        with transaction.atomic():
+            insert_newsposts(batch)
+            Link.objects.bulk_create(links)
+        written += len(batch)
+        yield written
+    TagCount.rebuild(tag_ids)
+
+
+def next_id():
+    """ Return the id the database would give the next newspost
+        SQLite numbers AUTOINCREMENT keys from the largest it has handed out, which may belong to a deleted newspost
+        whose id is still in cursors and cached pages, rather than from the largest left in the table.
+    """
+    last_id = NewsPost.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [NewsPost._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None:
+            last_id = max(last_id, row[0])
+    return last_id + 1
+
+
+def insert_newsposts(newsposts):
+    """ Insert `newsposts`, which have their ids set, with a single prepared statement
+    """
+    # bulk_create splits a batch into statements of at most 999 parameters, each parsed anew by SQLite, where one
+    # statement run for every row is prepared once
+    fields = NewsPost._meta.concrete_fields
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(NewsPost._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    modified_at = timezone.now()
+    rows = []
+    for newspost in newsposts:
+        newspost.modified_at = modified_at
+        rows.append([field.get_db_prep_save(getattr(newspost, field.attname), connection) for field in fields])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
@@ -0,0 +1,245 @@
+""" Bulk import of newsposts from JSON
+This is run with `python manage.py import_newsposts`.
+
+Input is either JSON Lines with one newspost object per line, or a JSON array of newspost objects. Fixture entries
+(`{"model": "wavepool.newspost", "fields": {...}}`) are accepted as well. Both forms are read a chunk at a time so
+memory use does not grow with the size of the file.
+
+Newsposts are matched to existing ones by their source URL. A match is updated and anything else is created, a
+batch at a time with bulk queries. A row without a publish_date keeps the publish date of the newspost it updates, and
+creates one published when it is written. Bulk queries skip NewsPost.save and its signals, so each batch refreshes the
+search index, tag counts and cached pages itself.
+"""
+import io
+import json
+import re
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from wavepool import cache, feeds, layout, live, search
+from wavepool.models import NewsPost, Tag, TagCount
+
+IMPORTED_FIELDS = ('title', 'body', 'source', 'publish_date')
+# fields that are not validated against the input, because they are worked out rather than imported
+UNVALIDATED_FIELDS = ('id', 'is_cover_story', 'modified_at', *NewsPost.DERIVED_FIELDS)
+
+CHUNK_SIZE = 64 * 1024
+# a row still unfinished after this many characters is treated as malformed, so a broken file cannot be read
+# into memory whole while looking for the end of a row
+MAX_ROW_SIZE = 1024 * 1024
+
+LEADING_WHITESPACE = re.compile(r'\s*')
+
+BatchResult = namedtuple('BatchResult', ['created', 'updated', 'rejected'])
+
+
+def read_rows(stream, chunk_size=CHUNK_SIZE):
+    """ Yield each value in `stream`, which holds either JSON Lines or a single JSON array
+        Raises ValueError if the stream is not valid JSON.
+    """
+    buffer = stream.read(chunk_size).lstrip()
+    if buffer.startswith('['):
+        yield from _read_array(stream, buffer[1:], chunk_size)
+    else:
+        # the first chunk most likely ends partway through a line, which the next readline() finishes
+        yield from _read_lines([buffer + stream.readline(), stream])
+
+
+def _read_lines(sources):
+    number = 0
+    for source in sources:
+        # str.splitlines would also split on separators that JSON allows inside strings, such as U+2028
+        for line in io.StringIO(source) if isinstance(source, str) else source:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError('Line {}: {}'.format(number, error)) from error
+
+
+def _read_array(stream, buffer, chunk_size):
+    decoder = json.JSONDecoder()
+    position = 0
+
+    def fill():
+        # drop what has been parsed already and append the next chunk, returning False at the end of the stream
+        nonlocal buffer, position
+        chunk = stream.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        return bool(chunk)
+
+    def next_character():
+        nonlocal position
+        while True:
+            position = LEADING_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer):
+                return buffer[position]
+            if not fill():
+                return ''
+
+    number = 0
+    while True:
+        character = next_character()
+        if character == ']':
+            return
+        if number:
+            if character != ',':
+                raise ValueError('Row {}: expected "," or "]" after the previous row'.format(number))
+            position += 1
+            next_character()
+        number += 1
+        while True:
+            try:
+                value, position = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as error:
+                if len(buffer) - position > MAX_ROW_SIZE or not fill():
+                    raise ValueError('Row {}: {}'.format(number, error)) from error
+        yield value
+
+
+def newspost_from_row(row):
+    """ Return the unsaved newspost described by `row` and its tag names, or None for tag names if `row` has none
+        The newspost's publish_date is None if `row` has none, for write_batch to fill in.
+        Raises ValidationError if `row` is not a valid newspost.
+    """
+    if isinstance(row, dict) and 'fields' in row:
+        if row.get('model') != 'wavepool.newspost':
+            raise ValidationError('Fixture entry is not a wavepool.newspost')
+        row = row['fields']
+    if not isinstance(row, dict):
+        raise ValidationError('Expected an object')
+
+    tag_names = row.get('tags')
+    if tag_names is not None and (
+        not isinstance(tag_names, list) or not all(isinstance(name, str) and name.strip() for name in tag_names)
+    ):
+        raise ValidationError({'tags': 'Expected a list of tag names'})
+
+    newspost = NewsPost(**{name: row[name] for name in IMPORTED_FIELDS if name in row})
+    newspost.full_clean(exclude=UNVALIDATED_FIELDS, validate_unique=False)
+    if 'publish_date' not in row:
+        # not the default of now, which would move an existing newspost's publish date
+        newspost.publish_date = None
+    elif timezone.is_naive(newspost.publish_date):
+        # a publish_date given as a date or without a UTC offset is taken to be in the site's time zone
+        newspost.publish_date = timezone.make_aware(newspost.publish_date)
+    newspost.refresh_derived_fields()
+    if tag_names is not None:
+        tag_names = {name.strip() for name in tag_names}
+    return newspost, tag_names
+
+
+def import_rows(rows, batch_size=1000):
+    """ Create or update a newspost for each row in `rows`, writing `batch_size` rows per transaction
+        Yields a BatchResult for each batch written. Rejected rows are listed as (row number, error message).
+    """
+    batch = {}
+    rejected = []
+    for number, row in enumerate(rows, 1):
+        try:
+            newspost, tag_names = newspost_from_row(row)
+        except ValidationError as error:
+            rejected.append((number, _error_message(error)))
+            continue
+        # a source repeated within a batch is written once, from the row that comes last
+        batch[newspost.source] = (newspost, tag_names)
+        if len(batch) >= batch_size:
+            yield write_batch(batch.values(), rejected)
+            batch, rejected = {}, []
+    if batch or rejected:
+        yield write_batch(batch.values(), rejected)
+    layout.invalidate()
+    feeds.invalidate()
+    live.publish_front_page_changes()
+
+
+def write_batch(entries, rejected=()):
+    """ Write a batch of (newspost, tag names) pairs, each with a different source, and return its BatchResult
+    """
+    entries = list(entries)
+    newsposts = [newspost for newspost, _ in entries]
+    modified_at = timezone.now()
+    with transaction.atomic():
+        existing = NewsPost.objects.filter(source__in=[newspost.source for newspost in newsposts])
+        stored = {
+            source: (pk, publish_date)
+            for source, pk, publish_date in existing.values_list('source', 'pk', 'publish_date')
+        }
+        created, updated = [], []
+        for newspost in newsposts:
+            newspost.modified_at = modified_at
+            newspost.pk, publish_date = stored.get(newspost.source, (None, modified_at))
+            if newspost.publish_date is None:
+                newspost.publish_date = publish_date
+            (created if newspost.pk is None else updated).append(newspost)
+
+        _update_newsposts(updated, [*IMPORTED_FIELDS, *NewsPost.DERIVED_FIELDS, 'modified_at'])
+        NewsPost.objects.bulk_create(created)
+        # SQLite does not return the ids of bulk inserted rows, so they are read back by source
+        created_ids = dict(
+            NewsPost.objects.filter(source__in=[newspost.source for newspost in created]).values_list('source', 'pk')
+        )
+        for newspost in created:
+            newspost.pk = created_ids[newspost.source]
+
+        _set_tags([(newspost, tag_names) for newspost, tag_names in entries if tag_names is not None])
+        if search.is_available():
+            search.index_newsposts(newsposts)
+
+    for newspost in updated:
+        cache.invalidate_newspost(newspost.pk)
+    return BatchResult(len(created), len(updated), list(rejected))
+
+
+def _update_newsposts(newsposts, field_names):
+    # bulk_update sends one CASE expression per field covering the whole batch, which SQLite evaluates far more
+    # slowly than the same UPDATE statement run once per row
+    fields = [NewsPost._meta.get_field(name) for name in field_names]
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        connection.ops.quote_name(NewsPost._meta.db_table),
+        ', '.join('{} = %s'.format(connection.ops.quote_name(field.column)) for field in fields),
+        connection.ops.quote_name(NewsPost._meta.pk.column),
+    )
+    rows = [
+        [field.get_db_prep_save(getattr(newspost, field.attname), connection) for field in fields] + [newspost.pk]
+        for newspost in newsposts
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _set_tags(entries):
+    """ Replace the tags of each newspost in the (newspost, tag names) pairs `entries` and recount the tags changed
+    """
+    if not entries:
+        return
+    names = set().union(*(tag_names for _, tag_names in entries))
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'pk'))
+    for name in names - tag_ids.keys():
+        # new tags are rare, so they are saved one at a time to get their slugs and tag counts
+        tag_ids[name] = Tag.objects.create(name=name).pk
+
+    Link = NewsPost.tags.through
+    links = Link.objects.filter(newspost_id__in=[newspost.pk for newspost, _ in entries])
+    changed_tag_ids = set(links.values_list('tag_id', flat=True))
+    links.delete()
+    Link.objects.bulk_create([
+        Link(newspost_id=newspost.pk, tag_id=tag_ids[name]) for newspost, tag_names in entries for name in tag_names
+    ])
+    changed_tag_ids.update(tag_ids.values())
+    TagCount.rebuild(changed_tag_ids)
+
+
+def _error_message(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(
+            '{}: {}'.format(field, ' '.join(messages)) for field, messages in sorted(error.message_dict.items())
+        )
+    return ' '.join(error.messages)
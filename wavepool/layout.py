@@ -0,0 +1,269 @@
+""" Precomputed front page layout
+
+The front page is worked out from the most recent newsposts and kept in memory until a newspost is saved or
+deleted, so serving the front page does not touch the database. Only the first page of the archive is part of the
+layout; later pages are read with keyset pagination from the cursor the layout records.
+
+Each layout also records when newsposts last changed, which the front page uses as its HTTP validator.
+
+A newspost with a publish_date in the future is scheduled. A layout is built from the newsposts live at the time it
+is built, its `published_at`, and the public views leave out anything published after that time rather than compare
+newsposts with the clock on every request. The layout also records when the next scheduled newspost is due, and
+a timer drops and rebuilds the layout at that moment, so the newspost goes live everywhere at once.
+
+Saves and deletes only drop the layout of the process they are made in. Newsposts written by another process, such as
+an import or a backfill run from the command line, are noticed by comparing the latest modified_at, or the latest
+deletion recorded in NewsPostDeletion, with the one the layout was built at, at most every CHANGE_CHECK_SECONDS. A
+change found that way drops the layout and sends newsposts_changed_elsewhere, so whatever else is cached from
+newsposts is dropped too.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+from django.db.models import Max
+from django.dispatch import Signal
+from django.utils import timezone
+
+from wavepool import pagination
+from wavepool.models import NewsPost, NewsPostDeletion, TagCount
+from wavepool.routers import primary_reads
+
+TOP_STORY_COUNT = 3
+ARCHIVE_PAGE_SIZE = 20
+POPULAR_TAG_COUNT = 10
+
+# the front page only shows teasers, so the bodies are left in the database
+BODY_FIELDS = ('body', 'body_html')
+
+# the timer waits at most this long before rebuilding the layout, however far off the next scheduled newspost is
+MAX_SCHEDULE_SECONDS = 24 * 60 * 60
+
+# how often a process looks for newsposts changed by other processes
+CHANGE_CHECK_SECONDS = 5
+
+# `last_change` is when newsposts last changed as of the build, and `checked_at` the time.monotonic() it was last
+# compared with the database
+FrontPageLayout = namedtuple('FrontPageLayout', [
+    'cover_story', 'top_stories', 'archive', 'archive_cursor', 'popular_tags', 'last_modified', 'published_at',
+    'next_publish_at', 'last_change', 'checked_at',
+])
+
+# sent from the timer's thread once the layout has been rebuilt for newsposts that have just gone live
+scheduled_newsposts_published = Signal()
+# sent once newsposts are found to have been changed by another process
+newsposts_changed_elsewhere = Signal()
+
+_lock = threading.Lock()
+_layout = None
+
+
+def build_layout():
+    """ Build the front page layout from the most recent newsposts that are live
+        The most recent post flagged as the cover story becomes the cover story, the 3 most recent of the remaining
+        posts become top stories and the next ARCHIVE_PAGE_SIZE posts make up the first page of the archive.
+    """
+    published_at = timezone.now()
+    # the queries share one read transaction, so a cover story swap committed partway through cannot show up in
+    # some of them and not others
+    with transaction.atomic():
+        # one more post than is displayed in case the cover story is among them, and one more to detect a next page
+        recent = teaser_newsposts().filter(publish_date__lte=published_at).order_by(*pagination.RECENCY_ORDER)
+        recent = list(recent[:TOP_STORY_COUNT + ARCHIVE_PAGE_SIZE + 2])
+        cover_story = next((newspost for newspost in recent if newspost.is_cover_story), None)
+        if cover_story is None:
+            cover_story = get_cover_story(published_at)
+        popular_tags = TagCount.popular(POPULAR_TAG_COUNT)
+        changed_at = last_modified = last_change()
+        next_publish_at = next_scheduled(published_at)
+
+    # a scheduled newspost going live changes the front page without saving anything
+    if recent and (last_modified is None or recent[0].publish_date > last_modified):
+        last_modified = recent[0].publish_date
+    stories = [newspost for newspost in recent if newspost != cover_story]
+    archive = pagination.page_from(stories[TOP_STORY_COUNT:], ARCHIVE_PAGE_SIZE)
+    return FrontPageLayout(
+        cover_story, stories[:TOP_STORY_COUNT], archive.newsposts, archive.next_cursor, popular_tags, last_modified,
+        published_at, next_publish_at, changed_at, time.monotonic(),
+    )
+
+
+def teaser_newsposts():
+    """ Newsposts loaded for showing as teasers, with their tags and without their bodies
+    """
+    return NewsPost.objects.defer(*BODY_FIELDS).prefetch_related('tags')
+
+
+def last_change():
+    """ Return when a newspost was last saved or deleted, or None if there has been no newspost
+    """
+    last_modified = NewsPost.objects.aggregate(last_modified=Max('modified_at'))['last_modified']
+    # a deleted newspost leaves no modified_at behind, so deletions are read from where they are recorded
+    last_deleted = NewsPostDeletion.objects.aggregate(last_deleted=Max('deleted_at'))['last_deleted']
+    if last_modified is None or (last_deleted is not None and last_deleted > last_modified):
+        return last_deleted
+    return last_modified
+
+
+def next_scheduled(published_at):
+    """ Return the publish_date of the first newspost scheduled after `published_at`, or None if there is none
+    """
+    scheduled = NewsPost.objects.filter(publish_date__gt=published_at).order_by('publish_date')
+    return scheduled.values_list('publish_date', flat=True).first()
+
+
+def get_cover_story(published_at):
+    """ Look up the cover story through the partial index that holds only the cover story row
+        A cover story scheduled after `published_at` is not shown yet.
+    """
+    cover_stories = list(teaser_newsposts().filter(is_cover_story=True, publish_date__lte=published_at)[:1])
+    return cover_stories[0] if cover_stories else None
+
+
+def archive_page(cursor):
+    """ Return the page of the archive that follows `cursor`, leaving out the current cover story
+    """
+    newsposts = teaser_newsposts()
+    front_page_layout = get_layout()
+    if front_page_layout.cover_story is not None:
+        newsposts = newsposts.exclude(pk=front_page_layout.cover_story.pk)
+    return pagination.page_after(newsposts, cursor, ARCHIVE_PAGE_SIZE, front_page_layout.published_at)
+
+
+def published_at():
+    """ Return the time up to which newsposts are live: that of the current layout, or the current time if there is
+        none, which is the time the next layout is built with
+        The layout is checked for newsposts changed by other processes first, as get_layout does, so views that only
+        need the time do not keep a layout that leaves out newsposts written elsewhere.
+    """
+    layout = check_for_changes()
+    return timezone.now() if layout is None else layout.published_at
+
+
+def get_layout():
+    """ Return the current front page layout, building it if a newspost has changed since it was last built
+    """
+    global _layout
+    layout = check_for_changes()
+    if layout is None:
+        with _lock:
+            layout = _layout
+            if layout is None:
+                # the layout is kept until the next change, so it is built from the default database which changes
+                # reach first
+                with primary_reads():
+                    layout = _layout = build_layout()
+                if layout.next_publish_at is not None:
+                    scheduler.schedule(layout.next_publish_at)
+    return layout
+
+
+async def aget_layout():
+    """ get_layout for async views, which only leaves the event loop when the layout has to be built
+    """
+    layout = _layout
+    if layout is None or _check_due(layout):
+        layout = await sync_to_async(get_layout)()
+    return layout
+
+
+def check_for_changes():
+    """ Compare the current layout with the database if it is due to be, and return it, or None if there is none or
+        newsposts have been changed elsewhere since it was built, in which case newsposts_changed_elsewhere is sent
+        Whatever is cached from newsposts outside the layout calls this before it is served, so it is dropped as
+        soon as the layout is.
+    """
+    layout = _layout
+    if layout is not None and _check_due(layout):
+        layout = _check_for_changes(layout)
+    return layout
+
+
+def change_check_due():
+    """ Return whether check_for_changes would compare the current layout with the database
+    """
+    layout = _layout
+    return layout is not None and _check_due(layout)
+
+
+def _check_due(layout):
+    return time.monotonic() - layout.checked_at >= CHANGE_CHECK_SECONDS
+
+
+def _check_for_changes(layout):
+    """ Return `layout` if no newspost has been saved since it was built, otherwise drop it, announce the change and
+        return None
+    """
+    global _layout
+    with _lock:
+        if _layout is not layout:
+            return _layout
+        with primary_reads():
+            changed = last_change() != layout.last_change
+        _layout = None if changed else layout._replace(checked_at=time.monotonic())
+    if changed:
+        newsposts_changed_elsewhere.send(sender=FrontPageLayout)
+    return _layout
+
+
+def invalidate():
+    """ Drop the current layout so the next front page request rebuilds it
+    """
+    global _layout
+    with _lock:
+        _layout = None
+
+
+class PublishScheduler:
+    """ Timer calling `callback` from a thread of its own at the earliest of the times it is scheduled for
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._timer = None
+        self.due = None
+
+    def schedule(self, when):
+        """ Call the callback at `when`, unless it is already due to be called by then
+        """
+        with self._lock:
+            if self.due is not None and self.due <= when:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            seconds = min(max((when - timezone.now()).total_seconds(), 0), MAX_SCHEDULE_SECONDS)
+            self.due = when
+            self._timer = threading.Timer(seconds, self._run)
+            # a pending publication does not keep the process from exiting
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = self.due = None
+
+    def _run(self):
+        with self._lock:
+            self._timer = self.due = None
+        try:
+            self.callback()
+        finally:
+            # the timer's thread is outside django's request handling, which would otherwise close its connections
+            connections.close_all()
+
+
+def publish_scheduled():
+    """ Rebuild the layout with the newsposts that have gone live since it was built, which also schedules the next
+        rebuild, and announce it
+    """
+    invalidate()
+    get_layout()
+    scheduled_newsposts_published.send(sender=PublishScheduler)
+
+
+scheduler = PublishScheduler(publish_scheduled)
@@ -0,0 +1,291 @@
+""" Live front page updates, pushed to browsers as server-sent events
+
+Browsers showing the front page keep a connection open to EVENTS_PATH, served under ASGI by front_page_events
+without going through django's request handling, so an idle connection costs a coroutine and a subscription rather
+than a thread. Once a newspost change is committed, publish_front_page_changes() compares the new front page layout
+with the one last published and broadcasts what changed:
+
+    cover_story    the new cover story
+    top_stories    the top stories, in their new order
+    archive        the stories `added` to the first page of the archive, with their positions, and the ids of the
+                   stories `removed` from it
+
+Every story is sent as a teaser, the fields the front page shows for it. The hub lives in the memory of one process
+and only hears about changes committed in that process.
+
+The stream is only served where the ASGI application is wrapped with with_events, which marks the requests it passes
+on to django, so the front page only opens it when is_served() says it can.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.formats import date_format
+
+from wavepool import layout
+
+EVENTS_PATH = '/live/front-page/'
+# set in the scope of requests that with_events passes on to django
+SCOPE_KEY = 'wavepool_events'
+# how long a browser waits before reconnecting, and how often an idle connection is written to so that proxies keep
+# it open
+RETRY_MILLISECONDS = 5000
+KEEPALIVE_SECONDS = 15
+# messages held for a connection that is not reading them before it is closed, after which the browser reconnects
+# and reloads
+MAX_QUEUED = 100
+
+KEEPALIVE = b': keepalive\n\n'
+
+
+class Subscription:
+    """ Messages waiting to be sent on one connection
+    """
+    __slots__ = ('loop', 'messages', 'closed', '_waiter')
+
+    def __init__(self, loop):
+        self.loop = loop
+        # a list rather than a deque, which allocates room for 64 entries up front; connections seldom hold more than
+        # one message
+        self.messages = []
+        self.closed = False
+        self._waiter = None
+
+    def deliver(self, message):
+        if len(self.messages) >= MAX_QUEUED:
+            self.close()
+            return
+        self.messages.append(message)
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    async def get(self, timeout):
+        """ Return the next message, or None if there was none within `timeout` seconds or the subscription is closed
+        """
+        if not self.messages and not self.closed:
+            self._waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiter = None
+        if self.closed or not self.messages:
+            return None
+        return self.messages.pop(0)
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+class BroadcastHub:
+    """ Fans messages out to the subscriptions of every event loop in the process
+        publish() can be called from any thread. Each event loop is handed a message once, however many of its
+        connections are subscribed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self.last_event_id = 0
+
+    def subscribe(self):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[subscription.loop].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions[subscription.loop]
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.loop]
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, event, data):
+        """ Send an `event` carrying `data` as JSON to every subscription
+        """
+        with self._lock:
+            self.last_event_id += 1
+            message = encode_event(event, data, self.last_event_id)
+            by_loop = [(loop, list(subscriptions)) for loop, subscriptions in self._subscriptions.items()]
+        for loop, subscriptions in by_loop:
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, message)
+            except RuntimeError:
+                # the loop has been closed, along with its connections
+                pass
+
+
+def _deliver(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+def encode_event(event, data, event_id):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+        event_id, event, json.dumps(data, separators=(',', ':')),
+    ).encode()
+
+
+hub = BroadcastHub()
+
+_publish_lock = threading.Lock()
+# the front page state the last published changes led to, or None while nobody is listening
+_state = None
+
+
+def teaser(newspost):
+    return {
+        'id': newspost.pk,
+        'title': newspost.title,
+        'url': newspost.url,
+        'publish_date': date_format(timezone.localtime(newspost.publish_date)),
+        'teaser': newspost.teaser,
+        'tags': [{'name': tag.name, 'url': tag.url} for tag in newspost.tags.all()],
+    }
+
+
+def front_page_state(front_page_layout):
+    """ Return the stories of `front_page_layout` as teasers
+    """
+    cover_story = front_page_layout.cover_story
+    return {
+        'cover_story': teaser(cover_story) if cover_story is not None else None,
+        'top_stories': [teaser(newspost) for newspost in front_page_layout.top_stories],
+        'archive': [teaser(newspost) for newspost in front_page_layout.archive],
+    }
+
+
+def front_page_diff(old, new):
+    """ Return the (event, data) pairs that turn front page state `old` into `new`
+        A story whose teaser changed in the archive is removed and added again.
+    """
+    events = []
+    if new['cover_story'] != old['cover_story']:
+        events.append(('cover_story', new['cover_story']))
+    if new['top_stories'] != old['top_stories']:
+        events.append(('top_stories', new['top_stories']))
+    if new['archive'] != old['archive']:
+        added = [
+            dict(story, position=position) for position, story in enumerate(new['archive'])
+            if story not in old['archive']
+        ]
+        removed = [story['id'] for story in old['archive'] if story not in new['archive']]
+        events.append(('archive', {'added': added, 'removed': removed}))
+    return events
+
+
+def ensure_state():
+    """ Record the current front page as the state later changes are published against
+    """
+    global _state
+    with _publish_lock:
+        if _state is None:
+            _state = front_page_state(layout.get_layout())
+
+
+def publish_front_page_changes():
+    """ Broadcast what changed on the front page since the last call, if anyone is listening
+        Called once newspost changes are committed, from the thread that committed them.
+    """
+    global _state
+    with _publish_lock:
+        if not hub.has_subscribers():
+            _state = None
+            return
+        state = front_page_state(layout.get_layout())
+        previous, _state = _state, state
+        if previous is None:
+            return
+        for event, data in front_page_diff(previous, state):
+            hub.publish(event, data)
+
+
+async def front_page_events(scope, receive, send):
+    """ ASGI application streaming the front page's changes as server-sent events until the browser goes away
+        A browser reconnecting with a Last-Event-ID older than the latest event has missed changes, and is sent a
+        `reload` event instead.
+    """
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    # subscribed first, so that changes published while the state is recorded are not lost
+    subscription = hub.subscribe()
+    if _state is None:
+        await sync_to_async(_ensure_state)()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    disconnected.add_done_callback(lambda _: subscription.close())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # stops nginx from buffering the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        last_event_id = dict(scope['headers']).get(b'last-event-id')
+        if last_event_id is not None and last_event_id != str(hub.last_event_id).encode():
+            opening = encode_event('reload', None, hub.last_event_id)
+        else:
+            opening = 'retry: {}\nid: {}\n\n'.format(RETRY_MILLISECONDS, hub.last_event_id).encode()
+        await send({'type': 'http.response.body', 'body': opening, 'more_body': True})
+
+        while True:
+            message = await subscription.get(KEEPALIVE_SECONDS)
+            if subscription.closed:
+                break
+            await send({'type': 'http.response.body', 'body': message or KEEPALIVE, 'more_body': True})
+        if not disconnected.done():
+            # the connection fell too far behind and is closed so that the browser reconnects and reloads
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        hub.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+def _ensure_state():
+    try:
+        ensure_state()
+    finally:
+        # this runs outside django's request handling, which would otherwise close the connection when it is done
+        close_old_connections()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def with_events(application):
+    """ Wrap the django ASGI `application` so that requests for EVENTS_PATH get the front page's event stream
+    """
+    async def route(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await front_page_events(scope, receive, send)
+        if scope['type'] == 'http':
+            scope = dict(scope, **{SCOPE_KEY: True})
+        return await application(scope, receive, send)
+    return route
+
+
+def is_served(request):
+    """ Return whether `request` came through with_events, which serves the event stream alongside it
+        Under WSGI, or ASGI without the wrapper, EVENTS_PATH is not found and browsers would keep retrying it.
+    """
+    return getattr(request, 'scope', {}).get(SCOPE_KEY, False)
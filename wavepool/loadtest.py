@@ -0,0 +1,174 @@
+""" Load test of the site's main pages
+This is run with `python manage.py loadtest`.
+
+Each scenario has `concurrency` clients request one kind of page until `requests` requests have been made, through
+django's WSGI handler from a thread per client or through its ASGI handler from one event loop, against the database
+the settings point at. The handlers are called directly rather than through a server, so the figures leave out the
+network and the server's own overhead. Cached pages, the front page layout, the most read ranking and the
+advertisement index are dropped before each scenario, so its first requests pay for filling them as they would after
+a deployment.
+
+The report is JSON, naming the commit it ran at, so that the reports of two commits run on the same machine and data
+can be diffed.
+"""
+import asyncio
+import random
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import override_settings
+from django.urls import reverse
+
+from wavepool import ads, cache, layout, pagination, readership
+from wavepool.benchmarks import asgi_get, percentile, run_threads, wsgi_get
+from wavepool.models import NewsPost
+
+SCENARIOS = ('front_page', 'newspost_detail', 'admin_changelist')
+# scenarios that need a CMS user's session
+STAFF_SCENARIOS = ('admin_changelist', )
+SERVERS = ('wsgi', 'asgi')
+# newspost pages are requested from among the most recent newsposts, the more recent the more often, as readers
+# follow links from the front page and the archive
+NEWSPOST_SAMPLE = 1000
+LATENCY_PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+def scenario_paths(scenario, requests, rng):
+    """ Return the paths of the `requests` requests made in `scenario`
+    """
+    if scenario == 'front_page':
+        return [reverse('home')] * requests
+    if scenario == 'admin_changelist':
+        return [reverse('admin:wavepool_newspost_changelist')] * requests
+    newspost_ids = list(
+        NewsPost.objects.order_by(*pagination.RECENCY_ORDER).values_list('pk', flat=True)[:NEWSPOST_SAMPLE]
+    )
+    if not newspost_ids:
+        raise ValueError('There are no newsposts to request')
+    ranks = (min(int(rng.expovariate(5 / len(newspost_ids))), len(newspost_ids) - 1) for _ in range(requests))
+    return [reverse('newspost_detail', args=[newspost_ids[rank]]) for rank in ranks]
+
+
+@contextmanager
+def staff_session(username):
+    """ Yield the headers of a request made in a new session logged in as CMS user `username`, and delete the
+        session afterwards
+    """
+    user = get_user_model()._default_manager.get_by_natural_key(username)
+    if not user.is_staff:
+        raise ValueError('{} is not a CMS user'.format(username))
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    try:
+        yield [('Cookie', '{}={}'.format(settings.SESSION_COOKIE_NAME, session.session_key))]
+    finally:
+        session.delete()
+
+
+def run(scenarios, concurrency, requests, server='wsgi', staff_headers=(), seed=0):
+    """ Run each of `scenarios` and return the report
+        `staff_headers` are sent with the requests of STAFF_SCENARIOS.
+    """
+    rng = random.Random(seed)
+    report = {
+        'commit': git_commit(),
+        'server': server,
+        'concurrency': concurrency,
+        'newsposts': NewsPost.objects.count(),
+        'scenarios': {},
+    }
+    serve = _serve_wsgi if server == 'wsgi' else _serve_asgi
+    # requests are made with the Host the benchmarks use
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for scenario in scenarios:
+            paths = scenario_paths(scenario, requests, rng)
+            headers = staff_headers if scenario in STAFF_SCENARIOS else ()
+            layout.invalidate()
+            ads.invalidate()
+            readership.invalidate()
+            cache.get_page_cache().clear()
+            results = []
+            started = time.perf_counter()
+            # the clients run in threads of their own, leaving the calling thread's connections alone
+            run_threads([lambda: results.extend(serve(paths, concurrency, headers))])
+            elapsed = time.perf_counter() - started
+            report['scenarios'][scenario] = summarize(results, elapsed)
+    return report
+
+
+def summarize(results, elapsed):
+    """ Summarize the (milliseconds, status code) pairs of requests made in `elapsed` seconds
+    """
+    timings = sorted(milliseconds for milliseconds, _ in results)
+    return {
+        'requests': len(results),
+        'errors': sum(status >= 400 for _, status in results),
+        'requests_per_s': round(len(results) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(timings), 2),
+            **{name: round(percentile(timings, fraction), 2) for name, fraction in LATENCY_PERCENTILES.items()},
+            'max': round(timings[-1], 2),
+        },
+    }
+
+
+def _serve_wsgi(paths, concurrency, headers):
+    handler = WSGIHandler()
+    # list iterators hand each path to one thread only
+    pending = iter(paths)
+    results = []
+
+    def client():
+        for path in pending:
+            started = time.perf_counter()
+            status = wsgi_get(handler, path, headers)
+            results.append(((time.perf_counter() - started) * 1000, status))
+
+    run_threads([client] * concurrency)
+    return results
+
+
+def _serve_asgi(paths, concurrency, headers):
+    handler = ASGIHandler()
+    pending = iter(paths)
+    results = []
+
+    async def client():
+        for path in pending:
+            started = time.perf_counter()
+            status = await asgi_get(handler, path, headers)
+            results.append(((time.perf_counter() - started) * 1000, status))
+
+    async def serve():
+        try:
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+        finally:
+            # the ORM ran in asgiref's thread for thread sensitive code, which keeps its connections
+            await sync_to_async(connections.close_all)()
+
+    asyncio.run(serve())
+    return results
+
+
+def git_commit():
+    """ Return the commit the code is checked out at, or None outside a git checkout
+    """
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
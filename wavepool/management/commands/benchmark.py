@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool.benchmarks import BENCHMARKS, scratch_database
+
+
+class Command(BaseCommand):
+    help = 'Run a wavepool benchmark against a throwaway database filled with synthetic newsposts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+            help='Number of newsposts to benchmark with, smallest first',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Requests timed at each size')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        with scratch_database(verbosity=max(options['verbosity'] - 1, 0)):
+            rows = BENCHMARKS[options['name']](sorted(options['sizes']), options['repeat'])
+        self._write_table(rows)
+
+    def _write_table(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+        self.stdout.write('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+        for row in rows:
+            self.stdout.write('  '.join(str(row[column]).rjust(width) for column, width in zip(columns, widths)))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool import generating, layout, search
+
+
+class Command(BaseCommand):
+    help = (
+        'Add synthetic newsposts with HTML bodies and tags, spread across the dive sites and the last few years, '
+        'and rebuild the search index. '
+        'Running servers drop their cached pages within a few seconds of their next front page request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of newsposts to add')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random choices, for repeatable data')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Newsposts written per transaction')
+        parser.add_argument(
+            '--skip-search-index', action='store_true',
+            help='Leave the search index to a later `python manage.py rebuild_search_index`',
+        )
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError('count must be at least 1')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.perf_counter()
+        for written in generating.generate(options['count'], seed=options['seed'], batch_size=options['batch_size']):
+            if options['verbosity'] > 1:
+                self.stdout.write('Generated {} newsposts'.format(written))
+        layout.invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS('Generated {} newsposts in {:.1f}s ({:.0f} rows/s)'.format(
+            options['count'], elapsed, options['count'] / elapsed if elapsed else 0,
+        )))
+
+        if not options['skip_search_index'] and search.is_available():
+            started = time.perf_counter()
+            indexed = search.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Indexed {} newsposts in {:.1f}s'.format(indexed, time.perf_counter() - started)
+            ))
@@ -0,0 +1,55 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool import importing
+
+
+class Command(BaseCommand):
+    help = (
+        'Create or update newsposts from a JSON Lines file or a JSON array, matching existing newsposts by source. '
+        'Running servers drop their cached pages within a few seconds of their next front page request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - to read standard input')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Newsposts written per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['path'] == '-':
+            self._import(sys.stdin, options)
+        else:
+            try:
+                stream = open(options['path'], encoding='utf-8')
+            except OSError as error:
+                raise CommandError(error)
+            with stream:
+                self._import(stream, options)
+
+    def _import(self, stream, options):
+        started = time.perf_counter()
+        created = updated = rejected = 0
+        try:
+            for batch in importing.import_rows(importing.read_rows(stream), batch_size=options['batch_size']):
+                created += batch.created
+                updated += batch.updated
+                rejected += len(batch.rejected)
+                for number, message in batch.rejected:
+                    self.stderr.write('Row {} rejected: {}'.format(number, message))
+                if options['verbosity'] > 1:
+                    self.stdout.write('Imported {} newsposts'.format(created + updated))
+        except ValueError as error:
+            raise CommandError(
+                'Stopped after importing {} newsposts: {}'.format(created + updated, error)
+            ) from error
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Created {} and updated {} newsposts, rejected {} rows, in {:.1f}s ({:.0f} rows/s)'.format(
+                created, updated, rejected, elapsed, (created + updated + rejected) / elapsed if elapsed else 0,
+            )
+        ))
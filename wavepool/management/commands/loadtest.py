@@ -0,0 +1,58 @@
+import json
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Request the front page, newspost pages and the CMS newspost list at a fixed concurrency against the '
+        'configured database, and write the throughput and latency percentiles of each as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=loadtest.SCENARIOS,
+            help='Pages to request, by default all of them, the CMS newspost list only with --admin-user',
+        )
+        parser.add_argument('--concurrency', type=int, default=50, help='Clients making requests at the same time')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests made in each scenario')
+        parser.add_argument('--server', choices=loadtest.SERVERS, default='wsgi', help='Django handler to serve with')
+        parser.add_argument('--admin-user', help='Username of the CMS user the CMS newspost list is requested as')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the choice of newsposts requested')
+        parser.add_argument('--output', help='File to write the report to instead of standard output')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        scenarios = options['scenarios']
+        if scenarios is None:
+            scenarios = [
+                scenario for scenario in loadtest.SCENARIOS
+                if options['admin_user'] or scenario not in loadtest.STAFF_SCENARIOS
+            ]
+        needs_staff = any(scenario in loadtest.STAFF_SCENARIOS for scenario in scenarios)
+        if needs_staff and not options['admin_user']:
+            raise CommandError('The CMS newspost list is only requested with --admin-user')
+
+        with ExitStack() as stack:
+            staff_headers = ()
+            try:
+                if needs_staff:
+                    staff_headers = stack.enter_context(loadtest.staff_session(options['admin_user']))
+                report = loadtest.run(
+                    scenarios, options['concurrency'], options['requests'], server=options['server'],
+                    staff_headers=staff_headers, seed=options['seed'],
+                )
+            except (ValueError, get_user_model().DoesNotExist) as error:
+                raise CommandError(error)
+
+        output = json.dumps(report, indent=2) + '\n'
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                stream.write(output)
+        else:
+            self.stdout.write(output, ending='')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search index from every newspost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Newsposts read and indexed at a time')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full text search needs an SQLite database')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.perf_counter()
+        indexed = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed {} newsposts in {:.1f}s'.format(indexed, time.perf_counter() - started)
+        ))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from wavepool import cache, feeds, layout, search
+from wavepool.models import NewsPost
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh the stored body HTML, teaser and dive site of every newspost in batches. '
+        'Running servers drop their cached pages within a few seconds of their next front page request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000, help='Newsposts rendered and written per transaction',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.perf_counter()
+        rendered = 0
+        last_id = 0
+        while True:
+            # walk the table by primary key so each batch is a cheap range read however far in we are
+            batch = NewsPost.objects.filter(pk__gt=last_id).only('id', 'title', 'body', 'source').order_by('pk')
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            # the rendered bodies are new content, which the newsposts' validators and teaser fragment keys follow
+            modified_at = timezone.now()
+            for newspost in batch:
+                newspost.refresh_derived_fields()
+                newspost.modified_at = modified_at
+            with transaction.atomic():
+                NewsPost.objects.bulk_update(batch, [*NewsPost.DERIVED_FIELDS, 'modified_at'])
+                # the search index holds the text of the rendered bodies
+                if search.is_available():
+                    search.index_newsposts(batch)
+            rendered += len(batch)
+            last_id = batch[-1].pk
+            if options['verbosity'] > 1:
+                self.stdout.write('Rendered {} newsposts'.format(rendered))
+
+        layout.invalidate()
+        cache.get_page_cache().clear()
+        feeds.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            'Rendered {} newsposts in {:.1f}s'.format(rendered, time.perf_counter() - started)
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wavepool import replication, routers
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the default SQLite database over each database in WAVEPOOL_REPLICAS, standing in for replication when '
+        'running with replicas locally'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, help='Keep copying every this many seconds instead of copying once',
+        )
+
+    def handle(self, *args, **options):
+        if not routers.replicas():
+            raise CommandError('WAVEPOOL_REPLICAS lists no replicas; run with DJANGO_SETTINGS_MODULE=settings.replicas')
+        interval = options['interval']
+        if interval is not None and interval <= 0:
+            raise CommandError('--interval must be more than 0')
+
+        while True:
+            started = time.perf_counter()
+            replication.replicate()
+            if options['verbosity'] > 0:
+                self.stdout.write('Replicated to {} in {:.2f}s'.format(
+                    ', '.join(routers.replicas()), time.perf_counter() - started,
+                ))
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,208 @@
+""" Per view request metrics, kept in the memory of each process
+
+RequestMetricsMiddleware measures every request it passes on: its wall time, the number of database queries it made
+and the time they took, the time spent rendering templates and the size of the response. Queries are counted by an
+execute wrapper installed on every database connection, and render time by the template backend in
+wavepool.backends.templates. Both add to the measurement of the request they run in, including from the threads async
+views make queries in, and do nothing outside a request.
+
+The measurements are aggregated into histograms labelled by view, exported in Prometheus' text format by the admin
+only metrics view. A request that makes more queries than WAVEPOOL_QUERY_BUDGET or takes longer than
+WAVEPOOL_LATENCY_BUDGET_MS milliseconds is logged as a warning.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_BUDGET = 25
+DEFAULT_LATENCY_BUDGET_MS = 500
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name, help text, RequestMeasurement attribute and buckets of each histogram
+HISTOGRAMS = (
+    ('wavepool_request_duration_seconds', 'Wall time of requests, by view.', 'seconds', SECONDS_BUCKETS),
+    ('wavepool_request_db_queries', 'Database queries made by requests, by view.', 'queries', QUERY_BUCKETS),
+    ('wavepool_request_db_duration_seconds', 'Time requests spent waiting on database queries, by view.',
+     'db_seconds', SECONDS_BUCKETS),
+    ('wavepool_request_template_duration_seconds', 'Time requests spent rendering templates, by view.',
+     'template_seconds', SECONDS_BUCKETS),
+    ('wavepool_response_size_bytes', 'Size of response bodies, by view.', 'response_bytes', BYTES_BUCKETS),
+)
+
+UNRESOLVED_VIEW = 'unresolved'
+
+# the measurement of the request being handled, or None outside a request
+_measurement = ContextVar('wavepool_request_measurement', default=None)
+
+
+def query_budget():
+    return getattr(settings, 'WAVEPOOL_QUERY_BUDGET', DEFAULT_QUERY_BUDGET)
+
+
+def latency_budget_ms():
+    return getattr(settings, 'WAVEPOOL_LATENCY_BUDGET_MS', DEFAULT_LATENCY_BUDGET_MS)
+
+
+class RequestMeasurement:
+    __slots__ = ('seconds', 'queries', 'db_seconds', 'template_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = None
+
+
+@contextmanager
+def measuring():
+    """ Yield a RequestMeasurement that the queries and template renders inside the block add to, with the block's
+        wall time set on it when the block ends
+    """
+    measurement = RequestMeasurement()
+    token = _measurement.set(measurement)
+    started = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        measurement.seconds = time.perf_counter() - started
+        _measurement.reset(token)
+
+
+def time_query(execute, sql, params, many, context):
+    """ Execute wrapper adding each query to the measurement of the current request
+    """
+    measurement = _measurement.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measurement.db_seconds += time.perf_counter() - started
+        measurement.queries += 1
+
+
+@contextmanager
+def timing_render():
+    """ Add the time spent inside the block to the current request's template render time
+    """
+    measurement = _measurement.get()
+    if measurement is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        measurement.template_seconds += time.perf_counter() - started
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # observations falling into each bucket but not the one before it, then those above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """ The histograms of each view, thread safe
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, measurement):
+        with self._lock:
+            histograms = self._views.get(view)
+            if histograms is None:
+                histograms = self._views[view] = {
+                    attribute: Histogram(buckets) for _, _, attribute, buckets in HISTOGRAMS
+                }
+            for attribute, histogram in histograms.items():
+                value = getattr(measurement, attribute)
+                if value is not None:
+                    histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """ Return the histograms in Prometheus' text exposition format
+        """
+        with self._lock:
+            views = {
+                view: {
+                    attribute: (list(histogram.counts), histogram.sum) for attribute, histogram in histograms.items()
+                }
+                for view, histograms in sorted(self._views.items())
+            }
+        lines = []
+        for name, help_text, attribute, buckets in HISTOGRAMS:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+            for view, histograms in views.items():
+                counts, total = histograms[attribute]
+                label = 'view="{}"'.format(_escape_label(view))
+                cumulative = 0
+                for bound, count in zip([*buckets, '+Inf'], counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, bound, cumulative))
+                lines.append('{}_sum{{{}}} {}'.format(name, label, total))
+                lines.append('{}_count{{{}}} {}'.format(name, label, cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def view_name(request):
+    """ Label for the view that handled `request`, its dotted path
+    """
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return UNRESOLVED_VIEW
+    return resolver_match._func_path
+
+
+def record(request, response, measurement):
+    """ Add the `measurement` of a request to its view's histograms, and log it if it went over budget
+    """
+    if not response.streaming:
+        measurement.response_bytes = len(response.content)
+    elif response.has_header('Content-Length'):
+        measurement.response_bytes = int(response['Content-Length'])
+    view = view_name(request)
+    registry.observe(view, measurement)
+
+    milliseconds = measurement.seconds * 1000
+    if measurement.queries > query_budget() or milliseconds > latency_budget_ms():
+        logger.warning(
+            'Request over budget: %s %s (%s) made %d queries in %.1fms, %.1fms of them in the database and %.1fms '
+            'rendering templates',
+            request.method, request.path, view, measurement.queries, milliseconds, measurement.db_seconds * 1000,
+            measurement.template_seconds * 1000,
+        )
@@ -0,0 +1,50 @@
+import asyncio
+
+from django.utils.deprecation import MiddlewareMixin
+
+from wavepool import metrics, routers
+
+
+class PrimaryPinningMiddleware(MiddlewareMixin):
+    """ Pin a client that has just written to the default database, by a cookie that read_from_replicas honours
+        Placed above SessionMiddleware so that writing a session counts as a write. Runs natively under ASGI, since a
+        synchronous middleware would send the rest of the request through a thread.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with routers.tracking_writes() as wrote:
+            response = self.get_response(request)
+            self._pin(response, wrote())
+        return response
+
+    async def __acall__(self, request):
+        with routers.tracking_writes() as wrote:
+            response = await self.get_response(request)
+            self._pin(response, wrote())
+        return response
+
+    def _pin(self, response, wrote):
+        if wrote and routers.replicas():
+            response.set_cookie(routers.PIN_COOKIE, '1', max_age=routers.pin_seconds(), httponly=True, samesite='Lax')
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """ Measure each request into the histograms of wavepool.metrics
+        Placed above the rest of the middleware, so that their time and queries count towards the request's.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with metrics.measuring() as measurement:
+            response = self.get_response(request)
+        metrics.record(request, response, measurement)
+        return response
+
+    async def __acall__(self, request):
+        with metrics.measuring() as measurement:
+            response = await self.get_response(request)
+        metrics.record(request, response, measurement)
+        return response
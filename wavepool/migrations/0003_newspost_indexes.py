@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0002_alter_publish_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newspost',
+            index=models.Index(fields=['-publish_date', '-id'], name='newspost_recency_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='newspost',
+            constraint=models.UniqueConstraint(condition=models.Q(is_cover_story=True), fields=('is_cover_story',), name='newspost_single_cover_story'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0003_newspost_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newspost',
+            name='modified_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0004_newspost_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newspost',
+            name='body_html',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='newspost',
+            name='teaser',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+    ]
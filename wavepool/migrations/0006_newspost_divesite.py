@@ -0,0 +1,53 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:13
+
+from urllib.parse import urlsplit
+
+from django.db import migrations, models
+
+# the dive sites as they were when the field was added, so later changes to wavepool.models leave this migration be
+DIVESITE_HOSTNAMES = {
+    '{}.com'.format(short_name): short_name for short_name in (
+        'retaildive', 'ciodive', 'educationdive', 'supplychaindive', 'restaurantdive', 'grocerydive',
+        'biopharmadive', 'hrdive',
+    )
+}
+
+
+def divesite_for_source(source):
+    try:
+        hostname = urlsplit(source).hostname or ''
+    except ValueError:
+        return ''
+    return DIVESITE_HOSTNAMES.get('.'.join(hostname.split('.')[-2:]), '')
+
+
+def resolve_divesites(apps, schema_editor):
+    NewsPost = apps.get_model('wavepool', 'NewsPost')
+    batch = []
+    for newspost in NewsPost.objects.only('id', 'source').iterator():
+        newspost.divesite = divesite_for_source(newspost.source)
+        batch.append(newspost)
+        if len(batch) == 1000:
+            NewsPost.objects.bulk_update(batch, ['divesite'])
+            batch = []
+    NewsPost.objects.bulk_update(batch, ['divesite'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0005_newspost_rendered_body'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newspost',
+            name='divesite',
+            field=models.CharField(blank=True, choices=[('retaildive', 'Retail Dive'), ('ciodive', 'CIO Dive'), ('educationdive', 'Education Dive'), ('supplychaindive', 'Supply Chain Dive'), ('restaurantdive', 'Restaurant Dive'), ('grocerydive', 'Grocery Dive'), ('biopharmadive', 'BioPharma Dive'), ('hrdive', 'HR Dive')], default='', editable=False, max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='newspost',
+            index=models.Index(fields=['divesite', '-publish_date', '-id'], name='newspost_divesite_recency_idx'),
+        ),
+        migrations.RunPython(resolve_divesites, migrations.RunPython.noop),
+    ]
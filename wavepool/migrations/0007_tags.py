@@ -0,0 +1,34 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0006_newspost_divesite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='newspost_count', serialize=False, to='wavepool.tag')),
+                ('count', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='newspost',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='newsposts', to='wavepool.Tag'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE wavepool_newspost_fts USING fts5(title, body, tokenize = 'porter unicode61')"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE wavepool_newspost_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0007_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0008_newspost_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='newspost',
+            index=models.Index(fields=['source'], name='newspost_source_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def add_publish_time(apps, schema_editor):
+    # the dates already stored are read back as datetimes once they carry a time, midnight UTC
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "UPDATE wavepool_newspost SET publish_date = publish_date || ' 00:00:00' WHERE length(publish_date) = 10"
+    )
+
+
+def drop_publish_time(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('UPDATE wavepool_newspost SET publish_date = substr(publish_date, 1, 10)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0009_newspost_source_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newspost',
+            name='publish_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(add_publish_time, drop_publish_time),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.6 on 2026-10-18 15:24
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0010_newspost_publish_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Advertisement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('logo', models.FileField(upload_to='advertisements/', validators=[django.core.validators.FileExtensionValidator(['png', 'jpg', 'jpeg', 'gif', 'webp'])])),
+                ('url', models.URLField(max_length=500)),
+                ('text', models.CharField(max_length=300)),
+                ('impressions', models.PositiveBigIntegerField(default=0, editable=False)),
+                ('newsposts', models.ManyToManyField(blank=True, related_name='advertisements', to='wavepool.NewsPost')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.6 on 2026-10-18 15:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0011_advertisement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsPostReadership',
+            fields=[
+                ('newspost', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='readership', serialize=False, to='wavepool.newspost')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('score', models.FloatField(db_index=True)),
+            ],
+        ),
+    ]
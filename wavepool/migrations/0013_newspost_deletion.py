@@ -0,0 +1,27 @@
+# Generated by Django 3.1.6 on 2026-10-18 16:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0012_newspost_readership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsPostDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('newspost_id', models.PositiveIntegerField()),
+                ('divesite', models.CharField(blank=True, default='', max_length=30)),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='newspostdeletion',
+            index=models.Index(fields=['divesite', 'deleted_at'], name='deletion_divesite_idx'),
+        ),
+    ]
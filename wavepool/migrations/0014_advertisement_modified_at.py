@@ -0,0 +1,24 @@
+# Generated by Django 3.1.6 on 2026-10-18 16:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0013_newspost_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='advertisement',
+            name='logo',
+            field=models.ImageField(upload_to='advertisements/'),
+        ),
+    ]
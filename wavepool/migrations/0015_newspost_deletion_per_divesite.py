@@ -0,0 +1,44 @@
+# Generated by Django 3.1.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def keep_latest_deletions(apps, schema_editor):
+    # one row per dive site is kept, the latest, which is all that is ever read
+    NewsPostDeletion = apps.get_model('wavepool', 'NewsPostDeletion')
+    deletions = NewsPostDeletion.objects.order_by('-deleted_at', '-id')
+    latest_ids = [
+        deletions.filter(divesite=divesite).values_list('id', flat=True)[0]
+        for divesite in NewsPostDeletion.objects.values_list('divesite', flat=True).distinct()
+    ]
+    NewsPostDeletion.objects.exclude(id__in=latest_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wavepool', '0014_advertisement_modified_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_deletions, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='newspostdeletion',
+            name='deletion_divesite_idx',
+        ),
+        migrations.RemoveField(
+            model_name='newspostdeletion',
+            name='newspost_id',
+        ),
+        migrations.AlterField(
+            model_name='newspostdeletion',
+            name='deleted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='newspostdeletion',
+            name='divesite',
+            field=models.CharField(blank=True, default='', max_length=30, unique=True),
+        ),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+from urllib.parse import urlsplit
+
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.text import slugify
+
+from wavepool import rendering
+from wavepool.transactions import write_transaction
 
 DIVESITE_SOURCE_NAMES = {
     'retaildive': 'Retail Dive',
@@ -13,27 +19,187 @@ DIVESITE_SOURCE_NAMES = {
     'hrdive': 'HR Dive',
 }
 
+# newsposts are matched to a dive site by the last two labels of their source's hostname, so www. and other
+# subdomains of a dive site resolve to it as well
+DIVESITE_HOSTNAMES = {'{}.com'.format(short_name): short_name for short_name in DIVESITE_SOURCE_NAMES}
+
+DEFAULT_SOURCE_NAME = 'Industry Dive'
+
+
+def divesite_for_source(source):
+    """ Return the short name of the dive site that `source` links to, or '' if it is not a dive site
+    """
+    try:
+        hostname = urlsplit(source).hostname or ''
+    except ValueError:
+        return ''
+    return DIVESITE_HOSTNAMES.get('.'.join(hostname.split('.')[-2:]), '')
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(self.name)
+        super().save(*args, **kwargs)
+
+    @property
+    def url(self):
+        return reverse('tag_archive', args=[self.slug])
+
+
+class TagCount(models.Model):
+    """ Number of newsposts carrying each tag, kept up to date as tags are added to and removed from newsposts so
+        popular tags can be read without counting the whole newspost-tag table
+    """
+    tag = models.OneToOneField(Tag, primary_key=True, on_delete=models.CASCADE, related_name='newspost_count')
+    count = models.PositiveIntegerField(default=0, db_index=True)
+
+    @classmethod
+    def popular(cls, limit=10):
+        """ Return the `limit` tags with the most newsposts
+        """
+        tag_counts = cls.objects.filter(count__gt=0).select_related('tag').order_by('-count', 'tag__name')[:limit]
+        return [tag_count.tag for tag_count in tag_counts]
+
+    @classmethod
+    def change(cls, tag_ids, delta):
+        """ Add `delta` to the count of each tag in `tag_ids`
+        """
+        if tag_ids:
+            cls.objects.filter(tag_id__in=tag_ids).update(count=models.F('count') + delta)
+
+    @classmethod
+    def rebuild(cls, tag_ids=None):
+        """ Recount the newsposts of `tag_ids`, or of every tag, from the newspost-tag table
+        """
+        tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(pk__in=tag_ids)
+        tag_counts = [
+            cls(tag_id=tag_id, count=count)
+            for tag_id, count in tags.annotate(total=models.Count('newsposts')).values_list('pk', 'total')
+        ]
+        with transaction.atomic():
+            cls.objects.bulk_create(tag_counts, ignore_conflicts=True)
+            cls.objects.bulk_update(tag_counts, ['count'])
+
 
 class NewsPost(models.Model):
     title = models.CharField(max_length=300)
     body = models.TextField(max_length=3000)
+    body_html = models.TextField(editable=False, default='')
+    teaser = models.CharField(max_length=rendering.TEASER_LENGTH, editable=False, default='')
     source = models.URLField()
+    divesite = models.CharField(
+        max_length=30, choices=list(DIVESITE_SOURCE_NAMES.items()), blank=True, default='', editable=False,
+    )
     is_cover_story = models.BooleanField(default=False)
-    publish_date = models.DateField(default=timezone.now)
+    # a newspost saved with a publish_date in the future is scheduled, and goes live at that time
+    publish_date = models.DateTimeField(default=timezone.now)
+    modified_at = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
+    tags = models.ManyToManyField(Tag, related_name='newsposts', blank=True)
 
-    @property
-    def url(self):
-        return reverse('newspost_detail')
+    # fields refreshed from the body and source on every save
+    DERIVED_FIELDS = ('body_html', 'teaser', 'divesite')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-publish_date', '-id'], name='newspost_recency_idx'),
+            models.Index(fields=['divesite', '-publish_date', '-id'], name='newspost_divesite_recency_idx'),
+            # imports match incoming newsposts to existing ones by source
+            models.Index(fields=['source'], name='newspost_source_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_cover_story'], condition=models.Q(is_cover_story=True), name='newspost_single_cover_story',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.modified_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'modified_at', *self.DERIVED_FIELDS}
+        with write_transaction():
+            if self.is_cover_story:
+                # only one newspost can be the cover story, so it replaces the previous one in the same transaction,
+                # with an UPDATE that only touches a row that is still the cover story when it runs
+                NewsPost.objects.filter(is_cover_story=True).exclude(pk=self.pk).update(
+                    is_cover_story=False, modified_at=self.modified_at
+                )
+            super().save(*args, **kwargs)
+
+    def refresh_derived_fields(self):
+        """ Recompute every field derived from the body and the source
+        """
+        self.render_body()
+        self.divesite = divesite_for_source(self.source)
+
+    def render_body(self):
+        """ Store the sanitized body HTML and the plain text teaser rendered from the body
+        """
+        rendered = rendering.render_body(self.body)
+        self.body_html = rendered.html
+        self.teaser = rendered.teaser
+        # not stored, but kept for the search index so the body is not parsed again to index it
+        self.body_text = rendered.text
 
     @property
-    def teaser(self):
-        return self.body[:150]
+    def url(self):
+        return reverse('newspost_detail', args=[self.pk])
 
     @property
     def source_divesite_name(self):
-        return 'Industry Dive'
+        return DIVESITE_SOURCE_NAMES.get(self.divesite, DEFAULT_SOURCE_NAME)
 
-    def tags(self):
-        return [
-            'HR', 'Diversity & Inclusion', 'Culture'
-        ]
+
+class NewsPostDeletion(models.Model):
+    """ When a newspost of each dive site was last deleted, so that processes other than the one deleting it can tell
+        newsposts and the feeds of its dive site have changed, even though a deletion leaves no modified_at behind
+        There is one row per dive site, and '' for newsposts from none, updated in place by record().
+    """
+    divesite = models.CharField(max_length=30, blank=True, default='', unique=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def record(cls, divesite):
+        """ Record that a newspost of dive site `divesite` has just been deleted
+        """
+        deleted_at = timezone.now()
+        if not cls.objects.filter(divesite=divesite).update(deleted_at=deleted_at):
+            # a row created by another process in the meantime holds a deletion made at the same moment
+            cls.objects.bulk_create([cls(divesite=divesite, deleted_at=deleted_at)], ignore_conflicts=True)
+
+
+class Advertisement(models.Model):
+    """ Sponsorship sold to a client, shown on the newspost pages it is placed on
+    """
+    logo = models.ImageField(upload_to='advertisements/')
+    url = models.URLField(max_length=500)
+    text = models.CharField(max_length=300)
+    newsposts = models.ManyToManyField(NewsPost, related_name='advertisements', blank=True)
+    # page views the ad was shown on, added to in batches by wavepool.ads
+    impressions = models.PositiveBigIntegerField(default=0, editable=False)
+    modified_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    def __str__(self):
+        return self.text
+
+    def save(self, *args, **kwargs):
+        self.modified_at = timezone.now()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'modified_at'}
+        super().save(*args, **kwargs)
+
+
+class NewsPostReadership(models.Model):
+    """ Page views of a newspost, kept up to date in batches by wavepool.readership
+        `score` is the base 2 logarithm of the newspost's views, each weighted by when it was written, which ranks
+        newsposts by their time decayed views.
+    """
+    newspost = models.OneToOneField(NewsPost, primary_key=True, on_delete=models.CASCADE, related_name='readership')
+    views = models.PositiveBigIntegerField(default=0)
+    score = models.FloatField(db_index=True)
@@ -0,0 +1,71 @@
+""" Keyset pagination of newsposts by most recent first
+
+Pages are fetched with a seek on (publish_date, id) rather than an OFFSET, so reading a page deep in the archive
+costs the same as reading the first one. A cursor is the (publish_date, id) of the last newspost on a page, with the
+publish_date written in UTC.
+"""
+import datetime
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+RECENCY_ORDER = ('-publish_date', '-id')
+# the largest id a 64 bit signed integer column holds
+MAX_ID = 2 ** 63 - 1
+
+KeysetPage = namedtuple('KeysetPage', ['newsposts', 'next_cursor'])
+
+
+def encode_cursor(newspost):
+    return format_cursor(newspost.publish_date, newspost.pk)
+
+
+def format_cursor(publish_date, newspost_id):
+    # without a UTC offset, which would need escaping in a URL
+    return '{}_{}'.format(timezone.make_naive(publish_date, timezone.utc).isoformat(), newspost_id)
+
+
+def decode_cursor(cursor):
+    """ Return the (publish_date, id) pair encoded in `cursor`, raising ValueError if it is malformed
+        A cursor holding a date rather than a time stands for midnight UTC, as cursors written before newsposts had
+        a publish time did.
+    """
+    publish_date, _, newspost_id = cursor.partition('_')
+    newspost_id = int(newspost_id)
+    # ids beyond those the database can hold would overflow its integers rather than match nothing
+    if not 1 <= newspost_id <= MAX_ID:
+        raise ValueError('Cursor id out of range: {}'.format(newspost_id))
+    return timezone.make_aware(datetime.datetime.fromisoformat(publish_date), timezone.utc), newspost_id
+
+
+def page_after(queryset, cursor, page_size, published_at=None):
+    """ Return the page of `queryset` that follows `cursor`, or the first page if `cursor` is None
+        Newsposts scheduled after `published_at` are left out.
+    """
+    queryset = queryset.order_by(*RECENCY_ORDER)
+    if cursor is not None and published_at is not None and cursor[0] > published_at:
+        # a cursor later than every live newspost leads to the same page as no cursor at all
+        cursor = None
+    if cursor is None:
+        if published_at is not None:
+            queryset = queryset.filter(publish_date__lte=published_at)
+    else:
+        # newsposts before a cursor within the live ones are all live, so the seek needs no further bound
+        publish_date, newspost_id = cursor
+        # the publish_date bound on its own lets the seek start inside the recency index rather than scan down to it
+        queryset = queryset.filter(publish_date__lte=publish_date).filter(
+            Q(publish_date__lt=publish_date) | Q(id__lt=newspost_id)
+        )
+    newsposts = list(queryset[:page_size + 1])
+    return page_from(newsposts, page_size)
+
+
+def page_from(newsposts, page_size):
+    """ Build a page from up to `page_size` + 1 newsposts already in recency order
+        The extra newspost only signals that there is a next page.
+    """
+    if len(newsposts) > page_size:
+        newsposts = newsposts[:page_size]
+        return KeysetPage(newsposts, encode_cursor(newsposts[-1]))
+    return KeysetPage(newsposts, None)
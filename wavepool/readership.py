@@ -0,0 +1,131 @@
+""" Page views of newsposts and the most read ranking shown on the front page
+
+Visitors' page views are counted per newspost in a BufferedCounter and written a batch at a time with one upsert
+into NewsPostReadership, which holds each newspost's total views and a time decayed score.
+
+A view counts half as much towards the ranking every HALF_LIFE_HOURS. Rather than weighting old views down, which
+would mean rewriting every row as time passes, each batch is weighted up by 2 ** (hours since EPOCH / HALF_LIFE_HOURS)
+as it is written, which orders newsposts the same way at any moment. Scores are stored as base 2 logarithms, so the
+weights cannot overflow and a batch adds to a score with log2(2 ** score + 2 ** batch score).
+
+The ranking is read with a seek down the score index and kept in memory for MOST_READ_SECONDS, so views written by
+other processes show up within that time. It holds the newsposts as they were read, so it is read again as soon as a
+newspost is saved or deleted, or newsposts are found to have been changed by another process.
+"""
+import atexit
+import datetime
+import math
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.utils import timezone
+
+from wavepool import layout
+from wavepool.counters import BufferedCounter
+from wavepool.models import NewsPost, NewsPostReadership
+from wavepool.routers import primary_reads
+
+HALF_LIFE_HOURS = 24
+EPOCH = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+FLUSH_THRESHOLD = 1000
+FLUSH_SECONDS = 30
+MOST_READ_COUNT = 5
+MOST_READ_SECONDS = 60
+
+# SQLite runs a SELECT with a WHERE clause as the source of an upsert, which here skips newsposts deleted since they
+# were viewed. LOG and POWER are the functions django registers on its SQLite connections.
+UPSERT_SQL = (
+    'INSERT INTO {readership} (newspost_id, views, score) SELECT %s, %s, %s '
+    'WHERE EXISTS (SELECT 1 FROM {newsposts} WHERE id = %s) '
+    'ON CONFLICT (newspost_id) DO UPDATE SET views = views + excluded.views, '
+    'score = MAX(score, excluded.score) + LOG(2, 1 + POWER(2, MIN(score, excluded.score) - MAX(score, excluded.score)))'
+)
+
+MostRead = namedtuple('MostRead', ['newsposts', 'changed_at', 'read_at'])
+
+_lock = threading.Lock()
+_most_read = None
+
+
+def batch_score(count, written_at):
+    """ Return the score of `count` views written at `written_at`
+    """
+    return math.log2(count) + (written_at - EPOCH).total_seconds() / 3600 / HALF_LIFE_HOURS
+
+
+def add_views(counts):
+    """ Add `counts` of views per newspost id to the newsposts' readership, in one upsert
+    """
+    written_at = timezone.now()
+    sql = UPSERT_SQL.format(
+        readership=connection.ops.quote_name(NewsPostReadership._meta.db_table),
+        newsposts=connection.ops.quote_name(NewsPost._meta.db_table),
+    )
+    rows = [
+        (newspost_id, count, batch_score(count, written_at), newspost_id) for newspost_id, count in counts.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+    # this process sees its own views straight away
+    invalidate()
+
+
+views = BufferedCounter(add_views, FLUSH_THRESHOLD, FLUSH_SECONDS)
+# views still pending when the process exits are written rather than lost
+atexit.register(views.flush)
+
+
+def read_most_read(published_at):
+    """ Return the MOST_READ_COUNT newsposts with the highest scores that are live at `published_at`
+    """
+    # read down the score index, a few rows more than shown in case some newsposts have since been rescheduled
+    readerships = NewsPostReadership.objects.select_related('newspost').only(
+        'newspost__title', 'newspost__publish_date',
+    ).order_by('-score')[:MOST_READ_COUNT * 2]
+    newsposts = [item.newspost for item in readerships if item.newspost.publish_date <= published_at]
+    return newsposts[:MOST_READ_COUNT]
+
+
+def get_most_read():
+    """ Return the current MostRead, reading the ranking again if it is older than MOST_READ_SECONDS
+    """
+    global _most_read
+    most_read = _most_read
+    if most_read is None or time.monotonic() - most_read.read_at >= MOST_READ_SECONDS:
+        with _lock:
+            most_read = _most_read
+            if most_read is None or time.monotonic() - most_read.read_at >= MOST_READ_SECONDS:
+                with primary_reads():
+                    newsposts = read_most_read(layout.published_at())
+                changed_at = timezone.now()
+                # the front page is only marked as changed when the ranking, or a newspost as shown in it, is
+                if most_read is not None and _shown(newsposts) == _shown(most_read.newsposts):
+                    changed_at = most_read.changed_at
+                most_read = _most_read = MostRead(newsposts, changed_at, time.monotonic())
+    return most_read
+
+
+def _shown(newsposts):
+    return [(newspost.pk, newspost.title, newspost.publish_date) for newspost in newsposts]
+
+
+async def aget_most_read():
+    """ get_most_read for async views, which only leaves the event loop when the ranking has to be read
+    """
+    most_read = _most_read
+    if most_read is None or time.monotonic() - most_read.read_at >= MOST_READ_SECONDS:
+        most_read = await sync_to_async(get_most_read)()
+    return most_read
+
+
+def invalidate():
+    """ Drop the ranking so the next front page request reads it again
+        The time it last changed is kept, so a ranking read again unchanged does not mark the front page as changed.
+    """
+    global _most_read
+    with _lock:
+        if _most_read is not None:
+            _most_read = _most_read._replace(read_at=-math.inf)
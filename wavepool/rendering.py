@@ -0,0 +1,99 @@
+""" Rendering of newspost bodies
+
+Bodies are written in the CMS as HTML. They are sanitized against an allowlist of tags and attributes, and a plain
+text teaser is cut from them at a word boundary, once when a newspost is saved so templates only output stored
+fields. render_body() does both from a single parse, which is most of the cost of importing a newspost, and also
+returns the body's text for the search index.
+"""
+import re
+from collections import namedtuple
+
+from bs4 import BeautifulSoup
+from bs4.element import PreformattedString
+
+TEASER_LENGTH = 150
+
+ALLOWED_TAGS = {
+    'a', 'b', 'blockquote', 'br', 'em', 'h2', 'h3', 'h4', 'h5', 'h6', 'i', 'li', 'ol', 'p', 'strong', 'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+# tags whose content is dropped along with the tag rather than kept as text
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'template'}
+
+# tags that end a run of text, so the words either side of them are kept apart in the teaser
+BLOCK_TAGS = {'blockquote', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'p', 'div'}
+
+WHITESPACE = re.compile(r'\s+')
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x20\x7f]')
+
+RenderedBody = namedtuple('RenderedBody', ['html', 'teaser', 'text'])
+
+
+def _is_allowed_url(url):
+    # browsers ignore whitespace and control characters inside a scheme, so they are ignored here too
+    scheme, separator, _ = CONTROL_CHARACTERS.sub('', url).partition(':')
+    # relative URLs have no scheme, or a ':' only after a path or query character
+    return not separator or any(char in scheme for char in '/?#') or scheme.lower() in ALLOWED_URL_SCHEMES
+
+
+def sanitize_html(html):
+    """ Return `html` with only the allowed tags and attributes left in it
+        Other tags are unwrapped so their text is kept, except for DROPPED_TAGS which are removed entirely.
+    """
+    return str(_sanitize(BeautifulSoup(html, 'html.parser')))
+
+
+def _sanitize(soup):
+    # comments, CDATA sections, declarations, doctypes and processing instructions are written out raw, and browsers
+    # end some of them early, which would let markup inside them through
+    preformatted = soup.find_all(string=lambda text: isinstance(text, PreformattedString))
+    for node in preformatted + soup.find_all(DROPPED_TAGS):
+        node.extract()
+    for tag in soup.find_all(True):
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+        else:
+            allowed_attributes = ALLOWED_ATTRIBUTES.get(tag.name, set())
+            tag.attrs = {
+                name: value for name, value in tag.attrs.items()
+                if name in allowed_attributes and (name != 'href' or _is_allowed_url(value))
+            }
+    return soup
+
+
+def html_to_text(html):
+    """ Return the text in `html` with its whitespace collapsed and block elements kept apart by a space
+    """
+    return _soup_text(BeautifulSoup(html, 'html.parser'))
+
+
+def _soup_text(soup):
+    # changes `soup`, which is not written out afterwards
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_after(' ')
+    return WHITESPACE.sub(' ', soup.get_text()).strip()
+
+
+def make_teaser(html, length=TEASER_LENGTH):
+    """ Return the first `length` characters of the text in `html`, cut back to the last whole word
+    """
+    return _cut_teaser(html_to_text(html), length)
+
+
+def _cut_teaser(text, length):
+    if len(text) <= length:
+        return text
+    cut = text[:length + 1].rsplit(' ', 1)[0]
+    return cut if cut != text[:length + 1] else text[:length]
+
+
+def render_body(html):
+    """ Return the sanitized HTML of `html`, the teaser cut from it and its text, parsing it once
+    """
+    soup = _sanitize(BeautifulSoup(html, 'html.parser'))
+    sanitized = str(soup)
+    text = _soup_text(soup)
+    return RenderedBody(sanitized, _cut_teaser(text, TEASER_LENGTH), text)
@@ -0,0 +1,20 @@
+""" Replication stand-in for running with SQLite replicas locally
+
+Real replicas are kept up to date by the database server. With SQLite, replicate() copies the default database over
+each replica with SQLite's online backup API, which `python manage.py replicate_sqlite` runs once or on an interval.
+Until it runs, the replicas lag behind the default database the way a real replica can.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from wavepool import routers
+
+
+def replicate(aliases=None):
+    """ Copy the default database over each replica in `aliases`, or in WAVEPOOL_REPLICAS
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    source.ensure_connection()
+    for alias in routers.replicas() if aliases is None else aliases:
+        replica = connections[alias]
+        replica.ensure_connection()
+        source.connection.backup(replica.connection)
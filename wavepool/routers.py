@@ -0,0 +1,111 @@
+""" Routing of public reads to read replicas
+
+The replicas are the database aliases listed in the WAVEPOOL_REPLICAS setting, each holding a copy of the default
+database. Views decorated with read_from_replicas send their reads to one replica, picked per request. Everything
+else, including the admin and every write, stays on the default database.
+
+A client that has written is pinned to the default database for WAVEPOOL_PIN_SECONDS afterwards by a cookie that
+PrimaryPinningMiddleware sets, so an editor who has just saved reads what they saved rather than a replica that has
+not caught up yet. A request that writes also reads from the default database for the rest of the request.
+"""
+import asyncio
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'wavepool_primary'
+DEFAULT_PIN_SECONDS = 10
+
+# the database reads go to in the current request, or None for the default database
+_read_alias = ContextVar('wavepool_read_alias', default=None)
+# whether the current request has written
+_wrote = ContextVar('wavepool_wrote', default=False)
+
+
+def replicas():
+    return getattr(settings, 'WAVEPOOL_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'WAVEPOOL_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db is not None:
+            # related objects are read from where the object they belong to came from
+            return instance._state.db
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _read_alias.set(None)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the default database, migrations included
+        return db not in replicas()
+
+
+def read_from_replicas(view):
+    """ Decorator sending the reads of `view` to a replica, for GET and HEAD requests from clients not pinned to
+        the default database
+        Works on async views too, whose reads made through sync_to_async carry the choice of replica along.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapped(request, *args, **kwargs):
+            token = _read_alias.set(_pick_replica(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapped
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = _read_alias.set(_pick_replica(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapped
+
+
+def _pick_replica(request):
+    if not replicas() or request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+        return None
+    return random.choice(replicas())
+
+
+@contextmanager
+def primary_reads():
+    """ Read from the default database inside the block
+        Used for reads that fill a cache, since a copy read from a replica that is behind would be kept after the
+        invalidation that was meant to replace it.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def tracking_writes():
+    """ Yield a function returning whether a write was routed inside the block
+    """
+    token = _wrote.set(False)
+    try:
+        yield _wrote.get
+    finally:
+        _wrote.reset(token)
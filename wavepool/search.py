@@ -0,0 +1,127 @@
+""" Full text search over newsposts with SQLite FTS5
+
+Titles and the plain text of bodies are mirrored into the wavepool_newspost_fts table, keyed by newspost id, as
+newsposts are saved and deleted. Rows written in bulk bypass that, so after a bulk load the table is rebuilt with
+`python manage.py rebuild_search_index`.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection, connections, router, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from wavepool.models import NewsPost
+from wavepool.rendering import html_to_text
+
+FTS_TABLE = 'wavepool_newspost_fts'
+
+# bm25 weights of the title and body columns, so a match in the title ranks above one in the body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+SNIPPET_TOKENS = 24
+
+# snippets are highlighted with control characters that never appear in indexed text, so the text can be escaped
+# before they are turned into tags
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+QUERY_TERM = re.compile(r'\w+')
+
+SearchResult = namedtuple('SearchResult', ['newspost', 'title', 'snippet'])
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query):
+    """ Turn free text typed by a reader into an FTS5 query matching every word, the last one as a prefix
+        Each word is quoted so that FTS5 operators and punctuation in the input are not interpreted.
+    """
+    terms = ['"{}"'.format(term) for term in QUERY_TERM.findall(query)]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def body_text(newspost):
+    """ Return the text of the body of `newspost`, as rendered along with its body_html if it was in this process
+    """
+    text = getattr(newspost, 'body_text', None)
+    return html_to_text(newspost.body_html) if text is None else text
+
+
+def index_newsposts(newsposts):
+    """ Add `newsposts` to the search index, replacing any row they already have
+    """
+    rows = [(newspost.pk, newspost.title, body_text(newspost)) for newspost in newsposts]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT OR REPLACE INTO {} (rowid, title, body) VALUES (%s, %s, %s)'.format(FTS_TABLE), rows
+        )
+
+
+def remove_newsposts(newspost_ids):
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [(pk, ) for pk in newspost_ids])
+
+
+def rebuild(batch_size=1000):
+    """ Empty the search index and fill it again from every newspost, returning how many were indexed
+    """
+    indexed = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+        last_id = 0
+        while True:
+            batch = NewsPost.objects.filter(pk__gt=last_id).only('id', 'title', 'body_html').order_by('pk')
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            index_newsposts(batch)
+            indexed += len(batch)
+            last_id = batch[-1].pk
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(FTS_TABLE))
+    return indexed
+
+
+def _highlight(text):
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def search(query, limit=20, published_at=None):
+    """ Return up to `limit` SearchResults for `query`, best match first by bm25
+        Newsposts scheduled after `published_at` are left out.
+    """
+    match_query = build_match_query(query)
+    if match_query is None:
+        return []
+    # raw queries are not routed, so the index is read from the database the newsposts are read from
+    using = router.db_for_read(NewsPost)
+    newspost_table = connections[using].ops.quote_name(NewsPost._meta.db_table)
+    where = '{table} MATCH %s'
+    params = [MARK_START, MARK_END, MARK_START, MARK_END, '…', SNIPPET_TOKENS, match_query]
+    if published_at is not None:
+        # scheduled newsposts are left out before the LIMIT, so they cannot take the places of live ones
+        publish_date = NewsPost._meta.get_field('publish_date')
+        where += ' AND {{newsposts}}.{} <= %s'.format(connections[using].ops.quote_name(publish_date.column))
+        params.append(publish_date.get_db_prep_value(published_at, connections[using]))
+    sql = (
+        'SELECT {table}.rowid, highlight({table}, 0, %s, %s), snippet({table}, 1, %s, %s, %s, %s) '
+        'FROM {table} JOIN {newsposts} ON {newsposts}.id = {table}.rowid WHERE ' + where + ' '
+        'ORDER BY bm25({table}, %s, %s) LIMIT %s'
+    ).format(table=FTS_TABLE, newsposts=newspost_table)
+    params += [TITLE_WEIGHT, BODY_WEIGHT, limit]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    newsposts = NewsPost.objects.using(using).defer('body', 'body_html').in_bulk([row[0] for row in rows])
+    return [
+        SearchResult(newsposts[newspost_id], _highlight(title), _highlight(snippet))
+        for newspost_id, title, snippet in rows if newspost_id in newsposts
+    ]
@@ -0,0 +1,262 @@
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from wavepool import ads, cache, feeds, layout, live, metrics, readership, search
+from wavepool.models import Advertisement, NewsPost, NewsPostDeletion, Tag, TagCount
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^(-?\d+|[A-Za-z]+)$')
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """ Run the PRAGMAs in the WAVEPOOL_SQLITE_PRAGMAS setting on each new SQLite connection
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'WAVEPOOL_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured('Invalid WAVEPOOL_SQLITE_PRAGMAS entry {!r}: {!r}'.format(name, value))
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+@receiver(connection_created)
+def measure_queries(sender, connection, **kwargs):
+    """ Count the queries made on each connection towards the request they are made in
+    """
+    # the signal is sent again each time a closed connection is reopened
+    if metrics.time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.time_query)
+
+
+@receiver(pre_save, sender=NewsPost)
+def refresh_derived_fields(sender, instance, **kwargs):
+    # done on pre_save rather than in NewsPost.save so newsposts loaded from fixtures get them too
+    instance.refresh_derived_fields()
+
+
+@receiver(post_save, sender=NewsPost)
+def invalidate_front_page(sender, **kwargs):
+    # drop the layout now and again once the change is committed, so a front page request made while the
+    # transaction is still open cannot cache a layout built from the old rows
+    layout.invalidate()
+    transaction.on_commit(layout.invalidate)
+    transaction.on_commit(live.publish_front_page_changes)
+
+
+@receiver(layout.scheduled_newsposts_published)
+def publish_scheduled_front_page_changes(sender, **kwargs):
+    live.publish_front_page_changes()
+
+
+@receiver(layout.newsposts_changed_elsewhere)
+def drop_pages_changed_elsewhere(sender, **kwargs):
+    # which newsposts changed is not known, so every page and feed built from them is dropped
+    cache.get_page_cache().clear()
+    feeds.invalidate()
+    # placing an advertisement marks its newsposts as changed, so another process' placements are noticed here too
+    ads.invalidate()
+    readership.invalidate()
+    live.publish_front_page_changes()
+
+
+@receiver(post_delete, sender=NewsPost)
+def record_newspost_deletion(sender, instance, **kwargs):
+    # recorded in the same transaction as the deletion, so other processes notice it once it is committed
+    NewsPostDeletion.record(instance.divesite)
+
+
+@receiver(post_delete, sender=NewsPost)
+def invalidate_front_page_on_delete(sender, **kwargs):
+    layout.invalidate()
+    transaction.on_commit(layout.invalidate)
+    transaction.on_commit(live.publish_front_page_changes)
+
+
+@receiver(post_save, sender=NewsPost)
+@receiver(post_delete, sender=NewsPost)
+def invalidate_most_read(sender, **kwargs):
+    # the ranking holds its newsposts as they were read, so a retitled, rescheduled or deleted one is read again
+    readership.invalidate()
+    transaction.on_commit(readership.invalidate)
+
+
+@receiver(post_save, sender=NewsPost)
+@receiver(post_delete, sender=NewsPost)
+def invalidate_newspost_page(sender, instance, **kwargs):
+    # deleting a newspost clears instance.pk before the transaction commits
+    newspost_id = instance.pk
+    cache.invalidate_newspost(newspost_id)
+    transaction.on_commit(lambda: cache.invalidate_newspost(newspost_id))
+
+
+@receiver(post_save, sender=NewsPost)
+def invalidate_newspost_feeds(sender, instance, **kwargs):
+    newspost_id, divesite = instance.pk, instance.divesite
+    feeds.invalidate_newspost(newspost_id, divesite)
+    transaction.on_commit(lambda: feeds.invalidate_newspost(newspost_id, divesite))
+
+
+@receiver(post_delete, sender=NewsPost)
+def invalidate_deleted_newspost_feeds(sender, instance, **kwargs):
+    newspost_id, divesite = instance.pk, instance.divesite
+    feeds.invalidate_newspost(newspost_id, divesite, deleted=True)
+    transaction.on_commit(lambda: feeds.invalidate_newspost(newspost_id, divesite, deleted=True))
+
+
+@receiver(layout.scheduled_newsposts_published)
+def invalidate_scheduled_feeds(sender, **kwargs):
+    feeds.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+def create_tag_count(sender, instance, created, **kwargs):
+    if created:
+        TagCount.objects.get_or_create(tag=instance)
+    else:
+        invalidate_tag_pages(instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def invalidate_deleted_tag_pages(sender, instance, **kwargs):
+    invalidate_tag_pages(instance)
+
+
+def invalidate_tag_pages(tag):
+    """ Mark every newspost carrying `tag` as changed and drop the pages that show it
+    """
+    NewsPost.objects.filter(tags=tag).update(modified_at=timezone.now())
+    layout.invalidate()
+    cache.get_page_cache().clear()
+    transaction.on_commit(live.publish_front_page_changes)
+
+
+@receiver(m2m_changed, sender=NewsPost.tags.through)
+def count_newspost_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Keep TagCount in step as tags are added to and removed from newsposts, from either side of the relation
+        Removals and clears only count the links that exist, which are looked up before they are deleted.
+    """
+    if action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(tag_id=instance.pk) if reverse else sender.objects.filter(newspost_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(**{'newspost_id__in' if reverse else 'tag_id__in': pk_set})
+        instance._removed_tag_links = list(links.values_list('newspost_id', 'tag_id'))
+        return
+    if action == 'post_add':
+        links = [(newspost_id, instance.pk) for newspost_id in pk_set] if reverse else [
+            (instance.pk, tag_id) for tag_id in pk_set
+        ]
+        delta = 1
+    elif action in ('post_remove', 'post_clear'):
+        links = instance.__dict__.pop('_removed_tag_links', [])
+        delta = -1
+    else:
+        return
+
+    # one update per distinct number of links gained or lost, which is a single update in the usual case
+    tags_by_link_count = defaultdict(list)
+    for tag_id, link_count in Counter(tag_id for _, tag_id in links).items():
+        tags_by_link_count[link_count].append(tag_id)
+    for link_count, tag_ids in tags_by_link_count.items():
+        TagCount.change(tag_ids, delta * link_count)
+
+    # the newsposts' pages show their tags, so they have changed along with them
+    newspost_ids = {newspost_id for newspost_id, _ in links}
+    if newspost_ids:
+        NewsPost.objects.filter(pk__in=newspost_ids).update(modified_at=timezone.now())
+        layout.invalidate()
+        for newspost_id in newspost_ids:
+            cache.invalidate_newspost(newspost_id)
+        transaction.on_commit(live.publish_front_page_changes)
+
+
+@receiver(pre_delete, sender=NewsPost)
+def uncount_deleted_newspost_tags(sender, instance, **kwargs):
+    # deleting a newspost removes its tag links without an m2m_changed signal
+    TagCount.change(list(instance.tags.values_list('pk', flat=True)), -1)
+
+
+@receiver(post_save, sender=NewsPost)
+def index_newspost(sender, instance, **kwargs):
+    if search.is_available():
+        search.index_newsposts([instance])
+
+
+@receiver(post_delete, sender=NewsPost)
+def unindex_newspost(sender, instance, **kwargs):
+    if search.is_available():
+        search.remove_newsposts([instance.pk])
+
+
+@receiver(post_save, sender=Advertisement)
+def refresh_advertisement_pages(sender, instance, **kwargs):
+    refresh_advertised_newsposts(list(instance.newsposts.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Advertisement)
+def remember_deleted_advertisement_placements(sender, instance, **kwargs):
+    # deleting an advertisement removes its placements without an m2m_changed signal
+    instance._placed_newspost_ids = list(instance.newsposts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Advertisement)
+def refresh_deleted_advertisement_pages(sender, instance, **kwargs):
+    refresh_advertised_newsposts(instance.__dict__.pop('_placed_newspost_ids', []))
+
+
+@receiver(m2m_changed, sender=Advertisement.newsposts.through)
+def refresh_placement_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Refresh the pages of the newsposts that an advertisement was placed on or taken off, from either side of the
+        relation
+    """
+    if action == 'pre_clear':
+        # a clear does not say what it takes off, so it is looked up before
+        if reverse:
+            instance._placed_advertisement_ids = list(instance.advertisements.values_list('pk', flat=True))
+        else:
+            instance._placed_newspost_ids = list(instance.newsposts.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        newspost_ids = [instance.pk]
+        if action == 'post_clear':
+            advertisement_ids = instance.__dict__.pop('_placed_advertisement_ids', [])
+        else:
+            advertisement_ids = list(pk_set)
+    else:
+        advertisement_ids = [instance.pk]
+        if action == 'post_clear':
+            newspost_ids = instance.__dict__.pop('_placed_newspost_ids', [])
+        else:
+            newspost_ids = list(pk_set)
+    # the advertisements are marked as changed too, which is how other processes notice new placements
+    Advertisement.objects.filter(pk__in=advertisement_ids).update(modified_at=timezone.now())
+    refresh_advertised_newsposts(newspost_ids)
+
+
+def refresh_advertised_newsposts(newspost_ids):
+    """ Drop the placement index, and mark the newsposts in `newspost_ids` as changed and drop their pages, since
+        they show a different advertisement
+    """
+    ads.invalidate()
+    transaction.on_commit(ads.invalidate)
+    if not newspost_ids:
+        return
+    NewsPost.objects.filter(pk__in=newspost_ids).update(modified_at=timezone.now())
+    page_keys = [
+        cache.newspost_page_key(newspost_id, auth_state)
+        for newspost_id in newspost_ids for auth_state in cache.AUTH_STATES
+    ]
+    cache.get_page_cache().delete_many(page_keys)
+    transaction.on_commit(lambda: cache.get_page_cache().delete_many(page_keys))
@@ -0,0 +1,14 @@
+// replace the "older stories" link of an archive with its next page instead of leaving the current page
+document.addEventListener('click', function (event) {
+	var link = event.target.closest('#archive-more');
+	if (!link) {
+		return;
+	}
+	event.preventDefault();
+	fetch(link.href).then(function (response) {
+		return response.text();
+	}).then(function (fragment) {
+		link.insertAdjacentHTML('beforebegin', fragment);
+		link.remove();
+	});
+});
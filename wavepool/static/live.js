@@ -0,0 +1,118 @@
+// apply the front page changes streamed by the server as they happen, so readers see new stories without reloading
+(function () {
+	var eventsUrl = document.currentScript.dataset.eventsUrl;
+	if (!eventsUrl || !window.EventSource) {
+		return;
+	}
+
+	function element(tag, className, text) {
+		var node = document.createElement(tag);
+		if (className) {
+			node.className = className;
+		}
+		if (text !== undefined) {
+			node.textContent = text;
+		}
+		return node;
+	}
+
+	function link(story) {
+		var anchor = element('a', '', story.title);
+		anchor.href = story.url;
+		return anchor;
+	}
+
+	function tags(story) {
+		var container = element('div', 'newspost-tags', 'Tags: ');
+		story.tags.forEach(function (tag, index) {
+			var anchor = element('a', '', tag.name);
+			anchor.href = tag.url;
+			container.appendChild(anchor);
+			if (index < story.tags.length - 1) {
+				container.appendChild(document.createTextNode(', '));
+			}
+		});
+		return container;
+	}
+
+	// the parts of a teaser shared by top stories and archived stories
+	function teaserParts(node, story) {
+		node.appendChild(element('span', 'pubdate', story.publish_date));
+		var title = element('div', 'frontpage-archive_link');
+		title.appendChild(link(story));
+		node.appendChild(title);
+		var teaser = element('div', 'newspost-teaser', story.teaser + ' ...');
+		teaser.dataset.story_id = story.id;
+		node.appendChild(teaser);
+		if (story.tags.length) {
+			node.appendChild(tags(story));
+		}
+		return node;
+	}
+
+	var source = new EventSource(eventsUrl);
+
+	source.addEventListener('cover_story', function (event) {
+		var story = JSON.parse(event.data);
+		var cover = document.getElementById('coverstory');
+		if (!cover || !story) {
+			return;
+		}
+		cover.dataset.newspostId = story.id;
+		var title = cover.querySelector('.title');
+		title.replaceChildren(element('span', 'pubdate', story.publish_date), document.createTextNode(' '), link(story));
+		var teaser = cover.querySelector('.newspost-teaser');
+		teaser.dataset.newspostId = story.id;
+		teaser.textContent = story.teaser + ' ...';
+		var oldTags = cover.querySelector('.newspost-tags');
+		if (oldTags) {
+			oldTags.remove();
+		}
+		if (story.tags.length) {
+			cover.appendChild(tags(story));
+		}
+	});
+
+	source.addEventListener('top_stories', function (event) {
+		var row = document.querySelector('#topstories > .row:nth-child(2)');
+		if (!row) {
+			return;
+		}
+		row.replaceChildren.apply(row, JSON.parse(event.data).map(function (story, index) {
+			var node = element('div', 'topstory');
+			node.dataset.newspostId = story.id;
+			node.dataset.topStoryPlacement = index + 1;
+			teaserParts(node, story);
+			node.appendChild(element('hr'));
+			return node;
+		}));
+	});
+
+	source.addEventListener('archive', function (event) {
+		var change = JSON.parse(event.data);
+		var archive = document.getElementById('archive-stories');
+		if (!archive) {
+			return;
+		}
+		change.removed.forEach(function (id) {
+			var node = archive.querySelector('.archived-story[data-archive-story-id="' + id + '"]');
+			if (node) {
+				node.nextElementSibling.remove();
+				node.remove();
+			}
+		});
+		change.added.forEach(function (story) {
+			var node = element('div', 'archived-story');
+			node.dataset.archiveStoryId = story.id;
+			teaserParts(node, story);
+			var before = archive.querySelectorAll('.archived-story')[story.position] || archive.querySelector('#archive-more');
+			archive.insertBefore(node, before);
+			archive.insertBefore(element('hr'), before);
+		});
+	});
+
+	// changes were missed while the connection was down
+	source.addEventListener('reload', function () {
+		window.location.reload();
+	});
+})();
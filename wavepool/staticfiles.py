@@ -0,0 +1,232 @@
+""" Static files built for production and served straight from STATIC_ROOT
+
+`python manage.py collectstatic` with CompressedManifestStaticFilesStorage names every file after a hash of its
+content, writes resized copies of the images listed in WAVEPOOL_RESPONSIVE_IMAGES with Pillow, and writes gzip and
+brotli compressed copies of the text files next to the hashed ones.
+
+StaticFilesMiddleware serves those files before the rest of the middleware runs. It sends the compressed copy the
+client accepts, and lets clients cache hashed files for a year since their content never changes under the same name.
+
+Until collectstatic has run, images are served at their original size.
+"""
+import asyncio
+import gzip
+import io
+import mimetypes
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import parse_etags
+from PIL import Image
+
+# pixel densities an image listed in WAVEPOOL_RESPONSIVE_IMAGES is resized for
+DENSITIES = (1, 2)
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.ico', '.txt', '.json', '.xml')
+# a compressed copy is only kept if it is at least this much smaller than the file
+MIN_COMPRESSION_RATIO = 0.95
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# files not named after their content may change with the next deployment
+MUTABLE_CACHE_CONTROL = 'public, max-age=60'
+
+
+def compressors():
+    """ Return (encoding, compress function) pairs for the encodings that can be produced, preferred first
+    """
+    return [
+        ('br', lambda content: brotli.compress(content, quality=11)),
+        ('gzip', lambda content: gzip.compress(content, compresslevel=9, mtime=0)),
+    ]
+
+
+def variant_name(name, width):
+    """ Name of the copy of image `name` resized to `width` pixels
+    """
+    root, extension = os.path.splitext(name)
+    return '{}-{}w{}'.format(root, width, extension)
+
+
+@lru_cache(maxsize=None)
+def image_variants(name):
+    """ Return (density, name) pairs for the resized copies of image `name` that exist, lowest density first
+    """
+    display_width = getattr(settings, 'WAVEPOOL_RESPONSIVE_IMAGES', {}).get(name)
+    if display_width is None:
+        return []
+    variants = [(density, variant_name(name, display_width * density)) for density in DENSITIES]
+    return [(density, variant) for density, variant in variants if staticfiles_storage.exists(variant)]
+
+
+@receiver(setting_changed)
+def reset_image_variants(setting, **kwargs):
+    if setting in ('STATIC_ROOT', 'STATICFILES_STORAGE', 'WAVEPOOL_RESPONSIVE_IMAGES'):
+        image_variants.cache_clear()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ Manifest storage that also writes resized images and compressed copies of text files
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        # the resized images are written first so that they get hashed names of their own
+        paths = dict(paths)
+        for name in self.resize_images(paths):
+            paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run, **options)
+        self.compress(self.hashed_files.values())
+
+    def resize_images(self, paths):
+        """ Write the resized copies of the images in WAVEPOOL_RESPONSIVE_IMAGES found among `paths`, returning their
+            names
+            An image is never enlarged, so densities it is too small for are left out.
+        """
+        written = []
+        for name, display_width in getattr(settings, 'WAVEPOOL_RESPONSIVE_IMAGES', {}).items():
+            if name not in paths:
+                continue
+            storage, path = paths[name]
+            with storage.open(path) as original:
+                image = Image.open(original)
+                image.load()
+            for density in DENSITIES:
+                width = display_width * density
+                if width >= image.width:
+                    continue
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                content = io.BytesIO()
+                resized.save(content, format=image.format, optimize=True)
+                written.append(self._replace(variant_name(name, width), content.getvalue()))
+        return written
+
+    def compress(self, names):
+        """ Write a compressed copy of each text file in `names` for every encoding that makes it smaller
+        """
+        encoders = compressors()
+        for name in names:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as original:
+                content = original.read()
+            for encoding, compress in encoders:
+                compressed = compress(content)
+                if len(compressed) < len(content) * MIN_COMPRESSION_RATIO:
+                    self._replace(name + ENCODING_SUFFIXES[encoding], compressed)
+
+    def _replace(self, name, content):
+        # saving over an existing file would save under another name instead
+        if self.exists(name):
+            self.delete(name)
+        return self._save(name, ContentFile(content))
+
+
+StaticFile = namedtuple('StaticFile', ['content_type', 'cache_control', 'etag', 'paths'])
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """ Serve the files in STATIC_ROOT, ahead of any middleware that would otherwise run for them
+        The files are indexed when the middleware is loaded, so files collected later are only served after a
+        restart. Not used when STATIC_ROOT has not been collected into.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed('STATIC_ROOT has not been collected into')
+        self.prefix = settings.STATIC_URL
+        self.files = index_static_files(root, set(getattr(staticfiles_storage, 'hashed_files', {}).values()))
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        """ Return the response for a static file request, or None if the request is not for a static file
+        """
+        if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        static_file = self.files.get(request.path_info[len(self.prefix):])
+        if static_file is None:
+            return None
+
+        encoding = next(
+            (encoding for encoding in accepted_encodings(request) if encoding in static_file.paths), None,
+        )
+        # each encoding is a representation of its own, and needs its own entity tag
+        etag = static_file.etag if encoding is None else '{}-{}"'.format(static_file.etag[:-1], encoding)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(static_file.paths[encoding], 'rb'), content_type=static_file.content_type)
+            # FileResponse names the file it was given, which would be the compressed copy
+            del response['Content-Disposition']
+            if encoding is not None:
+                response['Content-Encoding'] = encoding
+        response['Cache-Control'] = static_file.cache_control
+        response['ETag'] = etag
+        if len(static_file.paths) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+def index_static_files(root, hashed_names):
+    """ Map the name of each file under `root` to a StaticFile, with the paths of its compressed copies
+        Files named in `hashed_names` may be cached forever.
+    """
+    files = {}
+    suffixes = {suffix: encoding for encoding, suffix in ENCODING_SUFFIXES.items()}
+    # FileResponse only sends a Content-Length for files opened by absolute path
+    root = os.path.abspath(root)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if os.path.splitext(name)[1] in suffixes:
+                continue
+            paths = {None: path}
+            for suffix, encoding in suffixes.items():
+                if os.path.exists(path + suffix):
+                    paths[encoding] = path + suffix
+            stat = os.stat(path)
+            files[name] = StaticFile(
+                content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                cache_control=IMMUTABLE_CACHE_CONTROL if name in hashed_names else MUTABLE_CACHE_CONTROL,
+                etag='"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size),
+                paths=paths,
+            )
+    return files
+
+
+def accepted_encodings(request):
+    """ Return the content codings the request accepts, among those there are compressed copies for, preferred first
+    """
+    accepted = set()
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, parameters = coding.partition(';')
+        quality = parameters.strip().partition('=')[2]
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding in accepted]
@@ -0,0 +1,20 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from wavepool.staticfiles import image_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_src(name):
+    """ Render the src and srcset attributes of an img showing static image `name`
+        Browsers pick the resized copy matching their pixel density. The srcset is left out when collectstatic has not
+        written resized copies of the image.
+    """
+    variants = image_variants(name)
+    if not variants:
+        return format_html('src="{}"', static(name))
+    srcset = format_html_join(', ', '{} {}x', ((static(variant), density) for density, variant in variants))
+    return format_html('src="{}" srcset="{}"', static(variants[0][1]), srcset)
@@ -1,17 +1,60 @@
+import asyncio
+import datetime
+import gzip
+import json
+import os
 import random
 import string
+import tempfile
+import threading
+from contextlib import ExitStack, nullcontext
+from io import BytesIO, StringIO
+from unittest import mock
 
+from asgiref.sync import sync_to_async
 from bs4 import BeautifulSoup
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max, Min
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, resolve
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
 
-from wavepool.models import NewsPost, DIVESITE_SOURCE_NAMES
+from wavepool import (
+    admin as wavepool_admin, ads, benchmarks, cache, conditional, feeds, generating, importing, layout, live,
+    loadtest, metrics, pagination, readership, rendering, replication, routers, search, staticfiles, views,
+)
+from wavepool.counters import BufferedCounter
+from wavepool.models import (
+    Advertisement, NewsPost, NewsPostDeletion, NewsPostReadership, Tag, TagCount, DIVESITE_SOURCE_NAMES,
+)
 
 
 class TestBase(TestCase):
     fixtures = ['test_fixture', ]
 
+    def setUp(self):
+        # the front page layout, the advertisement index, the most read ranking, pending views, feeds and cached pages
+        # live in memory, so they outlive the rollback at the end of each test
+        layout.invalidate()
+        ads.invalidate()
+        feeds.invalidate()
+        readership.invalidate()
+        readership.views.discard()
+        cache.get_page_cache().clear()
+        # views left pending would otherwise be written when the test run exits, to whichever database is set up then
+        self.addCleanup(readership.views.discard)
+
     def _clean_text(self, text):
         return text.replace('\n', '').replace('\t', '')
 
@@ -30,6 +73,38 @@ class TestBase(TestCase):
         client = self.client
         client.login(username=username, password=password)
 
+    def assertWithinBudget(self, client, path, queries, max_bytes):
+        """ Request `path` with `client` and assert that it makes exactly `queries` database queries, listing the
+            ones it made if not, and renders at most `max_bytes` bytes
+        """
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        if len(captured) != queries:
+            self.fail('{} made {} queries, {} expected:\n{}'.format(path, len(captured), queries, '\n'.join(
+                '{}. {}'.format(number, query['sql']) for number, query in enumerate(captured, start=1)
+            )))
+        self.assertLessEqual(
+            len(response.content), max_bytes,
+            '{} rendered {} bytes, {} allowed'.format(path, len(response.content), max_bytes),
+        )
+        return response
+
+    def _create_newsposts(self, count):
+        """ Create `count` newsposts, several sharing each publish date
+        """
+        newsposts = []
+        for number in range(count):
+            newspost = NewsPost(
+                title='Generated newspost {}'.format(number),
+                body='<p>{}</p>'.format(self._random_string(200)),
+                source='https://www.retaildive.com/news/generated-newspost-{}/'.format(number),
+                publish_date=datetime.datetime(2019, 1, 1, tzinfo=timezone.utc) + datetime.timedelta(days=number // 3),
+            )
+            newspost.save()
+            newsposts.append(newspost)
+        return newsposts
+
 
 class NewsPostDetail(TestBase):
 
@@ -77,7 +152,8 @@ class NewsPostDetail(TestBase):
             self.assertIsNone(edit_link)
 
     def test_cms_user_sees_edit_link(self):
-        """ Verify that a logged in CMS user sees the edit link on newspost pages and that it links to the correct change form
+        """ Verify that a logged in CMS user sees the edit link on newspost pages and that it links to the correct
+            change form
         """
         self._login_user()
         newsposts = NewsPost.objects.all()
@@ -101,6 +177,32 @@ class NewsPostDetail(TestBase):
             newspost_divesite_name = newspost.source_divesite_name
             self.assertEqual(newspost_divesite_name, expected_display_name)
 
+    def test_divesite_resolved_from_hostname(self):
+        """ Verify that the dive site is stored from the source hostname, whatever its subdomain or case
+        """
+        sources = {
+            'https://retaildive.com/news/asdf/': 'retaildive',
+            'https://WWW.HRDIVE.COM/news/asdf/': 'hrdive',
+            'http://m.grocerydive.com/news/asdf/': 'grocerydive',
+            'https://www.retaildive.com.example.org/news/asdf/': '',
+            'https://www.industrydive.com/': '',
+        }
+        for source, expected_divesite in sources.items():
+            newspost = NewsPost(title='Man Bites Dog!', body='asdf', source=source)
+            newspost.save()
+            self.assertEqual(NewsPost.objects.get(pk=newspost.pk).divesite, expected_divesite)
+        self.assertEqual(newspost.source_divesite_name, 'Industry Dive')
+
+    def test_divesite_filter(self):
+        """ Verify that newsposts can be filtered by dive site in the database
+        """
+        for short_name in DIVESITE_SOURCE_NAMES:
+            expected_ids = {
+                newspost.pk for newspost in NewsPost.objects.all() if '.{}.com'.format(short_name) in newspost.source
+            }
+            divesite_ids = NewsPost.objects.filter(divesite=short_name).values_list('pk', flat=True)
+            self.assertEqual(set(divesite_ids), expected_ids)
+
     def test_newspost_unique_urls(self):
         """ Verify that each newspost has a unique URL accessed via NewsPost.url
         """
@@ -111,6 +213,1078 @@ class NewsPostDetail(TestBase):
             unique_newspost_urls.append(newspost.url)
 
 
+class NewsPostRendering(TestBase):
+
+    def test_body_sanitized(self):
+        """ Verify that scripts, event handlers and javascript links are stripped from the stored body HTML
+        """
+        newspost = NewsPost.objects.first()
+        newspost.body = (
+            '<p onclick="steal()">Hello <script>steal()</script><a href="javascript:steal()">there</a> '
+            '<a href="https://www.hrdive.com/" style="color: red">friend</a><font>!</font></p>'
+        )
+        newspost.save()
+        self.assertEqual(
+            NewsPost.objects.get(pk=newspost.pk).body_html,
+            '<p>Hello <a>there</a> <a href="https://www.hrdive.com/">friend</a>!</p>'
+        )
+
+    def test_markup_written_out_raw_removed(self):
+        """ Verify that comments, CDATA sections, declarations, doctypes and processing instructions, which would be
+            written out as they are and can hide markup from the sanitizer, are removed from the body HTML
+        """
+        hidden = '<img src=x onerror=alert(1)>'
+        bodies = {
+            'comment': '<p>a<!--><img src=x onerror=alert(1)>-->b</p>',
+            'cdata': '<p>a<![CDATA[>{}]]>b</p>'.format(hidden),
+            'declaration': '<p>a<![if >{}]>b</p>'.format(hidden),
+            'doctype': '<!DOCTYPE html><p>ab</p>',
+            'processing instruction': '<p>a<?php >{}?>b</p>'.format(hidden),
+        }
+        for node_type, body in bodies.items():
+            with self.subTest(node_type=node_type):
+                rendered = rendering.render_body(body)
+                self.assertNotIn('onerror', rendered.html)
+                self.assertNotIn('<!', rendered.html)
+                self.assertNotIn('<?', rendered.html)
+                self.assertIn('a', rendered.teaser)
+
+    def test_teaser_is_whole_words_of_text(self):
+        """ Verify that the teaser is plain text cut back to a whole word, never through a tag
+        """
+        newspost = NewsPost.objects.first()
+        newspost.body = '<p>{}</p><p><a href="https://www.hrdive.com/">{}</a></p>'.format('word ' * 28, 'linked ' * 10)
+        newspost.save()
+        self.assertEqual(newspost.teaser, 'word ' * 28 + 'linked')
+        self.assertLessEqual(len(newspost.teaser), rendering.TEASER_LENGTH)
+
+    def test_fixture_newsposts_rendered(self):
+        """ Verify that newsposts loaded from fixtures, which bypasses NewsPost.save, are rendered too
+        """
+        for newspost in NewsPost.objects.all():
+            self.assertEqual(newspost.body_html, rendering.sanitize_html(newspost.body))
+            self.assertNotIn('<', newspost.teaser)
+
+    def test_render_command_backfills(self):
+        """ Verify that the render_newsposts command fills in the rendered fields of existing rows, marks them as
+            changed and indexes their rendered bodies for search
+        """
+        backfilled = NewsPost.objects.first()
+        NewsPost.objects.update(body_html='', teaser='')
+        NewsPost.objects.filter(pk=backfilled.pk).update(body='<p>Backfilled zeppelins</p>')
+        rendered_after = timezone.now()
+        call_command('render_newsposts', batch_size=3, stdout=StringIO())
+        for newspost in NewsPost.objects.all():
+            self.assertEqual(newspost.body_html, rendering.sanitize_html(newspost.body))
+            self.assertEqual(newspost.teaser, rendering.make_teaser(newspost.body_html))
+            self.assertGreaterEqual(newspost.modified_at, rendered_after)
+        if search.is_available():
+            self.assertEqual([result.newspost.pk for result in search.search('zeppelins')], [backfilled.pk])
+
+    def test_front_page_does_not_load_bodies(self):
+        """ Verify that building the front page reads stored teasers rather than newspost bodies
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('')
+        for query in queries:
+            self.assertNotIn('"body"', query['sql'])
+            self.assertNotIn('"body_html"', query['sql'])
+
+
+class Tagging(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.hr, self.culture, self.retail = [Tag.objects.create(name=name) for name in ('HR', 'Culture', 'Retail')]
+
+    def _counts(self):
+        return dict(TagCount.objects.values_list('tag__name', 'count'))
+
+    def test_counts_follow_tag_changes(self):
+        """ Verify that tag counts are kept up to date whichever side of the relation tags are changed from
+        """
+        first, second, third = NewsPost.objects.all()[:3]
+        first.tags.add(self.hr, self.culture)
+        second.tags.add(self.hr)
+        self.retail.newsposts.add(first, second, third)
+        self.assertEqual(self._counts(), {'HR': 2, 'Culture': 1, 'Retail': 3})
+
+        first.tags.remove(self.culture, self.hr)
+        second.tags.remove(self.culture)
+        self.retail.newsposts.clear()
+        self.assertEqual(self._counts(), {'HR': 1, 'Culture': 0, 'Retail': 0})
+
+        second.tags.set([self.culture, self.retail])
+        third.tags.add(self.culture)
+        third.delete()
+        self.assertEqual(self._counts(), {'HR': 0, 'Culture': 1, 'Retail': 1})
+
+    def test_counts_match_rebuild(self):
+        """ Verify that the incrementally kept counts match a full recount
+        """
+        for number, newspost in enumerate(NewsPost.objects.all()):
+            newspost.tags.set([self.hr, self.culture, self.retail][:number % 4])
+        kept_counts = self._counts()
+        TagCount.objects.update(count=0)
+        TagCount.rebuild()
+        self.assertEqual(self._counts(), kept_counts)
+
+    def test_popular_tags(self):
+        """ Verify that the front page lists tags by how many newsposts carry them
+        """
+        newsposts = list(NewsPost.objects.all())
+        self.culture.newsposts.add(*newsposts[:5])
+        self.hr.newsposts.add(*newsposts[:2])
+        self.assertEqual(TagCount.popular(), [self.culture, self.hr])
+
+        front_page_html = BeautifulSoup(self.client.get('').content, 'html.parser')
+        popular_tags = [link.text for link in front_page_html.find('div', {'id': 'popular-tags'}).find_all('a')]
+        self.assertEqual(popular_tags, ['Culture', 'HR'])
+
+    def test_front_page_tag_queries_constant(self):
+        """ Verify that the front page loads tags with the same number of queries however many newsposts have tags
+        """
+        NewsPost.objects.first().tags.add(self.hr)
+        with CaptureQueriesContext(connection) as few_tagged:
+            self.client.get('')
+        for newspost in NewsPost.objects.all():
+            newspost.tags.add(self.hr, self.culture, self.retail)
+        # the most read ranking is kept for a while, so it is read again to compare like with like
+        readership.invalidate()
+        with CaptureQueriesContext(connection) as all_tagged:
+            front_page = self.client.get('')
+        self.assertEqual(len(few_tagged), len(all_tagged))
+        front_page_html = BeautifulSoup(front_page.content, 'html.parser')
+        self.assertEqual(len(front_page_html.find_all('div', {'class': 'newspost-tags'})), NewsPost.objects.count())
+
+    def test_newspost_page_tags(self):
+        """ Verify that a newspost page links to the archive of each of its tags and updates when they change
+        """
+        newspost = NewsPost.objects.first()
+        newspost.tags.add(self.hr, self.culture)
+        page = self.client.get(newspost.url)
+        page_html = BeautifulSoup(page.content, 'html.parser')
+        tag_links = page_html.find('div', {'id': 'newspost-topics'}).find_all('a')
+        self.assertEqual({link['href'] for link in tag_links}, {self.hr.url, self.culture.url})
+
+        newspost.tags.remove(self.hr)
+        changed_page = self.client.get(newspost.url, HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(changed_page.status_code, 200)
+        self.assertNotIn(self.hr.url, changed_page.content.decode())
+
+    def test_tag_archive(self):
+        """ Verify that a tag's archive lists only the newsposts carrying the tag, most recent first
+        """
+        tagged = list(NewsPost.objects.order_by('-publish_date', '-id')[:4])
+        self.culture.newsposts.add(*tagged)
+        page_html = BeautifulSoup(self.client.get(self.culture.url).content, 'html.parser')
+        archive_ids = [
+            int(div['data-archive-story-id']) for div in page_html.find_all('div', {'class': 'archived-story'})
+        ]
+        self.assertEqual(archive_ids, [newspost.pk for newspost in tagged])
+        self.assertEqual(self.client.get(reverse('tag_archive', args=['no-such-tag'])).status_code, 404)
+
+
+class Search(TestBase):
+
+    def _result_ids(self, query):
+        page = self.client.get(reverse('search'), {'q': query})
+        page_html = BeautifulSoup(page.content, 'html.parser')
+        return [int(div['data-newspost-id']) for div in page_html.find_all('div', {'class': 'search-result'})]
+
+    def test_search_body_text(self):
+        """ Verify that newsposts are found by words in their body text but not by the HTML around them
+        """
+        self.assertEqual(self._result_ids('peanut butter'), [1])
+        self.assertEqual(self._result_ids('h3'), [])
+
+    def test_title_match_ranked_first(self):
+        """ Verify that a newspost matching in its title ranks above ones only matching in their body
+        """
+        newspost = NewsPost.objects.get(pk=2)
+        newspost.title = 'Peanut prices climb'
+        newspost.save()
+        self.assertEqual(self._result_ids('peanut'), [2, 1])
+
+    def test_snippet_highlighted_and_escaped(self):
+        """ Verify that results highlight the matching words and escape any markup in the newspost text
+        """
+        newspost = NewsPost.objects.get(pk=2)
+        newspost.body = '<p>Marketers say &lt;script&gt; peanut &lt;/script&gt; ads work</p>'
+        newspost.save()
+        result = [result for result in search.search('peanut') if result.newspost.pk == 2][0]
+        self.assertIn('<mark>peanut</mark>', result.snippet)
+        self.assertNotIn('<script>', result.snippet)
+
+    def test_query_syntax_ignored(self):
+        """ Verify that FTS5 operators and punctuation typed by a reader do not break the search
+        """
+        for query in ['"', 'peanut AND', 'NEAR(peanut', '*', 'title:peanut', '-peanut']:
+            self.assertEqual(self.client.get(reverse('search'), {'q': query}).status_code, 200)
+        self.assertEqual(self._result_ids('pean'), [1])
+
+    def test_index_follows_saves_and_deletes(self):
+        """ Verify that the search index is kept in step as newsposts are edited and deleted
+        """
+        newspost = NewsPost.objects.get(pk=1)
+        newspost.body = '<p>Almond spread</p>'
+        newspost.save()
+        self.assertEqual(self._result_ids('peanut'), [])
+        self.assertEqual(self._result_ids('almond'), [1])
+        newspost.delete()
+        self.assertEqual(self._result_ids('almond'), [])
+
+    def test_scheduled_matches_do_not_use_up_the_limit(self):
+        """ Verify that newsposts scheduled after the given time are left out before results are limited, so the
+            best live matches are still returned
+        """
+        published_at = timezone.now()
+        for pk in (2, 3):
+            newspost = NewsPost.objects.get(pk=pk)
+            newspost.title = 'Peanut harvest {}'.format(pk)
+            newspost.publish_date = published_at + datetime.timedelta(days=1)
+            newspost.save()
+        results = search.search('peanut', limit=1, published_at=published_at)
+        self.assertEqual([result.newspost.pk for result in results], [1])
+
+    def test_rebuild_command(self):
+        """ Verify that the rebuild command indexes newsposts written without signals
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(search.FTS_TABLE))
+        self.assertEqual(self._result_ids('peanut'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._result_ids('peanut'), [1])
+
+
+class ImportNewsPosts(TestBase):
+
+    def _import(self, content, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'newsposts.json')
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.write(content)
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_newsposts', path, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_json_lines_created_and_updated_by_source(self):
+        """ Verify that imported rows update the newspost with the same source, create the rest and skip invalid rows
+        """
+        existing = NewsPost.objects.get(pk=1)
+        rows = [
+            {'title': 'Jif relabels jars', 'body': '<p>Soft g</p>', 'source': existing.source, 'tags': ['Brands']},
+            {
+                'title': 'Grocers test drones', 'body': '<p>Drone <script>x</script>deliveries</p>',
+                'source': 'https://www.grocerydive.com/news/drones/1/', 'publish_date': '2020-02-01',
+                'tags': ['Brands', 'Logistics'],
+            },
+            {'body': '<p>No title</p>', 'source': 'https://www.hrdive.com/news/untitled/2/'},
+            {'title': 'Menus go digital', 'body': '<p>QR codes</p>', 'source': 'https://www.restaurantdive.com/x/3/'},
+        ]
+        stdout, stderr = self._import('\n'.join(json.dumps(row) for row in rows), batch_size=2)
+
+        self.assertIn('Created 2 and updated 1 newsposts, rejected 1 rows', stdout)
+        self.assertIn('Row 3 rejected: title:', stderr)
+        self.assertEqual(NewsPost.objects.count(), 10)
+        existing.refresh_from_db()
+        self.assertEqual(existing.title, 'Jif relabels jars')
+        self.assertEqual(existing.teaser, 'Soft g')
+        created = NewsPost.objects.get(source=rows[1]['source'])
+        self.assertEqual(created.body_html, '<p>Drone deliveries</p>')
+        self.assertEqual(created.divesite, 'grocerydive')
+        self.assertEqual(created.publish_date, datetime.datetime(2020, 2, 1, tzinfo=timezone.utc))
+        self.assertEqual(sorted(created.tags.values_list('name', flat=True)), ['Brands', 'Logistics'])
+        self.assertEqual(TagCount.objects.get(tag__name='Brands').count, 2)
+        self.assertEqual([result.newspost.pk for result in search.search('drone')], [created.pk])
+
+    def test_json_array_read_in_chunks(self):
+        """ Verify that a JSON array is parsed the same when it arrives a few characters at a time
+        """
+        with open('fixtures/test_fixture.json', encoding='utf-8') as stream:
+            expected = json.load(stream)
+            stream.seek(0)
+            self.assertEqual(list(importing.read_rows(stream, chunk_size=7)), expected)
+        self.assertEqual(list(importing.read_rows(StringIO(' [ ] '))), [])
+
+    def test_json_lines_split_on_newlines_only(self):
+        """ Verify that line and paragraph separators, which JSON allows inside strings, do not split a row in the first
+            chunk of JSON Lines any more than in later ones
+        """
+        rows = [{'title': 'Line\u2028and\u2029paragraph\x85separators', 'body': '<p>b</p>'}, {'title': 'Next'}]
+        content = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows)
+        self.assertEqual(list(importing.read_rows(StringIO(content))), rows)
+        self.assertEqual(list(importing.read_rows(StringIO(content), chunk_size=3)), rows)
+
+    def test_fixture_reimport_updates_in_place(self):
+        """ Verify that importing the fixture again updates every newspost rather than creating duplicates
+        """
+        with open('fixtures/test_fixture.json', encoding='utf-8') as stream:
+            stdout, _ = self._import(stream.read())
+        self.assertIn('Created 0 and updated 8 newsposts', stdout)
+        self.assertEqual(NewsPost.objects.count(), 8)
+
+    def test_malformed_json_stops_import(self):
+        """ Verify that a file that is not valid JSON stops the import with the position of the broken row
+        """
+        with self.assertRaisesRegex(CommandError, 'Row 2'):
+            self._import('[{"title": "A", "body": "b", "source": "https://a.com/"}, {"title": ')
+        with self.assertRaisesRegex(CommandError, 'Line 2'):
+            self._import('{"title": "A", "body": "b", "source": "https://a.com/"}\n{"title"\n')
+
+    def test_reimport_without_publish_date_keeps_it(self):
+        """ Verify that a row without a publish_date leaves the publish date of the newspost it updates as it was, and
+            that a newspost created from one is published when it is imported
+        """
+        existing = NewsPost.objects.get(pk=1)
+        source = 'https://www.grocerydive.com/news/d/1/'
+        before = timezone.now()
+        self._import('\n'.join(json.dumps(row) for row in [
+            {'title': 'Jif relabels jars', 'body': '<p>Soft g</p>', 'source': existing.source},
+            {'title': 'Grocers test drones', 'body': '<p>Drones</p>', 'source': source},
+        ]))
+        updated = NewsPost.objects.get(pk=1)
+        self.assertEqual(updated.title, 'Jif relabels jars')
+        self.assertEqual(updated.publish_date, existing.publish_date)
+        created = NewsPost.objects.get(source=source)
+        self.assertTrue(before <= created.publish_date <= timezone.now())
+
+    def test_import_refreshes_feeds(self):
+        """ Verify that feeds built before an import list the imported newsposts afterwards
+        """
+        path = reverse('feed', args=['json'])
+        self.client.get(path)
+        self._import(json.dumps({
+            'title': 'Grocers test drones', 'body': '<p>Drones</p>', 'source': 'https://www.grocerydive.com/news/d/1/',
+        }))
+        self.assertEqual(self.client.get(path).json()['items'][0]['title'], 'Grocers test drones')
+
+    def test_rows_written_by_another_process_noticed(self):
+        """ Verify that newsposts written without this process hearing of it, as by an import run from the command
+            line, are picked up by the next front page request once the change check is due, along with the pages
+            and feeds built from them
+        """
+        newspost = NewsPost.objects.order_by(*pagination.RECENCY_ORDER).first()
+        self.client.get('')
+        self.client.get(newspost.url)
+        self.client.get(reverse('feed', args=['json']))
+        NewsPost.objects.filter(pk=newspost.pk).update(title='Imported elsewhere', modified_at=timezone.now())
+        self.assertNotIn(b'Imported elsewhere', self.client.get('').content)
+
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            self.assertIn(b'Imported elsewhere', self.client.get('').content)
+        self.assertIn(b'Imported elsewhere', self.client.get(newspost.url).content)
+        feed_items = self.client.get(reverse('feed', args=['json'])).json()['items']
+        self.assertEqual(feed_items[0]['title'], 'Imported elsewhere')
+
+
+class GenerateNewsPosts(TestBase):
+
+    def test_generated_newsposts(self):
+        """ Verify that generated newsposts are added after the existing ones, with rendered bodies, a dive site, and
+            tags that are counted and searchable
+        """
+        existing = NewsPost.objects.count()
+        stdout = StringIO()
+        call_command('generate_newsposts', 200, '--batch-size', 64, stdout=stdout)
+        self.assertIn('Generated 200 newsposts', stdout.getvalue())
+
+        generated = NewsPost.objects.order_by('pk')[existing:]
+        self.assertEqual(len(generated), 200)
+        self.assertEqual(len({newspost.source for newspost in generated}), 200)
+        for newspost in generated:
+            self.assertIn(newspost.divesite, DIVESITE_SOURCE_NAMES)
+            self.assertEqual(newspost.body_html, rendering.sanitize_html(newspost.body))
+            self.assertLessEqual(len(newspost.body), NewsPost._meta.get_field('body').max_length)
+            self.assertLessEqual(newspost.publish_date, timezone.now())
+        for tag in Tag.objects.filter(name__in=generating.TAG_NAMES):
+            self.assertEqual(tag.newspost_count.count, tag.newsposts.count())
+        self.assertTrue(search.search(generated[0].title.split()[-1]))
+
+    def test_deleted_ids_not_reused(self):
+        """ Verify that generated newsposts do not take the ids of deleted newsposts, which cursors and cached pages
+            may still refer to
+        """
+        newest = NewsPost.objects.order_by('pk').last()
+        deleted_id = newest.pk
+        newest.delete()
+        for _ in generating.generate(3):
+            pass
+        self.assertFalse(NewsPost.objects.filter(pk=deleted_id).exists())
+        self.assertEqual(NewsPost.objects.filter(pk__gt=deleted_id).count(), 3)
+
+    def test_same_seed_same_newsposts(self):
+        """ Verify that generating with the same seed gives the same newsposts
+        """
+        def titles(seed):
+            return [newspost.title for newspost in generating.make_newsposts(50, seed=seed)]
+
+        self.assertEqual(titles(3), titles(3))
+        self.assertNotEqual(titles(3), titles(4))
+
+
+class NewsPostPageCache(TestBase):
+
+    def test_cached_page_served_without_queries(self):
+        """ Verify that a newspost page is rendered once and then served from the page cache
+        """
+        newspost = NewsPost.objects.first()
+        first_page = self.client.get(newspost.url)
+        hits = cache.get_page_cache().stats()['hits']
+        with self.assertNumQueries(0):
+            second_page = self.client.get(newspost.url)
+        self.assertEqual(first_page.content, second_page.content)
+        self.assertEqual(cache.get_page_cache().stats()['hits'], hits + 1)
+
+    def test_save_invalidates_cached_page(self):
+        """ Verify that saving a newspost drops its cached page
+        """
+        newspost = NewsPost.objects.first()
+        self.client.get(newspost.url)
+        newspost.title = 'Man Bites Dog!'
+        newspost.save()
+        page_html = BeautifulSoup(self.client.get(newspost.url).content, 'html.parser')
+        self.assertEqual(page_html.find('h1', {'id': 'newspost-title'}).contents[0], 'Man Bites Dog!')
+
+    def test_delete_invalidates_cached_page(self):
+        """ Verify that a deleted newspost is no longer served from the page cache
+        """
+        newspost = NewsPost.objects.first()
+        newspost_url = newspost.url
+        self.client.get(newspost_url)
+        newspost.delete()
+        self.assertEqual(self.client.get(newspost_url).status_code, 404)
+
+    def test_page_rendered_before_save_not_cached(self):
+        """ Verify that a page rendered from a newspost that is saved while it renders, whose invalidation runs before
+            the page is cached, is not served after the save
+        """
+        newspost = NewsPost.objects.first()
+        render_newspost = views._render_newspost
+
+        def render_during_save(request, rendered_newspost):
+            content = render_newspost(request, rendered_newspost)
+            NewsPost.objects.get(pk=newspost.pk).save()
+            return content
+
+        with mock.patch.object(views, '_render_newspost', render_during_save):
+            self.client.get(newspost.url)
+        self.assertIsNone(cache.get_page_cache().get(cache.newspost_page_key(newspost.pk, 'public')))
+
+    def test_newspost_id_out_of_range_not_found(self):
+        """ Verify that a newspost page for an id beyond what the database holds is not found rather than an error
+        """
+        for newspost_id in (0, 2 ** 63, 99999999999999999999999):
+            self.assertEqual(self.client.get('/news/{}/'.format(newspost_id)).status_code, 404)
+
+    def test_cms_user_page_cached_separately(self):
+        """ Verify that a page cached for a visitor is not served to a CMS user, who also sees the edit link
+        """
+        newspost = NewsPost.objects.first()
+        self.client.get(newspost.url)
+        self._login_user()
+        page_html = BeautifulSoup(self.client.get(newspost.url).content, 'html.parser')
+        self.assertIsNotNone(page_html.find('a', {'id': 'edit-link'}))
+
+    @override_settings(WAVEPOOL_PAGE_CACHE={'BACKEND': 'wavepool.cache.LRUPageCache', 'OPTIONS': {'max_entries': 2}})
+    def test_lru_evicts_least_recently_used(self):
+        """ Verify that the in-process page cache stays within its size and evicts the least recently used page
+        """
+        first, second, third = NewsPost.objects.all()[:3]
+        self.client.get(first.url)
+        self.client.get(second.url)
+        self.client.get(first.url)
+        self.client.get(third.url)
+
+        page_cache = cache.get_page_cache()
+        self.assertEqual(page_cache.stats()['evictions'], 1)
+        self.assertEqual(page_cache.stats()['entries'], 2)
+        self.assertIsNone(page_cache.get(cache.newspost_page_key(second.pk, 'public')))
+        self.assertIsNotNone(page_cache.get(cache.newspost_page_key(first.pk, 'public')))
+
+    @override_settings(
+        CACHES={'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'}},
+        WAVEPOOL_PAGE_CACHE={'BACKEND': 'wavepool.cache.SharedPageCache', 'OPTIONS': {'alias': 'pages'}},
+    )
+    def test_shared_backend(self):
+        """ Verify that pages can be cached in a shared django cache and are invalidated there on save
+        """
+        newspost = NewsPost.objects.first()
+        self.client.get(newspost.url)
+        with self.assertNumQueries(0):
+            self.client.get(newspost.url)
+        newspost.save()
+        self.client.get(newspost.url)
+        self.assertEqual(cache.get_page_cache().stats(), {'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_stats_require_cms_user(self):
+        """ Verify that page cache counters are only shown to CMS users
+        """
+        stats_url = reverse('page_cache_stats')
+        self.assertEqual(self.client.get(stats_url).status_code, 302)
+        self._login_user()
+        self.assertEqual(
+            set(self.client.get(stats_url).json()), {'hits', 'misses', 'evictions', 'entries', 'max_entries'},
+        )
+
+
+class Advertisements(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        # impressions left pending would be written once the test database is gone
+        self.addCleanup(ads.impressions.flush)
+
+    def _logo(self):
+        logo = BytesIO()
+        Image.new('RGB', (20, 10), 'yellow').save(logo, 'PNG')
+        return SimpleUploadedFile('banana.png', logo.getvalue(), content_type='image/png')
+
+    def _create_advertisement(self, text, newspost_ids):
+        advertisement = Advertisement.objects.create(
+            logo=self._logo(), url='https://www.example.com/bananas/', text=text,
+        )
+        advertisement.newsposts.set(newspost_ids)
+        return advertisement
+
+    def _sponsorship(self, newspost_id, client=None):
+        page = (client or self.client).get(reverse('newspost_detail', args=[newspost_id]))
+        return BeautifulSoup(page.content, 'html.parser').find('div', {'id': 'newspost-sponsorship'})
+
+    def test_advertisement_shown_on_its_newsposts(self):
+        """ Verify that a newspost page shows the advertisement placed on it, or the house ad if there is none, and
+            that looking the advertisement up makes no query once the placement index is built
+        """
+        advertisement = self._create_advertisement('Bananas, delivered', [1, 2])
+        sponsorship = self._sponsorship(1)
+        self.assertEqual(sponsorship.find('span', {'id': 'sponsor-text'}).text, 'Bananas, delivered')
+        self.assertEqual(sponsorship.a['href'], 'https://www.example.com/bananas/')
+        self.assertEqual(sponsorship.img['src'], advertisement.logo.url)
+        self.assertIn('Fast Banana', self._sponsorship(3).text)
+
+        cache.get_page_cache().clear()
+        # the newspost, its tags and its modified_at once the page is cached
+        with self.assertNumQueries(3):
+            self.client.get(reverse('newspost_detail', args=[2]))
+
+    def test_placement_changes_refresh_pages(self):
+        """ Verify that placing, editing and deleting an advertisement changes the pages of its newsposts
+        """
+        advertisement = self._create_advertisement('Bananas, delivered', [1])
+        self.assertIn('Fast Banana', self._sponsorship(3).text)
+        advertisement.newsposts.add(3)
+        self.assertIn('Bananas, delivered', self._sponsorship(3).text)
+        NewsPost.objects.get(pk=3).advertisements.remove(advertisement)
+        self.assertIn('Fast Banana', self._sponsorship(3).text)
+
+        advertisement.text = 'Bananas, delivered faster'
+        advertisement.save()
+        self.assertIn('Bananas, delivered faster', self._sponsorship(1).text)
+        advertisement.delete()
+        self.assertIn('Fast Banana', self._sponsorship(1).text)
+
+    def test_advertisements_changed_elsewhere_noticed(self):
+        """ Verify that an advertisement edited by another process is shown once the change check is due, on pages
+            rendered afterwards and on the cached pages of newsposts found to have changed
+        """
+        advertisement = self._create_advertisement('Bananas, delivered', [1, 2])
+        self._sponsorship(1)
+        Advertisement.objects.filter(pk=advertisement.pk).update(text='Bananas, faster', modified_at=timezone.now())
+        cache.get_page_cache().clear()
+        self.assertIn('Bananas, delivered', self._sponsorship(1).text)
+
+        cache.get_page_cache().clear()
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            self.assertIn('Bananas, faster', self._sponsorship(1).text)
+            self.assertIn('Bananas, faster', self._sponsorship(2).text)
+
+        # another process placing the advertisement marks the newspost as changed, which drops the index as well
+        self.client.get('')
+        Advertisement.newsposts.through.objects.create(advertisement=advertisement, newspost_id=3)
+        NewsPost.objects.filter(pk=3).update(modified_at=timezone.now())
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0), mock.patch.object(ads, '_check_due') as check_due:
+            check_due.return_value = False
+            self.client.get('')
+            self.assertIn('Bananas, faster', self._sponsorship(3).text)
+
+    def test_impressions_written_in_batches(self):
+        """ Verify that visitors' page views are counted in memory and only written when the buffer is flushed
+        """
+        advertisement = self._create_advertisement('Bananas, delivered', [1])
+        for _ in range(3):
+            self._sponsorship(1)
+        self._sponsorship(2)
+        self._login_user()
+        self._sponsorship(1)
+        advertisement.refresh_from_db()
+        self.assertEqual(advertisement.impressions, 0)
+        self.assertEqual(ads.impressions.pending(), {advertisement.pk: 3})
+
+        ads.impressions.flush()
+        advertisement.refresh_from_db()
+        self.assertEqual(advertisement.impressions, 3)
+        self.assertEqual(ads.impressions.pending(), {})
+
+    def test_advertisement_created_in_cms(self):
+        """ Verify that a CMS user can create an advertisement with a logo and place it on several newsposts, and that
+            a logo that is not an image is refused
+        """
+        self._login_user()
+        response = self.client.post(reverse('admin:wavepool_advertisement_add'), {
+            'logo': self._logo(),
+            'url': 'https://www.example.com/bananas/',
+            'text': 'Bananas, delivered',
+            'newsposts': '2,3',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(reverse('admin:wavepool_advertisement_changelist')).status_code, 200)
+        public_client = Client()
+        for newspost_id in (2, 3):
+            self.assertIn('Bananas, delivered', self._sponsorship(newspost_id, public_client).text)
+
+        response = self.client.post(reverse('admin:wavepool_advertisement_add'), {
+            'logo': SimpleUploadedFile('apple.png', b'not an image', content_type='image/png'),
+            'url': 'https://www.example.com/apples/',
+            'text': 'Apples, delivered',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Advertisement.objects.filter(text='Apples, delivered').exists())
+
+
+class Readership(TestBase):
+
+    def _view(self, newspost_id, times=1):
+        for _ in range(times):
+            self.client.get(reverse('newspost_detail', args=[newspost_id]))
+
+    def _flush_at(self, written_at):
+        with mock.patch('django.utils.timezone.now', return_value=written_at):
+            readership.views.flush()
+
+    def test_views_counted_in_memory_and_upserted(self):
+        """ Verify that visitors' page views are only written when the buffer is flushed, with a single upsert that
+            adds to the views already written and skips deleted newsposts
+        """
+        self._view(1, 3)
+        self._view(2)
+        self._view(3)
+        NewsPost.objects.get(pk=3).delete()
+        self.assertFalse(NewsPostReadership.objects.exists())
+        self.assertEqual(readership.views.pending(), {1: 3, 2: 1, 3: 1})
+
+        with CaptureQueriesContext(connection) as queries:
+            readership.views.flush()
+        self.assertEqual(len([query for query in queries if 'INSERT' in query['sql']]), 1)
+        self._view(1, 2)
+        readership.views.flush()
+        self.assertEqual(dict(NewsPostReadership.objects.values_list('newspost_id', 'views')), {1: 5, 2: 1})
+
+        self._login_user()
+        self._view(1)
+        self.assertEqual(readership.views.pending(), {})
+
+    def test_views_flushed_without_further_traffic(self):
+        """ Verify that pending occurrences are written once the oldest has waited long enough, even if nothing else
+            is recorded to notice it
+        """
+        written = threading.Event()
+        counter = BufferedCounter(lambda counts: written.set(), threshold=100, seconds=0.05)
+        with mock.patch('wavepool.counters.write_transaction', nullcontext), \
+                mock.patch('wavepool.counters.connections.close_all'):
+            counter.record(1)
+            self.assertTrue(written.wait(5))
+        self.assertEqual(counter.pending(), {})
+
+    def test_most_read_ranked_by_decayed_views(self):
+        """ Verify that views count for half as much towards the most read ranking each half life after they were
+            written
+        """
+        written_at = timezone.now()
+        self._view(1, 4)
+        self._flush_at(written_at - datetime.timedelta(hours=readership.HALF_LIFE_HOURS))
+        self._view(2, 3)
+        self._flush_at(written_at)
+        self._view(3)
+        self._flush_at(written_at)
+        self.assertEqual([newspost.pk for newspost in readership.get_most_read().newsposts], [2, 1, 3])
+
+        self._view(3, 3)
+        self._flush_at(written_at)
+        self.assertEqual([newspost.pk for newspost in readership.get_most_read().newsposts], [3, 2, 1])
+
+    def test_front_page_shows_most_read(self):
+        """ Verify that the front page lists the most read newsposts and is marked as changed when they change
+        """
+        self._view(5, 2)
+        self._view(6)
+        readership.views.flush()
+        page = self.client.get(reverse('home'))
+        most_read = BeautifulSoup(page.content, 'html.parser').find('div', {'id': 'most-read'})
+        self.assertEqual([int(item['data-newspost-id']) for item in most_read.find_all('li')], [5, 6])
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=page['ETag']).status_code, 304)
+
+        self._view(6, 2)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(seconds=1)):
+            readership.views.flush()
+            self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+
+    def test_most_read_follows_newspost_changes(self):
+        """ Verify that the most read ranking shows a newspost as it is after it is retitled, and leaves it out once it
+            is rescheduled or deleted, here or in another process
+        """
+        self._view(5, 2)
+        self._view(6)
+        readership.views.flush()
+        self.client.get(reverse('home'))
+
+        newspost = NewsPost.objects.get(pk=5)
+        newspost.title = 'Most read, retitled'
+        newspost.save()
+        self.assertContains(self.client.get(reverse('home')), 'Most read, retitled')
+        newspost.publish_date = timezone.now() + datetime.timedelta(days=1)
+        newspost.save()
+        self.assertEqual([item.pk for item in readership.get_most_read().newsposts], [6])
+
+        NewsPost.objects.filter(pk=6).update(title='Retitled elsewhere', modified_at=timezone.now())
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            self.assertContains(self.client.get(reverse('home')), 'Retitled elsewhere')
+        NewsPost.objects.get(pk=6).delete()
+        self.assertEqual(readership.get_most_read().newsposts, [])
+
+
+class Feeds(TestBase):
+
+    def _feed_ids(self, path):
+        entries = BeautifulSoup(self.client.get(path).content, 'html.parser').find_all('entry')
+        return [int(entry.find('id').text.rstrip('/').rsplit('/', 1)[1]) for entry in entries]
+
+    def test_feeds_list_most_recent_newsposts(self):
+        """ Verify that the site's feed lists the most recent live newsposts up to FEED_ITEM_COUNT, and that a dive
+            site's feed only lists the dive site's newsposts
+        """
+        NewsPost.objects.filter(pk=2).update(publish_date=timezone.now() + datetime.timedelta(days=1))
+        live_ids = list(
+            NewsPost.objects.filter(publish_date__lte=timezone.now()).order_by(*pagination.RECENCY_ORDER)
+            .values_list('pk', flat=True)
+        )
+        with mock.patch.object(feeds, 'FEED_ITEM_COUNT', 3):
+            self.assertEqual(self._feed_ids(reverse('feed', args=['atom'])), live_ids[:3])
+            json_feed = self.client.get(reverse('feed', args=['json'])).json()
+        self.assertEqual(json_feed['version'], feeds.JSON_FEED_VERSION)
+        self.assertEqual([item['url'] for item in json_feed['items']], [
+            'http://testserver/news/{}/'.format(newspost_id) for newspost_id in live_ids[:3]
+        ])
+
+        for short_name in DIVESITE_SOURCE_NAMES:
+            expected_ids = list(
+                NewsPost.objects.filter(divesite=short_name, publish_date__lte=timezone.now())
+                .order_by(*pagination.RECENCY_ORDER).values_list('pk', flat=True)
+            )
+            self.assertEqual(self._feed_ids(reverse('divesite_feed', args=[short_name, 'atom'])), expected_ids)
+        self.assertEqual(self.client.get(reverse('divesite_feed', args=['nosuchdive', 'atom'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('feed', args=['rss'])).status_code, 404)
+
+    def test_feed_served_compressed_without_queries(self):
+        """ Verify that a built feed is served from memory, compressed for clients accepting gzip, and answered with
+            304 for a client holding the same representation
+        """
+        path = reverse('feed', args=['atom'])
+        plain = self.client.get(path)
+        with self.assertNumQueries(0):
+            compressed = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=compressed['ETag']).status_code, 200)
+
+    def test_feed_dated_by_its_newsposts(self):
+        """ Verify that a feed's Last-Modified is when its newsposts last changed, so it holds across rebuilds, and
+            that deleting a newspost it lists moves it on
+        """
+        path = reverse('divesite_feed', args=['hrdive', 'atom'])
+        # a day back, so that a deletion now is dated later to the second
+        NewsPost.objects.filter(divesite='hrdive').update(modified_at=timezone.now() - datetime.timedelta(days=1))
+        newspost = NewsPost.objects.get(divesite='hrdive')
+        last_modified = self.client.get(path)['Last-Modified']
+        self.assertEqual(last_modified, http_date(max(newspost.publish_date, newspost.modified_at).timestamp()))
+
+        feeds.invalidate()
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        newspost.delete()
+        self.assertEqual(self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+        # a feed without newsposts has nothing to date it by
+        NewsPost.objects.filter(divesite='ciodive').update(divesite='')
+        empty = self.client.get(reverse('divesite_feed', args=['ciodive', 'json']))
+        self.assertNotIn('Last-Modified', empty)
+        self.assertEqual(
+            self.client.get(reverse('divesite_feed', args=['ciodive', 'json']), HTTP_IF_NONE_MATCH=empty['ETag'])
+            .status_code, 304,
+        )
+
+    def test_feed_notices_newsposts_changed_elsewhere(self):
+        """ Verify that a feed notices newsposts written by another process once the change check is due, without a
+            front page request in between
+        """
+        path = reverse('feed', args=['json'])
+        newspost = NewsPost.objects.order_by(*pagination.RECENCY_ORDER).first()
+        self.client.get(path)
+        NewsPost.objects.filter(pk=newspost.pk).update(title='Imported elsewhere', modified_at=timezone.now())
+        self.assertNotEqual(self.client.get(path).json()['items'][0]['title'], 'Imported elsewhere')
+
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            self.assertEqual(self.client.get(path).json()['items'][0]['title'], 'Imported elsewhere')
+
+    def test_feeds_rebuilt_when_their_newsposts_change(self):
+        """ Verify that saving a newspost rebuilds the feeds it belongs to and leaves other dive sites' feeds alone
+        """
+        newspost = NewsPost.objects.get(divesite='retaildive')
+        retail_path = reverse('divesite_feed', args=['retaildive', 'json'])
+        hr_path = reverse('divesite_feed', args=['hrdive', 'json'])
+        site_path = reverse('feed', args=['json'])
+        etags = {path: self.client.get(path)['ETag'] for path in (retail_path, hr_path, site_path)}
+
+        newspost.title = 'Grocers schedule drone deliveries'
+        newspost.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(hr_path, HTTP_IF_NONE_MATCH=etags[hr_path]).status_code, 304)
+        for path in (retail_path, site_path):
+            page = self.client.get(path, HTTP_IF_NONE_MATCH=etags[path])
+            self.assertEqual(page.status_code, 200)
+            self.assertIn('Grocers schedule drone deliveries', [item['title'] for item in page.json()['items']])
+
+        newspost.delete()
+        self.assertNotIn(newspost.title, [item['title'] for item in self.client.get(site_path).json()['items']])
+
+
+class AsyncViews(TestBase):
+
+    async def test_cached_pages_served_on_event_loop(self):
+        """ Verify that under ASGI the front page and a cached newspost page are served without handing work to a
+            thread
+        """
+        newspost_url = await sync_to_async(lambda: NewsPost.objects.first().url)()
+        await self.async_client.get('/')
+        first_page = await self.async_client.get(newspost_url)
+
+        view_threads = []
+        not_modified = conditional.not_modified
+
+        def record_thread(*args):
+            view_threads.append(threading.get_ident())
+            return not_modified(*args)
+
+        with mock.patch('wavepool.conditional.not_modified', side_effect=record_thread), \
+                mock.patch('wavepool.views.sync_to_async', side_effect=AssertionError), \
+                mock.patch('wavepool.layout.sync_to_async', side_effect=AssertionError):
+            front_page = await self.async_client.get('/')
+            second_page = await self.async_client.get(newspost_url)
+        self.assertEqual(front_page.status_code, 200)
+        self.assertEqual(first_page.content, second_page.content)
+        self.assertEqual(view_threads, [threading.get_ident()] * 2)
+
+    async def test_live_updates_only_where_served(self):
+        """ Verify that the front page only opens the live event stream when it is served through with_events, and
+            not under WSGI or plain ASGI, where the stream's URL is not found
+        """
+        def live_script(response):
+            return BeautifulSoup(response.content, 'html.parser').find('script', {'data-events-url': True})
+
+        self.assertIsNone(live_script(await sync_to_async(self.client.get)('/')))
+        self.assertIsNone(live_script(await self.async_client.get('/')))
+
+        scopes = []
+
+        async def application(scope, receive, send):
+            scopes.append(scope)
+
+        await live.with_events(application)({'type': 'http', 'path': '/'}, None, None)
+        request = AsyncRequestFactory().get('/')
+        request.scope.update(scopes[0])
+        served = live_script(await views.front_page(request))
+        self.assertEqual(served['data-events-url'], live.EVENTS_PATH)
+
+    async def test_cms_user_sees_edit_link(self):
+        """ Verify that under ASGI a CMS user is recognized from their session and sees the edit link
+        """
+        newspost_url = await sync_to_async(lambda: NewsPost.objects.first().url)()
+        user = await sync_to_async(User.objects.create_superuser)('async', 'async@industrydive.com', 'async')
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.get(newspost_url)
+        page_html = BeautifulSoup(response.content, 'html.parser')
+        self.assertIsNotNone(page_html.find('a', {'id': 'edit-link'}))
+
+
+class RequestMetrics(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def _sample(self, exposition, name, view):
+        prefix = '{}{{view="{}"}} '.format(name, view)
+        values = [line[len(prefix):] for line in exposition.splitlines() if line.startswith(prefix)]
+        self.assertEqual(len(values), 1, exposition)
+        return float(values[0])
+
+    def test_view_metrics_exported(self):
+        """ Verify that the metrics endpoint reports the requests, queries and response bytes of each view
+        """
+        newspost = NewsPost.objects.first()
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(newspost.url)
+        # the query log is reset at the start of each request
+        query_count = len(queries)
+        self.client.get(newspost.url)
+        self.client.get(reverse('home'))
+
+        self._login_user()
+        response = self.client.get(reverse('request_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        exposition = response.content.decode()
+        detail_view, front_page_view = 'wavepool.views.newspost_detail', 'wavepool.views.front_page'
+        self.assertEqual(self._sample(exposition, 'wavepool_request_duration_seconds_count', detail_view), 2)
+        self.assertEqual(self._sample(exposition, 'wavepool_request_duration_seconds_count', front_page_view), 1)
+        # the second request was served from the page cache
+        self.assertEqual(self._sample(exposition, 'wavepool_request_db_queries_sum', detail_view), query_count)
+        page_bytes = self._sample(exposition, 'wavepool_response_size_bytes_sum', detail_view)
+        self.assertEqual(page_bytes, 2 * len(page.content))
+        self.assertGreater(self._sample(exposition, 'wavepool_request_template_duration_seconds_sum', detail_view), 0)
+        self.assertIn(
+            'wavepool_request_db_queries_bucket{{view="{}",le="+Inf"}} 2'.format(detail_view), exposition.splitlines(),
+        )
+
+    def test_metrics_staff_only(self):
+        """ Verify that the metrics endpoint is only shown to CMS users
+        """
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 302)
+
+    async def test_async_view_queries_counted(self):
+        """ Verify that queries an async view makes from a thread count towards its request
+        """
+        newspost_url = await sync_to_async(lambda: NewsPost.objects.first().url)()
+        await self.async_client.get(newspost_url)
+        exposition = metrics.registry.render()
+        self.assertGreater(
+            self._sample(exposition, 'wavepool_request_db_queries_sum', 'wavepool.views.newspost_detail'), 0,
+        )
+
+    @override_settings(WAVEPOOL_QUERY_BUDGET=0)
+    def test_request_over_budget_logged(self):
+        """ Verify that a request making more queries than the budget allows is logged
+        """
+        newspost = NewsPost.objects.first()
+        with self.assertLogs('wavepool.metrics', 'WARNING') as logs:
+            self.client.get(newspost.url)
+        self.assertIn(newspost.url, logs.output[0])
+        self.assertIn('wavepool.views.newspost_detail', logs.output[0])
+
+
+class ConditionalGet(TestBase):
+
+    def test_front_page_not_modified(self):
+        """ Verify that the front page answers a matching If-None-Match or If-Modified-Since with a 304
+        """
+        front_page = self.client.get('')
+        with self.assertNumQueries(0):
+            etag_response = self.client.get('', HTTP_IF_NONE_MATCH=front_page['ETag'])
+            date_response = self.client.get('', HTTP_IF_MODIFIED_SINCE=front_page['Last-Modified'])
+        self.assertEqual(etag_response.status_code, 304)
+        self.assertEqual(date_response.status_code, 304)
+        self.assertEqual(etag_response['ETag'], front_page['ETag'])
+
+    def test_front_page_modified_by_save(self):
+        """ Verify that saving any newspost changes the front page validators
+        """
+        front_page = self.client.get('')
+        NewsPost.objects.first().save()
+        response = self.client.get('', HTTP_IF_NONE_MATCH=front_page['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], front_page['ETag'])
+
+    def test_front_page_modified_by_delete(self):
+        """ Verify that deleting a newspost changes the front page validators
+        """
+        front_page = self.client.get('')
+        NewsPost.objects.first().delete()
+        response = self.client.get('', HTTP_IF_NONE_MATCH=front_page['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], front_page['ETag'])
+
+    def test_delete_elsewhere_noticed(self):
+        """ Verify that a newspost deleted by another process, which leaves this process' layout and cached pages in
+            place, is taken off the front page and its page, and changes the front page validators, once the change
+            check is due
+        """
+        newspost = NewsPost.objects.order_by(*pagination.RECENCY_ORDER).first()
+        path = newspost.url
+        front_page = self.client.get('')
+        self.client.get(path)
+        with mock.patch.object(layout, 'invalidate'), mock.patch.object(cache, 'invalidate_newspost'):
+            newspost.delete()
+        self.assertEqual(self.client.get(path).status_code, 200)
+
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            response = self.client.get('', HTTP_IF_NONE_MATCH=front_page['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], front_page['ETag'])
+        self.assertNotContains(response, newspost.title)
+        self.assertEqual(self.client.get(path).status_code, 404)
+
+    def test_deletions_kept_per_divesite(self):
+        """ Verify that deletions are recorded as one row per dive site holding the latest, rather than a row each
+        """
+        for newspost in NewsPost.objects.filter(divesite='hrdive'):
+            newspost.delete()
+        first_deleted_at = NewsPostDeletion.objects.get(divesite='hrdive').deleted_at
+        self._create_newsposts(2)
+        for newspost in NewsPost.objects.filter(divesite='retaildive'):
+            newspost.delete()
+        self.assertEqual(NewsPostDeletion.objects.filter(divesite='retaildive').count(), 1)
+        self.assertEqual(NewsPostDeletion.objects.count(), 2)
+        self.assertGreater(NewsPostDeletion.objects.get(divesite='retaildive').deleted_at, first_deleted_at)
+
+    def test_newspost_not_modified(self):
+        """ Verify that a newspost page answers matching validators with a 304 until the newspost is saved
+        """
+        newspost = NewsPost.objects.first()
+        page = self.client.get(newspost.url)
+        self.assertEqual(self.client.get(newspost.url, HTTP_IF_NONE_MATCH=page['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(newspost.url, HTTP_IF_MODIFIED_SINCE=page['Last-Modified']).status_code, 304)
+
+        newspost.save()
+        self.assertEqual(self.client.get(newspost.url, HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+
+    def test_newspost_not_modified_without_render(self):
+        """ Verify that a 304 for an uncached newspost page costs one query and no render
+        """
+        newspost = NewsPost.objects.first()
+        page = self.client.get(newspost.url)
+        cache.get_page_cache().clear()
+        with self.assertNumQueries(1), self.assertTemplateNotUsed('wavepool/newspost.html'):
+            response = self.client.get(newspost.url, HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_newspost_etag_depends_on_cms_user(self):
+        """ Verify that a visitor's copy of a newspost page is not revalidated for a CMS user
+        """
+        newspost = NewsPost.objects.first()
+        page = self.client.get(newspost.url)
+        self._login_user()
+        self.assertEqual(self.client.get(newspost.url, HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+
+
 class SiteFrontPage(TestBase):
 
     def test_cover_story_placement(self):
@@ -131,7 +1305,7 @@ class SiteFrontPage(TestBase):
     def test_top_stories(self):
         """ Verify that the top stories section contains the 3 most recent stories, excluding the cover story
         """
-        latest_four_stories = NewsPost.objects.all().order_by('publish_date')[:4]
+        latest_four_stories = NewsPost.objects.all().order_by('-publish_date', '-id')[:4]
         cover_story = latest_four_stories[2]
         cover_story.is_cover_story = True
         cover_story.save()
@@ -166,7 +1340,7 @@ class SiteFrontPage(TestBase):
     def test_archive_stories(self):
         """ Verify that the archived stories section contains all newsposts that are not the cover story or top stories
         """
-        all_stories = NewsPost.objects.all().order_by('publish_date')
+        all_stories = NewsPost.objects.all().order_by('-publish_date', '-id')
         cover_story = all_stories[7]
         cover_story.is_cover_story = True
         cover_story.save()
@@ -194,6 +1368,308 @@ class SiteFrontPage(TestBase):
         for teaser in teaser_divs:
             self.assertNotIn('<p>', teaser.text)
 
+    def test_front_page_layout_cached(self):
+        """ Verify that the front page is served without database queries until a newspost is saved
+        """
+        self.client.get('')
+        with self.assertNumQueries(0):
+            self.client.get('')
+
+        oldest_story = NewsPost.objects.all().order_by('-publish_date', '-id').last()
+        oldest_story.is_cover_story = True
+        oldest_story.save()
+
+        front_page = self.client.get('')
+        front_page_html = BeautifulSoup(front_page.content, 'html.parser')
+        cover_story_div = front_page_html.find('div', {'id': 'coverstory'})
+        self.assertEqual(int(cover_story_div['data-newspost-id']), oldest_story.pk)
+
+    def test_front_page_layout_rebuilt_on_delete(self):
+        """ Verify that a deleted newspost is removed from the front page
+        """
+        self.client.get('')
+        newspost = NewsPost.objects.all().order_by('-publish_date', '-id').first()
+        deleted_newspost_id = newspost.pk
+        newspost.delete()
+
+        front_page = self.client.get('')
+        front_page_html = BeautifulSoup(front_page.content, 'html.parser')
+        rendered_ids = [int(div['data-newspost-id']) for div in front_page_html.find_all('div', {'class': 'topstory'})]
+        self.assertNotIn(deleted_newspost_id, rendered_ids)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'template_fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragments'},
+    })
+    def test_teaser_fragments_cached(self):
+        """ Verify that a teaser is rendered once per version of its newspost, so saving a newspost re-renders its
+            teaser and no other
+        """
+        caches['template_fragments'].clear()
+        self.client.get('')
+        top_stories = NewsPost.objects.filter(is_cover_story=False).order_by(*pagination.RECENCY_ORDER)
+        top_story, other_top_story = top_stories[:2]
+        # an update that leaves modified_at alone is not seen by the cached teaser
+        NewsPost.objects.filter(pk=other_top_story.pk).update(title='Changed behind the cache')
+        top_story.title = 'Edited top story'
+        top_story.save()
+
+        front_page_html = BeautifulSoup(self.client.get('').content, 'html.parser')
+        titles = [div.find('a').text for div in front_page_html.find_all('div', {'class': 'topstory'})]
+        self.assertEqual(titles[:2], ['Edited top story', other_top_story.title])
+
+
+class FrontPageArchive(TestBase):
+
+    def _archive_ids(self, html):
+        return [int(div['data-archive-story-id']) for div in html.find_all('div', {'class': 'archived-story'})]
+
+    def test_archive_first_page_inline(self):
+        """ Verify that the front page only renders the first page of the archive and links to the next one
+        """
+        self._create_newsposts(layout.ARCHIVE_PAGE_SIZE * 2)
+        front_page = self.client.get('')
+        front_page_html = BeautifulSoup(front_page.content, 'html.parser')
+        self.assertEqual(len(self._archive_ids(front_page_html)), layout.ARCHIVE_PAGE_SIZE)
+        self.assertIsNotNone(front_page_html.find('a', {'id': 'archive-more'}))
+
+    def test_archive_pages_cover_every_story(self):
+        """ Verify that following the archive pages lists every story not on the front page once, most recent first
+        """
+        self._create_newsposts(layout.ARCHIVE_PAGE_SIZE * 3)
+        all_stories = list(NewsPost.objects.all().order_by('-publish_date', '-id'))
+        cover_story = all_stories[layout.ARCHIVE_PAGE_SIZE + 5]
+        cover_story.is_cover_story = True
+        cover_story.save()
+        expected_ids = [story.pk for story in all_stories if story != cover_story][layout.TOP_STORY_COUNT:]
+
+        page = self.client.get('')
+        archive_ids = []
+        while True:
+            page_html = BeautifulSoup(page.content, 'html.parser')
+            archive_ids.extend(self._archive_ids(page_html))
+            more_link = page_html.find('a', {'id': 'archive-more'})
+            if more_link is None:
+                break
+            page = self.client.get(more_link['href'])
+        self.assertEqual(archive_ids, expected_ids)
+
+    def test_deep_archive_page_constant_queries(self):
+        """ Verify that an archive page deep in the archive is read with one query for its newsposts and one for their
+            tags
+        """
+        self._create_newsposts(layout.ARCHIVE_PAGE_SIZE * 3)
+        self.client.get('')
+        oldest_story = NewsPost.objects.all().order_by('-publish_date', '-id')[layout.ARCHIVE_PAGE_SIZE * 3]
+        with self.assertNumQueries(2):
+            page = self.client.get(reverse('archive'), {'after': pagination.encode_cursor(oldest_story)})
+        self.assertEqual(page.status_code, 200)
+
+    def test_archive_requires_valid_cursor(self):
+        """ Verify that archive pages reject a missing or malformed cursor
+        """
+        self.assertEqual(self.client.get(reverse('archive')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('archive'), {'after': 'yesterday'}).status_code, 400)
+
+    def test_archive_rejects_cursor_id_out_of_range(self):
+        """ Verify that archive pages reject a cursor whose id no newspost could have, rather than fail to query it
+        """
+        for newspost_id in ('0', '-1', str(2 ** 63), '99999999999999999999999'):
+            cursor = '2020-02-20T00:00:00_{}'.format(newspost_id)
+            self.assertEqual(self.client.get(reverse('archive'), {'after': cursor}).status_code, 400)
+        self.assertEqual(
+            pagination.decode_cursor('2020-02-20T00:00:00_{}'.format(2 ** 63 - 1))[1], pagination.MAX_ID,
+        )
+
+
+class ScheduledPublishing(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(layout.scheduler.cancel)
+
+    def _public_pages(self, newspost, tag):
+        client = Client()
+        return [
+            client.get(reverse('home')),
+            client.get(reverse('archive'), {'after': '9999-12-31_999999'}),
+            client.get(tag.url),
+            client.get(reverse('search'), {'q': 'drones'}),
+        ]
+
+    def test_scheduled_newspost_goes_live_at_its_time(self):
+        """ Verify that a newspost with a future publish time is left out of the public pages, that the layout is
+            scheduled to be rebuilt at that time, and that the rebuild shows it everywhere
+        """
+        publish_date = timezone.now() + datetime.timedelta(hours=1)
+        tag = Tag.objects.create(name='Drones')
+        newspost = NewsPost.objects.create(
+            title='Grocers schedule drones', body='<p>Drone deliveries</p>',
+            source='https://www.grocerydive.com/news/drones/1/', publish_date=publish_date,
+        )
+        newspost.tags.add(tag)
+
+        for page in self._public_pages(newspost, tag):
+            self.assertNotContains(page, 'Grocers schedule')
+        self.assertEqual(self.client.get(newspost.url).status_code, 404)
+        self.assertEqual(layout.scheduler.due, publish_date)
+        front_page = self.client.get(reverse('home'))
+        self._login_user()
+        self.assertContains(self.client.get(newspost.url), 'Grocers schedule drones')
+
+        with mock.patch('django.utils.timezone.now', return_value=publish_date):
+            layout.publish_scheduled()
+            self.assertEqual(layout.get_layout().published_at, publish_date)
+            for page in self._public_pages(newspost, tag):
+                self.assertContains(page, 'Grocers schedule')
+            self.assertEqual(Client().get(newspost.url).status_code, 200)
+            self.assertEqual(
+                Client().get(reverse('home'), HTTP_IF_NONE_MATCH=front_page['ETag']).status_code, 200,
+            )
+
+    def test_newspost_written_elsewhere_found_without_front_page(self):
+        """ Verify that a newspost written by another process after the layout was built is found by its page and its
+            tag's archive once the change check is due, without a front page request in between
+        """
+        tag = Tag.objects.create(name='Drones')
+        self.client.get(reverse('home'))
+        newspost, = NewsPost.objects.bulk_create([NewsPost(
+            title='Grocers import drones', body='<p>Drone deliveries</p>',
+            source='https://www.grocerydive.com/news/drones/2/', publish_date=timezone.now(),
+        )])
+        newspost = NewsPost.objects.get(source=newspost.source)
+        NewsPost.tags.through.objects.create(newspost=newspost, tag=tag)
+        self.assertEqual(self.client.get(newspost.url).status_code, 404)
+
+        with mock.patch.object(layout, 'CHANGE_CHECK_SECONDS', 0):
+            self.assertEqual(self.client.get(newspost.url).status_code, 200)
+            self.assertContains(self.client.get(tag.url), 'Grocers import drones')
+
+    def test_scheduler_calls_back_at_earliest_time(self):
+        """ Verify that the scheduler keeps the earliest of the times it is given and calls back once it comes
+        """
+        called = threading.Event()
+        scheduler = layout.PublishScheduler(called.set)
+        self.addCleanup(scheduler.cancel)
+        now = timezone.now()
+        scheduler.schedule(now + datetime.timedelta(hours=1))
+        scheduler.schedule(now + datetime.timedelta(milliseconds=50))
+        scheduler.schedule(now + datetime.timedelta(minutes=1))
+        self.assertEqual(scheduler.due, now + datetime.timedelta(milliseconds=50))
+        self.assertTrue(called.wait(5))
+        self.assertIsNone(scheduler.due)
+
+
+class QueryPlans(TestBase):
+
+    def _query_plan(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN {}'.format(sql), params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, index_name):
+        """ Assert that SQLite answers `queryset` from `index_name` without a table scan or a sort
+        """
+        plan = self._query_plan(*queryset.query.sql_with_params())
+        self.assertTrue(
+            any('USING INDEX {}'.format(index_name) in step or 'USING COVERING INDEX {}'.format(index_name) in step
+                for step in plan),
+            'Expected {} in query plan {}'.format(index_name, plan)
+        )
+        for step in plan:
+            self.assertFalse(
+                step.startswith('SCAN') and 'USING' not in step, 'Table scan in query plan {}'.format(plan),
+            )
+            self.assertNotIn('TEMP B-TREE', step, 'Sort in query plan {}'.format(plan))
+
+    def test_recency_order_uses_index(self):
+        """ Verify that reading the most recent newsposts walks the recency index
+        """
+        queryset = NewsPost.objects.order_by(*pagination.RECENCY_ORDER)[:layout.ARCHIVE_PAGE_SIZE]
+        self.assertUsesIndex(queryset, 'newspost_recency_idx')
+
+    def test_archive_page_seeks_recency_index(self):
+        """ Verify that a deep archive page seeks into the recency index instead of scanning down to the cursor
+        """
+        oldest_story = NewsPost.objects.order_by(*pagination.RECENCY_ORDER).last()
+        cursor = pagination.decode_cursor(pagination.encode_cursor(oldest_story))
+        queryset = NewsPost.objects.exclude(pk=1)
+        with CaptureQueriesContext(connection) as queries:
+            pagination.page_after(queryset, cursor, layout.ARCHIVE_PAGE_SIZE)
+        self.assertEqual(len(queries), 1)
+        plan = self._query_plan(queries[0]['sql'])
+        self.assertEqual(len(plan), 1, plan)
+        self.assertTrue(plan[0].startswith('SEARCH'), plan)
+        self.assertIn('newspost_recency_idx', plan[0])
+
+    def test_divesite_archive_uses_index(self):
+        """ Verify that the most recent newsposts of one dive site are read from the dive site index
+        """
+        queryset = NewsPost.objects.filter(divesite='hrdive').order_by(*pagination.RECENCY_ORDER)[:20]
+        self.assertUsesIndex(queryset, 'newspost_divesite_recency_idx')
+
+    def test_cover_story_lookup_uses_index(self):
+        """ Verify that the cover story is looked up through its partial index
+        """
+        queryset = NewsPost.objects.filter(is_cover_story=True)[:1]
+        self.assertUsesIndex(queryset, 'newspost_single_cover_story')
+
+    def test_single_cover_story_enforced(self):
+        """ Verify that the database refuses a second cover story that bypasses NewsPost.save
+        """
+        NewsPost.objects.filter(pk=1).update(is_cover_story=True)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            NewsPost.objects.filter(pk=2).update(is_cover_story=True)
+
+    def test_saving_cover_story_replaces_previous(self):
+        """ Verify that saving a new cover story unsets the previous one instead of violating the constraint
+        """
+        old_cover_story = NewsPost.objects.get(pk=1)
+        old_cover_story.is_cover_story = True
+        old_cover_story.save()
+        new_cover_story = NewsPost.objects.get(pk=2)
+        new_cover_story.is_cover_story = True
+        new_cover_story.save()
+        self.assertEqual(list(NewsPost.objects.filter(is_cover_story=True)), [new_cover_story])
+
+
+class ViewBudgets(TestBase):
+    """ Query and rendered byte budgets of the main pages, checked as the newspost table grows to 100k rows, so that a
+        page whose queries or size grow with the number of newsposts fails
+    """
+    SIZES = (100, 10000, 100000)
+
+    def test_budgets_hold_as_newsposts_grow(self):
+        """ Verify that the front page, a newspost page, the instructions and the CMS newspost list make the same
+            number of queries and stay within their size at every table size
+        """
+        public_client = Client()
+        self._login_user()
+        for size in self.SIZES:
+            benchmarks.populate(size)
+            newspost = NewsPost.objects.order_by('pk').first()
+            # the date hierarchy seeks once for each year with newsposts in it, and once past the last one
+            years = NewsPost.objects.dates('publish_date', 'year').count()
+            # client, path, queries rendering from scratch, queries rendering again, rendered bytes
+            budgets = {
+                'front_page': (public_client, reverse('home'), 10, 0, 17 * 1024),
+                'newspost_detail': (public_client, newspost.url, 5, 0, 8 * 1024),
+                'instructions': (public_client, reverse('instructions'), 0, 0, 12 * 1024),
+                'newspost_changelist': (
+                    self.client, reverse('admin:wavepool_newspost_changelist'), 7 + years, 7 + years, 40 * 1024,
+                ),
+            }
+            layout.invalidate()
+            ads.invalidate()
+            readership.invalidate()
+            # views of earlier sizes would be written from a thread of their own once they had waited long enough
+            readership.views.discard()
+            cache.get_page_cache().clear()
+            for view, (client, path, cold_queries, warm_queries, max_bytes) in budgets.items():
+                with self.subTest(size=size, view=view):
+                    self.assertWithinBudget(client, path, cold_queries, max_bytes)
+                    self.assertWithinBudget(client, path, warm_queries, max_bytes)
+
 
 class CmsPage(TestBase):
     fixtures = ['test_fixture', ]
@@ -227,11 +1703,59 @@ class CmsPage(TestBase):
             obj_id = resolved_admin_url.kwargs['object_id']
             newspost = NewsPost.objects.get(pk=obj_id)
             if last_pubdate:
-                self.assertTrue(newspost.publish_date >= last_pubdate)
+                self.assertTrue(newspost.publish_date <= last_pubdate)
             last_pubdate = newspost.publish_date
 
+    def test_changelist_queries_constant(self):
+        """ Verify that the changelist runs the same queries however many newsposts there are, without loading bodies
+        """
+        self._login_user()
+        list_page_url = reverse('admin:wavepool_newspost_changelist')
+        self._create_newsposts(60)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(list_page_url)
+        # the same publish dates again, so only the number of rows changes
+        self._create_newsposts(60)
+        with CaptureQueriesContext(connection) as many:
+            page = self.client.get(list_page_url)
+        self.assertEqual(len(few), len(many))
+        self.assertFalse([query for query in many if '"wavepool_newspost"."body"' in query['sql']])
+        self.assertEqual(len(self._get_news_list_page_rows()), wavepool_admin.NewsPostAdmin.list_per_page)
+        paginator = BeautifulSoup(page.content, 'html.parser').find('p', {'class': 'paginator'})
+        self.assertIn('128 news posts', paginator.text)
+
+    def test_changelist_count_capped(self):
+        """ Verify that the changelist stops counting at the paginator's cap and says there are more
+        """
+        self._login_user()
+        with mock.patch.object(wavepool_admin.CappedCountPaginator, 'max_count', 5):
+            page = self.client.get(reverse('admin:wavepool_newspost_changelist'))
+        paginator = BeautifulSoup(page.content, 'html.parser').find('p', {'class': 'paginator'})
+        self.assertIn('5+ news posts', paginator.text)
+
+    def test_date_hierarchy_seeks_match_scans(self):
+        """ Verify that the date hierarchy's index seeks find the same dates as django's own queries
+        """
+        self._create_newsposts(100)
+        newsposts = NewsPost.objects.all()
+        seeking = wavepool_admin.IndexSeekQuerySet(NewsPost)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(seeking.datetimes('publish_date', kind), list(newsposts.datetimes('publish_date', kind)))
+        self.assertEqual(
+            seeking.filter(publish_date__year=2019).datetimes('publish_date', 'month', order='DESC'),
+            list(newsposts.filter(publish_date__year=2019).datetimes('publish_date', 'month', order='DESC')),
+        )
+        bounds = {'first': Min('publish_date'), 'last': Max('publish_date')}
+        self.assertEqual(seeking.aggregate(**bounds), newsposts.aggregate(**bounds))
+
+        self._login_user()
+        page = self.client.get(reverse('admin:wavepool_newspost_changelist'), {'publish_date__year': 2019})
+        self.assertEqual(page.status_code, 200)
+        self.assertContains(page, 'publish_date__month=2')
+
     def test_only_one_cover_story(self):
-        """ Verify that when a CMS user sets an newspost as the cover story, the previously saved cover story is set False
+        """ Verify that when a CMS user sets an newspost as the cover story, the previously saved cover story is set
+            False
         """
         self._login_user()
         newsposts = NewsPost.objects.all()
@@ -246,7 +1770,8 @@ class CmsPage(TestBase):
         )
         post_data = {
             'title': new_cover_story_newspost.title,
-            'publish_date': new_cover_story_newspost.publish_date,
+            'publish_date_0': new_cover_story_newspost.publish_date.date(),
+            'publish_date_1': new_cover_story_newspost.publish_date.time(),
             'body': new_cover_story_newspost.body,
             'source': new_cover_story_newspost.source,
             'is_cover_story': 'on',
@@ -258,3 +1783,401 @@ class CmsPage(TestBase):
 
         old_cover_story_newspost = NewsPost.objects.get(pk=old_cover_story_newspost.pk)
         self.assertFalse(old_cover_story_newspost.is_cover_story)
+
+
+class StaticFiles(TestBase):
+    """ Runs against static files collected into a temporary STATIC_ROOT with the production storage, and served by
+        StaticFilesMiddleware
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        static_settings = override_settings(
+            STATIC_ROOT=directory.name,
+            STATICFILES_STORAGE='wavepool.staticfiles.CompressedManifestStaticFilesStorage',
+            MIDDLEWARE=[settings.MIDDLEWARE[0], 'wavepool.staticfiles.StaticFilesMiddleware', *settings.MIDDLEWARE[1:]],
+        )
+        static_settings.enable()
+        cls.addClassCleanup(static_settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def _original(self, name):
+        with open(os.path.join(settings.BASE_DIR, 'wavepool', 'static', name), 'rb') as original:
+            return original.read()
+
+    def test_collected_files_hashed_and_compressed(self):
+        """ Verify that collectstatic names static files after their content and writes a gzip copy of text files
+        """
+        hashed_name = staticfiles_storage.stored_name('app.css')
+        self.assertRegex(hashed_name, r'^app\.[0-9a-f]{12}\.css$')
+        with staticfiles_storage.open(hashed_name + '.gz') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), self._original('app.css'))
+
+    def test_pages_link_hashed_files(self):
+        """ Verify that pages link to the hashed names of their stylesheets
+        """
+        page = self.client.get(reverse('home'))
+        page_html = BeautifulSoup(page.content, 'html.parser')
+        stylesheets = [link['href'] for link in page_html.find_all('link', {'rel': 'stylesheet'})]
+        self.assertIn(staticfiles_storage.url('app.css'), stylesheets)
+
+    def test_hashed_file_served_compressed(self):
+        """ Verify that a hashed file is served compressed to clients accepting gzip and cached for a year
+        """
+        url = staticfiles_storage.url('app.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], staticfiles.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self._original('app.css'))
+
+        identity = self.client.get(url)
+        self.assertFalse(identity.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(identity.streaming_content), self._original('app.css'))
+        self.assertNotEqual(identity['ETag'], response['ETag'])
+
+    def test_not_modified(self):
+        """ Verify that a client revalidating a static file with its ETag is answered without the file
+        """
+        url = staticfiles_storage.url('app.css')
+        etag = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_unhashed_file_cached_briefly(self):
+        """ Verify that a static file requested by its original name is only cached for a short while, since it may
+            change with the next deployment
+        """
+        response = self.client.get(settings.STATIC_URL + 'app.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], staticfiles.MUTABLE_CACHE_CONTROL)
+
+    @override_settings(WAVEPOOL_RESPONSIVE_IMAGES={})
+    def test_image_without_variants(self):
+        """ Verify that an image with no resized copies is shown at its original size
+        """
+        page = self.client.get(reverse('home'))
+        logo = BeautifulSoup(page.content, 'html.parser').find('span', {'id': 'logo'}).img
+        self.assertEqual(logo['src'], staticfiles_storage.url('image/dive-logo.png'))
+        self.assertFalse(logo.has_attr('srcset'))
+
+    def test_image_variants(self):
+        """ Verify that the newspost banner is offered resized for each pixel density
+        """
+        newspost = NewsPost.objects.first()
+        page = self.client.get(newspost.url)
+        banner = BeautifulSoup(page.content, 'html.parser').find('img', {'width': '200px'})
+        self.assertEqual(banner['srcset'], '{} 1x, {} 2x'.format(
+            staticfiles_storage.url('image/fastbanana-200w.png'), staticfiles_storage.url('image/fastbanana-400w.png'),
+        ))
+        self.assertEqual(banner['src'], staticfiles_storage.url('image/fastbanana-200w.png'))
+        self.assertEqual(staticfiles.image_variants('image/dive-logo.png'), [
+            (1, 'image/dive-logo-30w.png'), (2, 'image/dive-logo-60w.png'),
+        ])
+
+
+class CoverStorySwapConcurrency(TransactionTestCase):
+    """ Runs against a WAL mode SQLite file rather than the in-memory test database, so that each thread has a
+        connection of its own with the locking a deployed site has
+    """
+    EDITORS = 6
+    SWAPS_PER_EDITOR = 8
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_database = benchmarks.sqlite_file_database(self.directory.name)
+        self.file_database.__enter__()
+        benchmarks.run_threads([self._create_database])
+        layout.invalidate()
+
+    def tearDown(self):
+        self.file_database.__exit__(None, None, None)
+        self.directory.cleanup()
+        layout.invalidate()
+
+    def _create_database(self):
+        call_command('migrate', verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+        call_command('loaddata', 'test_fixture', verbosity=0)
+        NewsPost.objects.filter(pk=1).update(is_cover_story=True)
+        User.objects.create_superuser('editor', 'editor@industrydive.com', self._random_password())
+
+    def _random_password(self):
+        return ''.join(random.choice(string.ascii_letters) for _ in range(16))
+
+    def _editor(self, newspost_ids, responses):
+        client = Client()
+        client.force_login(User.objects.get(username='editor'))
+        for newspost_id in newspost_ids:
+            newspost = NewsPost.objects.get(pk=newspost_id)
+            response = client.post(reverse('admin:wavepool_newspost_change', args=[newspost_id]), {
+                'title': newspost.title,
+                'publish_date_0': newspost.publish_date.date(),
+                'publish_date_1': newspost.publish_date.time(),
+                'body': newspost.body,
+                'source': newspost.source,
+                'is_cover_story': 'on',
+            })
+            responses.append(response.status_code)
+
+    def _front_page_reader(self, editing, layouts):
+        while editing.is_set():
+            layouts.append(layout.build_layout())
+            cover_stories = list(NewsPost.objects.filter(is_cover_story=True).values_list('pk', flat=True))
+            layouts.append(cover_stories)
+
+    def test_concurrent_cover_story_swaps(self):
+        """ Verify that editors making newsposts the cover story at the same time all succeed, leaving one cover
+            story, while the front page only ever sees a single, whole cover story
+        """
+        newspost_ids = list(range(1, 9))
+        responses, observed = [], []
+        editing = threading.Event()
+        editing.set()
+        editors = [
+            (
+                lambda ids=random.Random(editor).choices(newspost_ids, k=self.SWAPS_PER_EDITOR):
+                self._editor(ids, responses)
+            )
+            for editor in range(self.EDITORS)
+        ]
+
+        def edit():
+            try:
+                benchmarks.run_threads(editors)
+            finally:
+                editing.clear()
+
+        benchmarks.run_threads([edit, lambda: self._front_page_reader(editing, observed)])
+
+        self.assertEqual(responses, [302] * self.EDITORS * self.SWAPS_PER_EDITOR)
+        self.assertTrue(observed)
+        for seen in observed:
+            if isinstance(seen, list):
+                self.assertLessEqual(len(seen), 1)
+                continue
+            stories = [seen.cover_story] + seen.top_stories + seen.archive
+            self.assertEqual(len({newspost.pk for newspost in stories}), len(stories))
+            self.assertEqual([newspost.pk for newspost in stories if newspost.is_cover_story], [seen.cover_story.pk])
+
+        def check_final_state():
+            self.assertEqual(NewsPost.objects.filter(is_cover_story=True).count(), 1)
+
+        benchmarks.run_threads([check_final_state])
+
+
+@override_settings(WAVEPOOL_SQLITE_PRAGMAS={'busy_timeout': 1234, 'journal_mode': 'WAL', 'cache_size': -2000})
+class SqlitePragmas(TransactionTestCase):
+
+    def test_pragmas_applied_to_new_connections(self):
+        """ Verify that each new SQLite connection is set up with the WAVEPOOL_SQLITE_PRAGMAS setting
+        """
+        pragmas = {}
+
+        def read_pragmas():
+            with connection.cursor() as cursor:
+                for name in ('busy_timeout', 'journal_mode', 'cache_size'):
+                    cursor.execute('PRAGMA {}'.format(name))
+                    pragmas[name] = cursor.fetchone()[0]
+
+        with tempfile.TemporaryDirectory() as directory, benchmarks.sqlite_file_database(directory):
+            benchmarks.run_threads([read_pragmas])
+        self.assertEqual(pragmas, {'busy_timeout': 1234, 'journal_mode': 'wal', 'cache_size': -2000})
+
+    def test_invalid_pragma_refused(self):
+        """ Verify that a PRAGMA value that is not a plain number or word is refused rather than run as SQL
+        """
+        with tempfile.TemporaryDirectory() as directory, benchmarks.sqlite_file_database(directory):
+            with override_settings(WAVEPOOL_SQLITE_PRAGMAS={'cache_size': '0; DROP TABLE wavepool_newspost'}):
+                with self.assertRaises(ImproperlyConfigured):
+                    benchmarks.run_threads([lambda: connection.ensure_connection()])
+
+
+class ReplicaRouting(TransactionTestCase):
+    """ Runs against two SQLite files, the default database and a replica that only changes when replicated to
+    """
+    # the cursor of a newspost newer than any other, so the archive page after it is the whole archive
+    NEWEST_CURSOR = '9999-12-31_999999'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        databases = ExitStack()
+        databases.enter_context(benchmarks.sqlite_file_database(directory.name))
+        databases.enter_context(benchmarks.sqlite_file_database(directory.name, 'replica'))
+        databases.enter_context(override_settings(WAVEPOOL_REPLICAS=['replica']))
+        self.addCleanup(databases.close)
+        self._in_thread(self._create_databases)
+        layout.invalidate()
+        cache.get_page_cache().clear()
+        self.addCleanup(layout.invalidate)
+        self.addCleanup(readership.views.discard)
+
+    def _in_thread(self, func, *args, **kwargs):
+        results = []
+        benchmarks.run_threads([lambda: results.append(func(*args, **kwargs))])
+        return results[0]
+
+    def _create_databases(self):
+        call_command('migrate', verbosity=0)
+        call_command('loaddata', 'test_fixture', verbosity=0)
+        User.objects.create_superuser('editor', 'editor@industrydive.com', 'editor-password')
+        replication.replicate()
+
+    def _archive_titles(self, client):
+        page = self._in_thread(client.get, reverse('archive'), {'after': self.NEWEST_CURSOR})
+        page_html = BeautifulSoup(page.content, 'html.parser')
+        return page_html.get_text()
+
+    def test_public_reads_follow_replication(self):
+        """ Verify that public pages read from the replica, which only shows a change once it is replicated, while
+            cached pages are filled from the default database
+        """
+        self._in_thread(lambda: NewsPost.objects.filter(pk=8).update(title='Retitled on the primary'))
+        client = Client()
+        self.assertNotIn('Retitled on the primary', self._archive_titles(client))
+        detail = self._in_thread(client.get, reverse('newspost_detail', args=[8]))
+        self.assertContains(detail, 'Retitled on the primary')
+
+        self._in_thread(replication.replicate)
+        self.assertIn('Retitled on the primary', self._archive_titles(client))
+
+    def test_editor_pinned_to_primary_after_saving(self):
+        """ Verify that an editor who has just saved reads from the default database, while other readers keep
+            reading from the replica
+        """
+        editor, reader = Client(), Client()
+        self._in_thread(lambda: editor.force_login(User.objects.get(username='editor')))
+        newspost = self._in_thread(NewsPost.objects.get, pk=8)
+        response = self._in_thread(editor.post, reverse('admin:wavepool_newspost_change', args=[8]), {
+            'title': 'Edited in the admin',
+            'publish_date_0': newspost.publish_date.date(),
+            'publish_date_1': newspost.publish_date.time(),
+            'body': newspost.body,
+            'source': newspost.source,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], routers.DEFAULT_PIN_SECONDS)
+
+        self.assertIn('Edited in the admin', self._archive_titles(editor))
+        self.assertNotIn('Edited in the admin', self._archive_titles(reader))
+
+    def test_writes_go_to_primary(self):
+        """ Verify that writes always go to the default database and that reads follow them there within a request
+        """
+        router = routers.ReplicaRouter()
+        view = routers.read_from_replicas(
+            lambda request: (router.db_for_read(NewsPost), router.db_for_write(NewsPost), router.db_for_read(NewsPost))
+        )
+        self.assertEqual(view(RequestFactory().get('/')), ('replica', 'default', 'default'))
+        self.assertEqual(router.db_for_read(NewsPost), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'wavepool'))
+
+
+class LiveFrontPage(TransactionTestCase):
+    """ Runs with transactions committed, since changes are only published once they are
+    """
+    fixtures = ['test_fixture', ]
+
+    def setUp(self):
+        layout.invalidate()
+        live._state = None
+
+    async def test_cover_story_change_pushed(self):
+        """ Verify that a new cover story is pushed to an open event stream once it is saved
+        """
+        client = benchmarks.EventStreamClient()
+        stream = asyncio.ensure_future(client.get(live.front_page_events, live.EVENTS_PATH))
+        _, opening = await client.next_chunk()
+        self.assertEqual(client.status, 200)
+        self.assertIn(b'retry: ', opening)
+
+        newspost = await sync_to_async(self._promote_oldest)()
+        _, body = await client.next_chunk()
+        client.disconnect()
+        await stream
+        event = self._parse_event(body)
+        self.assertEqual(event['event'], 'cover_story')
+        self.assertEqual(event['data']['id'], newspost.pk)
+        self.assertEqual(event['data']['title'], newspost.title)
+        self.assertEqual(live.hub.subscriber_count(), 0)
+
+    async def test_missed_changes_reload(self):
+        """ Verify that a browser reconnecting after missing changes is told to reload the page
+        """
+        last_seen = live.hub.last_event_id
+        live.hub.publish('cover_story', None)
+        client = benchmarks.EventStreamClient(headers=[('last-event-id', str(last_seen))])
+        stream = asyncio.ensure_future(client.get(live.front_page_events, live.EVENTS_PATH))
+        _, body = await client.next_chunk()
+        client.disconnect()
+        await stream
+        self.assertEqual(self._parse_event(body)['event'], 'reload')
+
+    def test_archive_diff(self):
+        """ Verify that the archive diff lists the stories that entered and left the first page, with their positions
+        """
+        old = {'cover_story': None, 'top_stories': [{'id': 1}], 'archive': [{'id': 2}, {'id': 3}, {'id': 4}]}
+        new = {'cover_story': None, 'top_stories': [{'id': 1}], 'archive': [{'id': 5}, {'id': 2}, {'id': 3}]}
+        self.assertEqual(live.front_page_diff(old, new), [
+            ('archive', {'added': [{'id': 5, 'position': 0}], 'removed': [4]}),
+        ])
+        self.assertEqual(live.front_page_diff(new, new), [])
+
+    def _promote_oldest(self):
+        newspost = NewsPost.objects.filter(is_cover_story=False).order_by('publish_date', 'id').first()
+        newspost.is_cover_story = True
+        newspost.save()
+        return newspost
+
+    def _parse_event(self, body):
+        fields = dict(line.split(': ', 1) for line in body.decode().splitlines() if line)
+        fields['data'] = json.loads(fields['data'])
+        return fields
+
+
+class LoadTest(TransactionTestCase):
+    """ Runs against an SQLite file, so that the clients' threads each have a connection of their own to it
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        databases = ExitStack()
+        databases.enter_context(benchmarks.sqlite_file_database(directory.name))
+        self.addCleanup(databases.close)
+        benchmarks.run_threads([self._create_database])
+        self.addCleanup(layout.invalidate)
+        self.addCleanup(readership.views.discard)
+
+    def _create_database(self):
+        call_command('migrate', verbosity=0)
+        benchmarks.populate(100)
+        User.objects.create_superuser('editor', 'editor@industrydive.com', 'editor-password')
+
+    def test_report(self):
+        """ Verify that the load test reports the throughput and latency of every page it requests, as JSON
+        """
+        stdout = StringIO()
+        benchmarks.run_threads([lambda: call_command(
+            'loadtest', '--requests', 12, '--concurrency', 3, '--admin-user', 'editor', stdout=stdout,
+        )])
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['newsposts'], 100)
+        self.assertEqual(list(report['scenarios']), list(loadtest.SCENARIOS))
+        for scenario in report['scenarios'].values():
+            self.assertEqual(scenario['requests'], 12)
+            self.assertEqual(scenario['errors'], 0)
+            self.assertLessEqual(scenario['latency_ms']['p50'], scenario['latency_ms']['max'])
+        # the CMS session made for the load test is deleted afterwards
+        sessions = []
+        benchmarks.run_threads([lambda: sessions.append(Session.objects.count())])
+        self.assertEqual(sessions, [0])
@@ -0,0 +1,19 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    """ transaction.atomic() for a block that is going to write
+        With the wavepool SQLite backend the outermost block takes the write lock as it begins, so it waits its turn
+        behind other writers instead of failing when one of them commits first. Readers are never blocked by it.
+    """
+    connection = transaction.get_connection(using)
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
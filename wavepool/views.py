@@ -1,43 +1,231 @@
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import prefetch_related_objects
+from django.shortcuts import get_object_or_404
 from django.template import loader
-from django.http import HttpResponse
+from django.urls import reverse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 
-from wavepool.models import NewsPost
+from wavepool import ads, cache, conditional, feeds, layout, live, metrics, pagination, readership, search
+from wavepool.routers import primary_reads, read_from_replicas
+from wavepool.models import NewsPost, Tag, DIVESITE_SOURCE_NAMES
 from wavepool.code_exercise_defs import code_exercise_defs, code_review_defs, code_design_defs
 from django.conf import settings
 
 
-def front_page(request):
+@read_from_replicas
+async def front_page(request):
     """ View for the site's front page
         Returns all available newsposts, formatted like:
             cover_story: the newsposts with is_cover_story = True
             top_stories: the 3 most recent newsposts that are not cover story
             archive: the rest of the newsposts, sorted by most recent
+        The layout is precomputed and only rebuilt after a newspost is saved, deleted or goes live, and the most read
+        ranking is read at most once a minute. The page is validated by when either last changed, so a client with
+        an up to date copy gets a 304 without a render.
+        Under ASGI the page is served on the event loop; only rebuilding the layout goes through a thread.
     """
+    front_page_layout = await layout.aget_layout()
+    most_read = await readership.aget_most_read()
+    page_validators = None
+    if front_page_layout.last_modified is not None:
+        last_modified = max(front_page_layout.last_modified, most_read.changed_at)
+        page_validators = conditional.validators('front-page', last_modified)
+        response = conditional.not_modified(request, *page_validators)
+        if response is not None:
+            return response
+
     template = loader.get_template('wavepool/frontpage.html')
-    cover_story = NewsPost.objects.all().order_by('?').first()
-    top_stories = NewsPost.objects.all().order_by('?')[:3]
-    other_stories = NewsPost.objects.all().order_by('?')
+    context = {
+        'cover_story': front_page_layout.cover_story,
+        'top_stories': front_page_layout.top_stories,
+        'archive': front_page_layout.archive,
+        'archive_cursor': front_page_layout.archive_cursor,
+        'archive_url': reverse('archive'),
+        'popular_tags': front_page_layout.popular_tags,
+        'most_read': most_read.newsposts,
+        'live_url': live.EVENTS_PATH if live.is_served(request) else None,
+    }
+
+    response = HttpResponse(template.render(context, request))
+    if page_validators is not None:
+        conditional.set_validators(response, *page_validators)
+    return response
+
 
+@read_from_replicas
+def archive(request):
+    """ HTML fragment with the page of the front page archive that follows the `after` cursor
+        Requested by the front page to load older stories without rendering the whole archive up front
+    """
+    try:
+        cursor = pagination.decode_cursor(request.GET['after'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('A valid "after" cursor is required')
+
+    template = loader.get_template('wavepool/archive_stories.html')
+    page = layout.archive_page(cursor)
     context = {
-        'cover_story': cover_story,
-        'top_stories': top_stories,
-        'archive': other_stories,
+        'archive': page.newsposts,
+        'archive_cursor': page.next_cursor,
+        'archive_url': reverse('archive'),
     }
+    return HttpResponse(template.render(context, request))
+
+
+@read_from_replicas
+def tag_archive(request, slug):
+    """ View listing the newsposts carrying a tag, most recent first
+        The first page is a full page; requests with an `after` cursor get the following page as an HTML fragment.
+    """
+    tag = get_object_or_404(Tag, slug=slug)
+    cursor = None
+    if 'after' in request.GET:
+        try:
+            cursor = pagination.decode_cursor(request.GET['after'])
+        except ValueError:
+            return HttpResponseBadRequest('A valid "after" cursor is required')
 
+    page = pagination.page_after(
+        layout.teaser_newsposts().filter(tags=tag), cursor, layout.ARCHIVE_PAGE_SIZE, layout.published_at(),
+    )
+    template = loader.get_template('wavepool/archive_stories.html' if cursor else 'wavepool/tag.html')
+    context = {
+        'tag': tag,
+        'archive': page.newsposts,
+        'archive_cursor': page.next_cursor,
+        'archive_url': tag.url,
+    }
     return HttpResponse(template.render(context, request))
 
 
-def newspost_detail(request, newspost_id=None):
+@read_from_replicas
+async def newspost_detail(request, newspost_id):
+    """ View for a single newspost
+        The rendered page is cached per newspost and per auth state, since CMS users also see an edit link. Saving or
+        deleting the newspost drops its cached pages, and a page found to be older than the newspost once it is cached
+        is dropped again. The page is validated by the newspost's modified_at.
+        Each page view by a visitor counts as a view of the newspost and an impression of its advertisement.
+        Under ASGI a page served from the page cache never leaves the event loop.
+    """
+    auth_state = 'staff' if await _is_staff(request) else 'public'
+    page_key = cache.newspost_page_key(newspost_id, auth_state)
+    page_cache = cache.get_page_cache()
+    cached_page = await page_cache.aget(page_key)
+    if cached_page is None:
+        newspost = await sync_to_async(_get_newspost)(newspost_id, auth_state == 'staff')
+        modified_at = newspost.modified_at
+    else:
+        content, modified_at = cached_page
+
+    if auth_state == 'public':
+        readership.views.record(newspost_id)
+        ads.record_impression(newspost_id, await ads.aget_index())
+
+    page_validators = conditional.validators('newspost-{}-{}'.format(newspost_id, auth_state), modified_at)
+    response = conditional.not_modified(request, *page_validators)
+    if response is not None:
+        return response
+
+    if cached_page is None:
+        content = await sync_to_async(_render_newspost)(request, newspost)
+        await page_cache.aset(page_key, (content, modified_at))
+        # a save committed since the newspost was read has dropped its pages already, so the page just cached would
+        # outlive it; one committed after this check drops it once it commits
+        if await sync_to_async(_current_modified_at)(newspost_id) != modified_at:
+            await sync_to_async(page_cache.delete_many)([page_key])
+
+    return conditional.set_validators(HttpResponse(content), *page_validators)
+
+
+async def _is_staff(request):
+    # a request without a session cookie is anonymous, which is known without reading the session from the database
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    return await sync_to_async(lambda: request.user.is_staff)()
+
+
+def _get_newspost(newspost_id, show_scheduled):
+    # an id no newspost could have would overflow the database's integers rather than match nothing
+    if not 1 <= newspost_id <= pagination.MAX_ID:
+        raise Http404('No NewsPost matches the given query.')
+    # the page about to be cached is read from the default database, which a newspost save has reached
+    with primary_reads():
+        newspost = get_object_or_404(NewsPost, pk=newspost_id)
+    # CMS users can preview a scheduled newspost, which is not found by anyone else until it goes live
+    if not show_scheduled and newspost.publish_date > layout.published_at():
+        raise Http404('No NewsPost matches the given query.')
+    return newspost
+
+
+def _current_modified_at(newspost_id):
+    with primary_reads():
+        return NewsPost.objects.filter(pk=newspost_id).values_list('modified_at', flat=True).first()
+
+
+def _render_newspost(request, newspost):
+    # read from the same database as the newspost, which the router takes from the instance
+    prefetch_related_objects([newspost], 'tags')
     template = loader.get_template('wavepool/newspost.html')
-    newspost = NewsPost.objects.order_by('?').first()
     context = {
-        'newspost': newspost
+        'newspost': newspost,
+        'advertisement': ads.advertisement_for(newspost.pk),
     }
+    return template.render(context, request).encode()
+
+
+@read_from_replicas
+async def feed(request, feed_format, divesite=None):
+    """ Atom or JSON feed of the most recent newsposts, of one dive site if `divesite` is given
+        Feeds are kept in memory, compressed, until a newspost in them changes, so under ASGI a feed is served on the
+        event loop without a query. A feed is validated by a hash of its content.
+    """
+    if feed_format not in feeds.FEED_CONTENT_TYPES or (divesite is not None and divesite not in DIVESITE_SOURCE_NAMES):
+        raise Http404('No such feed')
+    site_feed = await feeds.aget_feed(
+        request.build_absolute_uri('/'), request.build_absolute_uri(request.path), divesite, feed_format,
+    )
+    encoding, etag = feeds.choose_encoding(site_feed, request)
+    response = conditional.not_modified(request, etag, site_feed.last_modified)
+    if response is None:
+        response = HttpResponse(site_feed.bodies[encoding], content_type=feeds.FEED_CONTENT_TYPES[feed_format])
+        conditional.set_validators(response, etag, site_feed.last_modified)
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+    response['Cache-Control'] = feeds.FEED_CACHE_CONTROL
+    if len(site_feed.bodies) > 1:
+        response['Vary'] = 'Accept-Encoding'
+    return response
+
 
+@read_from_replicas
+def search_newsposts(request):
+    """ View listing the newsposts that best match the `q` query, with the matching words highlighted
+    """
+    query = request.GET.get('q', '').strip()
+    template = loader.get_template('wavepool/search.html')
+    context = {
+        'query': query,
+        'results': search.search(query, published_at=layout.published_at()) if query else [],
+    }
     return HttpResponse(template.render(context, request))
 
 
-def instructions(request):
+@staff_member_required
+def page_cache_stats(request):
+    """ Hit, miss and eviction counters of the page cache in this process
+    """
+    return JsonResponse(cache.get_page_cache().stats())
+
+
+@staff_member_required
+def request_metrics(request):
+    """ Request metrics of this process by view, in Prometheus' text format
+    """
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def instructions(request):
     template = loader.get_template('wavepool/instructions.html')
 
     context = {